@@ -0,0 +1,6 @@
+from crawlmi.spider import BaseSpider
+
+
+class Spider3(BaseSpider):
+    name = 'spider3'
+    allowed_domains = ['spider3.com']
@@ -0,0 +1,5 @@
+from crawlmi.spider import BaseSpider
+
+
+class Spider0(BaseSpider):
+    allowed_domains = ['crawlmi1.org', 'crawlmi3.org']
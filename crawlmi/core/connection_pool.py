@@ -0,0 +1,74 @@
+from twisted.internet import reactor
+
+
+class ConnectionPool(object):
+    '''Pool of the idle persistent (keep-alive) HTTP connections.
+
+    Connections are stored under the key, which identifies the remote end of
+    the connection, e.g. (scheme, host, port, proxy). At most
+    `max_idle_per_key` idle connections are kept for each key. Idle connections
+    are closed after `idle_timeout` seconds.
+    '''
+
+    def __init__(self, max_idle_per_key=2, idle_timeout=60, clock=None):
+        self.max_idle_per_key = max_idle_per_key
+        self.idle_timeout = idle_timeout
+        # clock is used in unittests
+        self.clock = clock or reactor
+        self._idle = {}  # key -> list of (protocol, timeout call)
+
+    def get_connection(self, key):
+        '''Return the idle connection for the given key and remove it from the
+        pool. Return None, if there is no idle connection available.
+        '''
+        connections = self._idle.get(key)
+        if not connections:
+            return None
+        # the most recently used connection is the least likely to be closed
+        # by the server
+        protocol, timeout_call = connections.pop()
+        timeout_call.cancel()
+        if not connections:
+            del self._idle[key]
+        return protocol
+
+    def put_connection(self, key, protocol):
+        '''Put the connection, which finished its response, into the pool.'''
+        connections = self._idle.setdefault(key, [])
+        if len(connections) >= self.max_idle_per_key:
+            if not connections:
+                del self._idle[key]
+            protocol.transport.loseConnection()
+            return
+        timeout_call = self.clock.callLater(self.idle_timeout, self._expire,
+                                            key, protocol)
+        connections.append((protocol, timeout_call))
+
+    def remove_connection(self, key, protocol):
+        '''Remove the connection from the pool, e.g. when it was closed by
+        the server.
+        '''
+        connections = self._idle.get(key, [])
+        for i, (p, timeout_call) in enumerate(connections):
+            if p is protocol:
+                if timeout_call.active():
+                    timeout_call.cancel()
+                del connections[i]
+                break
+        if key in self._idle and not connections:
+            del self._idle[key]
+
+    def close(self):
+        '''Close all the idle connections.'''
+        idle, self._idle = self._idle, {}
+        for connections in idle.itervalues():
+            for protocol, timeout_call in connections:
+                timeout_call.cancel()
+                protocol.transport.loseConnection()
+
+    def __len__(self):
+        return sum(len(x) for x in self._idle.itervalues())
+
+    def _expire(self, key, protocol):
+        self.remove_connection(key, protocol)
+        protocol.transport.loseConnection()
@@ -1,17 +1,23 @@
 from functools import partial
+from itertools import count
 import random
 
 from twisted.internet import reactor, defer
 from twisted.python.failure import Failure
 
 from crawlmi.core.handlers import GeneralHandler
-from crawlmi.queue import MemoryQueue
+from crawlmi.queue import Heap, MemoryQueue
 from crawlmi.utils.defer import LoopingCall, ScheduledCall
 
 
 class Slot(object):
     '''Slot represents a queue of requests for one particular domain.
     It respects both DOWNLOAD_DELAY and CONCURRENT_REQUESTS_PER_DOMAIN.
+
+    Slot doesn't start the downloads by itself. Downloader asks the slot when
+    the next request can be downloaded (`get_ready_time()`) and starts the
+    download (`download_next()`), when both the slot and the global
+    concurrency allow it.
     '''
 
     def __init__(self, download_handler, concurrency, delay, randomize_delay,
@@ -23,14 +29,16 @@ class Slot(object):
         self.in_progress = set()  # request waiting to be downloaded
         self.transferring = set()  # requests being downloaded (subset of `in_progress`)
         self.last_download_time = 0
+        self.next_download_time = 0  # respects the download delay
         self.queue = MemoryQueue()  # queue of (request, deferred)
         # clock is used in unittests
         self.clock = clock or reactor
-        self.delayed_processing = ScheduledCall(self._process, clock=self.clock)
+        # time, for which the slot is scheduled in the downloader
+        self.scheduled_time = None
 
     def enqueue(self, request, dfd):
-        '''Main entry point.
-        Put the new request to the queue and if possible, start downloading it.
+        '''Put the new request to the queue. The request is downloaded, when
+        `download_next()` is called.
         '''
         def remove_in_progress(response):
             self.in_progress.remove(request)
@@ -38,7 +46,6 @@ class Slot(object):
         self.in_progress.add(request)
         dfd.addBoth(remove_in_progress)
         self.queue.push((request, dfd))
-        self._process()
 
     @property
     def free_slots(self):
@@ -47,31 +54,24 @@ class Slot(object):
     def is_idle(self):
         return len(self.in_progress) == 0
 
-    def _process(self):
-        '''Process the requests in the queue, while respecting the delay and
-        concurrency.
+    def get_ready_time(self):
+        '''Return the time, when the next request from the queue can start
+        downloading. Return None, if there is nothing to download, or the slot
+        is full.
         '''
-        if self.delayed_processing.is_scheduled() or self._schedule_delay():
-            return
-
-        while self.queue and self.free_slots > 0:
-            self.last_download_time = self.clock.seconds()
-            request, downloaded_dfd = self.queue.pop()
-            dfd = self._download(request)
-            dfd.chainDeferred(downloaded_dfd)
-            if self._schedule_delay():
-                return
+        if not self.queue or self.free_slots <= 0:
+            return None
+        return self.next_download_time
 
-    def _schedule_delay(self):
+    def download_next(self):
+        '''Start downloading the first request in the queue.'''
+        self.last_download_time = self.clock.seconds()
         if self.delay:
-            penalty = (self.last_download_time + self.get_download_delay() -
-                       self.clock.seconds())
-            if penalty > 0:
-                # following schedule should always be successfull, because
-                # `_schedule_delay()` is only called from within `_process()`
-                self.delayed_processing.schedule(penalty)
-                return True
-        return False
+            self.next_download_time = (self.last_download_time +
+                                       self.get_download_delay())
+        request, downloaded_dfd = self.queue.pop()
+        dfd = self._download(request)
+        dfd.chainDeferred(downloaded_dfd)
 
     def _download(self, request):
         dfd = defer.succeed(request)
@@ -89,7 +89,6 @@ class Slot(object):
         # after the response is downloaded, remove it from `transferring`
         def remove_transferring(response):
             self.transferring.remove(request)
-            self._process()  # process unblocked requests
             return response
         self.transferring.add(request)
         dfd.addBoth(remove_transferring)
@@ -106,9 +105,20 @@ class Downloader(object):
     put the results into `response_queue` queue. Respect CONCURRENT_REQUESTS
     setting.
     Requests are further divided into specific slots, based on their domains.
+    Slots, which can start a download, are kept in the heap ordered by the
+    time they are ready. Global concurrency is only spent on the slots, that
+    can start downloading right now, so that one big domain, limited by
+    CONCURRENT_REQUESTS_PER_DOMAIN or DOWNLOAD_DELAY, can't block the others.
+
+    Requests are taken from `request_queue` only when the global concurrency
+    can't be spent on the requests already waiting in the slots. At most
+    DOWNLOADER_QUEUE_SIZE requests wait in the slots of busy or delayed
+    domains.
     '''
 
-    # how many seconds to wait between the checks of request_queue
+    # how many seconds to wait between the checks of request_queue. Downloader
+    # is woken up by the pushes to request_queue and by the finished downloads,
+    # so this is only a fallback
     QUEUE_CHECK_FREQUENCY = 0.1
 
     def __init__(self, settings, request_queue, response_queue,
@@ -117,10 +127,18 @@ class Downloader(object):
         self.response_queue = response_queue  # queue of responses
         self.download_handler = download_handler or GeneralHandler(settings)
         self.slots = {}
-        self.num_in_progress = 0
+        # heap of (-ready_time, -order, key) of the slots, which can download.
+        # Slots ready at the same time are processed in FIFO order
+        self.ready_slots = Heap()
+        self._order = count()
+        self.num_in_progress = 0  # requests waiting in slots or transferring
+        self.num_transferring = 0
         self.clock = clock or reactor
         self.processing = LoopingCall(self.process, clock=self.clock)
         self.processing.schedule(self.QUEUE_CHECK_FREQUENCY, now=True)
+        self.wake_processing = ScheduledCall(self.process, clock=self.clock)
+        self.request_queue.add_push_listener(self.wake_up)
+        self._enqueue_listeners = []
         self.running = True
 
         self.download_delay = settings.get_float('DOWNLOAD_DELAY')
@@ -141,41 +159,112 @@ class Downloader(object):
             else:
                 self.use_domain_specific = True
 
+        # max number of requests waiting in the slots. With only one slot,
+        # there is no point in waiting with more than the next request
+        if self.use_domain_specific:
+            self.queue_size = max(1, settings.get_int('DOWNLOADER_QUEUE_SIZE'))
+        else:
+            self.queue_size = 1
+
+    def add_enqueue_listener(self, func):
+        '''Call `func(request)` every time the request is taken from the
+        request queue.
+        '''
+        self._enqueue_listeners.append(func)
+
     def close(self):
         self.processing.cancel()
+        self.wake_processing.cancel()
         self.running = False
+        if hasattr(self.download_handler, 'close'):
+            self.download_handler.close()
+
+    def wake_up(self):
+        '''Process the request queue in the next reactor loop.'''
+        if self.running:
+            # move the call sooner, when waiting for the slot's delay
+            self.wake_processing.reschedule(0)
 
     @property
     def free_slots(self):
-        return self.total_concurrency - self.num_in_progress
+        return self.total_concurrency - self.num_transferring
 
     def is_idle(self):
         return self.num_in_progress == 0
 
     def process(self):
-        while (self.running and not self.response_queue.needs_backout() and
-                self.request_queue and self.free_slots > 0):
-            request = self.request_queue.pop()
-            key, slot = self._get_slot(request)
-
-            def remove_in_progress(response):
-                self.num_in_progress -= 1
-                self._clear_slots()  # clear empty slots
-                return response
-
-            def enqueue_result(request, result):
-                # in a case, result is actually a Failure
-                result.request = request
-                # make sure not to modify response_queue, after stopping the downloader
-                if self.running:
-                    self.response_queue.push(result)
-                # don't return anything from here, in a case an error occured -
-                # we don't want it to be logged
-
-            self.num_in_progress += 1
-            dfd = defer.Deferred().addBoth(remove_in_progress)
-            dfd.addBoth(partial(enqueue_result, request))
-            slot.enqueue(request, dfd)
+        if not self.running or self.response_queue.needs_backout():
+            return
+
+        now = self.clock.seconds()
+        self._download_ready(now)
+        # move the requests into the slots only while there is unused
+        # concurrency, so that the requests don't pile up behind busy domains
+        while (self.free_slots > 0 and self.request_queue and
+                self.num_in_progress - self.num_transferring < self.queue_size):
+            self._enqueue(self.request_queue.pop())
+            self._download_ready(now)
+
+    def _download_ready(self, now):
+        '''Start downloading from the slots ready at `now`.'''
+        while self.ready_slots and self.free_slots > 0:
+            ready_time, _, key = self.ready_slots.peek()
+            ready_time = -ready_time
+            slot = self.slots.get(key)
+            # slot was rescheduled or deleted in the meantime
+            if slot is None or slot.scheduled_time != ready_time:
+                self.ready_slots.pop()
+                continue
+            if ready_time > now:
+                self.wake_processing.reschedule(ready_time - now)
+                break
+            self.ready_slots.pop()
+            slot.scheduled_time = None
+            self._download(slot)
+            self._schedule_slot(key, slot)
+
+    def _enqueue(self, request):
+        for func in self._enqueue_listeners:
+            func(request)
+        key, slot = self._get_slot(request)
+
+        def remove_in_progress(response):
+            self.num_in_progress -= 1
+            self.num_transferring -= 1
+            self._schedule_slot(key, slot)
+            self._clear_slots()  # clear empty slots
+            self.wake_up()  # free slot is available
+            return response
+
+        def enqueue_result(request, result):
+            # in a case, result is actually a Failure
+            result.request = request
+            # make sure not to modify response_queue, after stopping the downloader
+            if self.running:
+                self.response_queue.push(result)
+            # don't return anything from here, in a case an error occured -
+            # we don't want it to be logged
+
+        self.num_in_progress += 1
+        dfd = defer.Deferred().addBoth(remove_in_progress)
+        dfd.addBoth(partial(enqueue_result, request))
+        slot.enqueue(request, dfd)
+        self._schedule_slot(key, slot)
+
+    def _download(self, slot):
+        self.num_transferring += 1
+        slot.download_next()
+
+    def _schedule_slot(self, key, slot):
+        '''Put the slot into the heap of ready slots, if it is not already
+        there with the same or sooner time.
+        '''
+        ready_time = slot.get_ready_time()
+        if ready_time is None:
+            return
+        if slot.scheduled_time is None or ready_time < slot.scheduled_time:
+            slot.scheduled_time = ready_time
+            self.ready_slots.push((-ready_time, -next(self._order), key))
 
     def _get_slot(self, request):
         key = request.parsed_url.hostname if self.use_domain_specific else ''
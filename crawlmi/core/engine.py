@@ -1,3 +1,4 @@
+import cPickle as pickle
 from time import time
 
 from twisted.internet import reactor
@@ -10,10 +11,13 @@ from crawlmi.http import Request, Response
 from crawlmi.exceptions import DontStopEngine, StopEngine
 from crawlmi.middleware.extension_manager import ExtensionManager
 from crawlmi.middleware.pipeline_manager import PipelineManager
-from crawlmi.queue import PriorityQueue, MemoryQueue, ResponseQueue
+from crawlmi.queue import DiskQueue, PriorityQueue, MemoryQueue, ResponseQueue
 from crawlmi.spider.spider_manager import SpiderManager
 from crawlmi.utils.defer import ScheduledCall, defer_fail, defer_succeed, defer_result
+from crawlmi.utils.encoding import EncodingResolver, set_encoding_resolver
 from crawlmi.utils.misc import arg_to_iter, load_object
+from crawlmi.utils.request import request_from_dict, request_to_dict
+from crawlmi.utils.trackref import set_tracking
 
 
 class Engine(object):
@@ -22,7 +26,8 @@ class Engine(object):
     instead.
     '''
 
-    # how many seconds to wait between the checks of response_queue
+    # how many seconds to wait between the checks of response_queue. Engine is
+    # woken up by the pushes to response_queue, so this is only a fallback
     QUEUE_CHECK_FREQUENCY = 0.1
     # how often to check is still paused
     PAUSED_CHECK_FREQUENCY = 5
@@ -45,6 +50,8 @@ class Engine(object):
 
         self.spider = None
         self.pending_requests = 0
+        # number of responses being processed by pipeline and spider
+        self.responses_in_progress = 0
         self.running = False
         self.paused = False
         # clock is used in unittests
@@ -72,16 +79,29 @@ class Engine(object):
         # initialize signals
         self.signals = SignalManager(self)
 
+        set_tracking(self.settings.get_bool('TRACK_REFS'))
+        set_encoding_resolver(EncodingResolver(
+            auto_detect=self.settings.get_bool('ENCODING_AUTO_DETECT'),
+            sample_size=self.settings.get_int('ENCODING_DETECT_SAMPLE_SIZE'),
+            host_cache_size=self.settings.get_int('ENCODING_HOST_CACHE_SIZE')))
+
         #initialize stats
         stats_cls = load_object(self.settings.get('STATS_CLASS'))
         self.stats = stats_cls(self)
 
+        self.concurrent_responses = max(
+            1, self.settings.get_int('CONCURRENT_RESPONSES'))
+
         # initialize downloader
-        self.request_queue = PriorityQueue(lambda _: MemoryQueue())
+        self.request_queue = PriorityQueue(self._get_request_qfactory())
         self.response_queue = ResponseQueue(
-            self.settings.get_int('RESPONSE_ACTIVE_SIZE_LIMIT'))
+            self.settings.get_int('RESPONSE_ACTIVE_SIZE_LIMIT'),
+            self.settings.get_int('RESPONSE_ACTIVE_DISK_SIZE_LIMIT'),
+            self.settings.get_int('RESPONSE_ACTIVE_DISK_COUNT_LIMIT'))
+        self.response_queue.add_push_listener(self._wake_up)
         self.downloader = Downloader(self.settings, self.request_queue,
                                      self.response_queue, clock=self.clock)
+        self.downloader.add_enqueue_listener(self._request_scheduled)
 
         # initialize extensions
         self.extensions = ExtensionManager(self)
@@ -93,6 +113,24 @@ class Engine(object):
         # now that everything is ready, set the spider's engine
         self.spider.set_engine(self)
 
+    def _get_request_qfactory(self):
+        if not self.settings.get_bool('REQUEST_QUEUE_DISK_ENABLED'):
+            return lambda _: MemoryQueue()
+
+        directory = self.project.data_path(
+            self.settings['REQUEST_QUEUE_DISK_DIR'], create_dir=True)
+        buffer_size = self.settings.get_int('REQUEST_QUEUE_DISK_BUFFER_SIZE')
+
+        def serialize(request):
+            return pickle.dumps(request_to_dict(request, self.spider),
+                                protocol=2)
+
+        def deserialize(data):
+            return request_from_dict(pickle.loads(data), self.spider)
+
+        return lambda _: DiskQueue(directory, buffer_size, serialize,
+                                   deserialize)
+
     def crawl_start_requests(self):
         # process start requests from spider
         try:
@@ -132,6 +170,12 @@ class Engine(object):
 
     def unpause(self):
         self.paused = False
+        self._wake_up()
+
+    def _wake_up(self):
+        '''Process the response queue as soon as possible.'''
+        if self.running and not self.paused:
+            self.processing.reschedule(0)
 
     def download(self, request):
         '''"Download" the given request. First pass it through the downloader
@@ -144,8 +188,13 @@ class Engine(object):
                 self.signals.send(signal=signals.request_received,
                                   request=request_or_response)
                 if self.running:
-                    self.request_queue.push(request_or_response.priority,
-                                            request_or_response)
+                    try:
+                        self.request_queue.push(request_or_response.priority,
+                                                request_or_response)
+                    except Exception:
+                        log.err(None, 'Error when queueing %s' %
+                                request_or_response)
+                        self._finalize_download(None)
             elif isinstance(request_or_response, Response):
                 request_or_response.request = request
                 if self.running:
@@ -164,6 +213,9 @@ class Engine(object):
         d.addCallbacks(_success, _failure)
         return d
 
+    def _request_scheduled(self, request):
+        self.signals.send(signal=signals.request_scheduled, request=request)
+
     def is_idle(self):
         return self.pending_requests == 0 and len(self.response_queue) == 0
 
@@ -173,15 +225,11 @@ class Engine(object):
         elif self.paused:
             self.processing.schedule(self.PAUSED_CHECK_FREQUENCY)
         elif self.response_queue:
-            response = self.response_queue.pop()
-            if isinstance(response, Response):
-                self.signals.send(signal=signals.response_downloaded,
-                                  response=response)
-            dfd = defer_result(response, clock=self.clock)
-            dfd.addBoth(self.pipeline.process_response)
-            dfd.addBoth(self._handle_pipeline_result)
-            dfd.addBoth(self._finalize_download)
-            dfd.addBoth(lambda _: self.processing.schedule(0))
+            # when the limit is reached, processing is woken up by the
+            # finished response
+            while (self.response_queue and
+                    self.responses_in_progress < self.concurrent_responses):
+                self._process_response(self.response_queue.pop())
         elif self.is_idle():
             # send `spider_idle` signal
             res = self.signals.send(signal=signals.spider_idle,
@@ -200,8 +248,32 @@ class Engine(object):
         else:
             self.processing.schedule(self.QUEUE_CHECK_FREQUENCY)
 
+    def _process_response(self, response):
+        def _finalize_response(_):
+            self.responses_in_progress -= 1
+            self.stats.set_value('engine/responses_in_progress',
+                                 self.responses_in_progress)
+            self.processing.reschedule(0)
+
+        self.responses_in_progress += 1
+        self.stats.set_value('engine/responses_in_progress',
+                             self.responses_in_progress)
+        self.stats.max_value('engine/max_responses_in_progress',
+                             self.responses_in_progress)
+        if isinstance(response, Response):
+            self.signals.send(signal=signals.response_downloaded,
+                              response=response)
+        dfd = defer_result(response, clock=self.clock)
+        dfd.addBoth(self.pipeline.process_response)
+        dfd.addBoth(self._handle_pipeline_result)
+        dfd.addBoth(self._finalize_download)
+        dfd.addBoth(_finalize_response)
+
     def _finalize_download(self, _):
         self.pending_requests -= 1
+        # check for idleness immediately
+        if self.pending_requests == 0:
+            self._wake_up()
 
     def _handle_pipeline_result(self, result):
         if result is None:
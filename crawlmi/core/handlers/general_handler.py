@@ -21,6 +21,11 @@ class GeneralHandler(object):
     def download_request(self, request):
         return self._get_handler(request).download_request(request)
 
+    def close(self):
+        for handler in self._handlers.itervalues():
+            if hasattr(handler, 'close'):
+                handler.close()
+
     def _get_handler(self, request):
         try:
             handler = self._handlers[request.parsed_url.scheme]
@@ -1,22 +1,66 @@
 '''Download handler for http scheme.'''
 
 from twisted.internet import reactor
+from twisted.internet.error import ConnectionDone, ConnectionLost
 
+from crawlmi.core.connection_pool import ConnectionPool
 from crawlmi.core.webclient import CrawlmiHTPPClientFactory
+from crawlmi.middleware.pipelines.filter import get_filter_reason
 
 
 class HttpDownloadHandler(object):
 
     def __init__(self, settings):
         self.settings = settings
+        if settings.get_bool('CONNECTION_POOL_ENABLED'):
+            self.pool = ConnectionPool(
+                settings.get_int('CONNECTION_POOL_MAX_IDLE_PER_HOST'),
+                settings.get_float('CONNECTION_POOL_IDLE_TIMEOUT'))
+        else:
+            self.pool = None
+        if settings.get_bool('FILTER_ON_HEADERS'):
+            self.response_filter = lambda r: get_filter_reason(settings, r)
+        else:
+            self.response_filter = None
 
     def download_request(self, request):
         '''Return a deferred for the HTTP download.'''
+        return self._download(request)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+
+    def _download(self, request, *connect_args):
         factory = CrawlmiHTPPClientFactory(
             request,
             self.settings.get_float('DOWNLOAD_TIMEOUT', 180, request),
-            self.settings.get_int('DOWNLOAD_SIZE_LIMIT', 0, request))
-        host, port = factory.host, factory.port
+            self.settings.get_int('DOWNLOAD_SIZE_LIMIT', 0, request),
+            pool=self.pool,
+            disk_threshold=self.settings.get_int(
+                'DOWNLOAD_BODY_DISK_THRESHOLD', 0, request),
+            disk_dir=self.settings.get('DOWNLOAD_BODY_DISK_DIR'),
+            decompress=self.settings.get_bool('DOWNLOAD_DECOMPRESS'),
+            response_filter=self.response_filter)
+        protocol = (self.pool.get_connection(factory.pool_key)
+                    if self.pool is not None else None)
+        if protocol is None:
+            self._connect(factory, request, *connect_args)
+            return factory.deferred
+
+        # the idle connection could have been closed by the server right before
+        # sending the request. In such case, try again - but only the requests,
+        # which are safe to repeat.
+        def _retry(failure):
+            if (factory.response_headers is None and
+                    request.method in ('GET', 'HEAD') and
+                    failure.check(ConnectionDone, ConnectionLost)):
+                return self._download(request, *connect_args)
+            return failure
+        factory.reuse_connection(protocol)
+        return factory.deferred.addErrback(_retry)
+
+    def _connect(self, factory, request):
         bind_address = request.meta.get('bind_address')
-        reactor.connectTCP(host, port, factory, bindAddress=bind_address)
-        return factory.deferred
+        reactor.connectTCP(factory.host, factory.port, factory,
+                           bindAddress=bind_address)
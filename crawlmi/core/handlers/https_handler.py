@@ -3,14 +3,14 @@
 from OpenSSL import SSL
 from twisted.internet import reactor
 
-from crawlmi.core.webclient import CrawlmiHTPPClientFactory
 from crawlmi.core.context_factory import  CrawlmiClientContextFactory
+from crawlmi.core.handlers.http_handler import HttpDownloadHandler
 
 
-class HttpsDownloadHandler(object):
+class HttpsDownloadHandler(HttpDownloadHandler):
 
     def __init__(self, settings):
-        self.settings = settings
+        super(HttpsDownloadHandler, self).__init__(settings)
         self.ssl_methods = settings.get('DOWNLOAD_HANDLER_SSL_METHODS')
 
     def download_request(self, request):
@@ -26,14 +26,9 @@ class HttpsDownloadHandler(object):
                 dfd.addErrback(_failure)
         return dfd
 
-    def _download(self, request, method):
-        factory = CrawlmiHTPPClientFactory(
-            request,
-            self.settings.get_float('DOWNLOAD_TIMEOUT', 180, request),
-            self.settings.get_int('DOWNLOAD_SIZE_LIMIT', 0, request))
+    def _connect(self, factory, request, method):
         host, port = factory.host, factory.port
         bind_address = request.meta.get('bind_address')
         reactor.connectSSL(host, port, factory,
                            CrawlmiClientContextFactory(method, host, port),
                            bindAddress=bind_address)
-        return factory.deferred
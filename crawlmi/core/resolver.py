@@ -0,0 +1,137 @@
+from collections import OrderedDict
+
+from twisted.internet import defer, reactor
+from twisted.internet.error import DNSLookupError
+from twisted.internet.interfaces import IResolverSimple
+from twisted.python.failure import Failure
+from zope.interface import implements
+
+
+class CachingResolver(object):
+    '''Hostname resolver, which caches the results of the wrapped `resolver`.
+
+    Successful lookups are cached for the TTL of the DNS records. If the
+    wrapped resolver doesn't provide the records (e.g. system resolver), `ttl`
+    seconds are used instead. Failed lookups are cached for `negative_ttl`
+    seconds. At most `size` hostnames are cached, the least recently used ones
+    are dropped first.
+
+    Concurrent lookups of the same hostname are merged into one. At most
+    `prefetch_concurrency` prefetches run at once, the others are skipped.
+    '''
+
+    implements(IResolverSimple)
+
+    def __init__(self, resolver, size=10000, ttl=300, negative_ttl=60,
+                 prefetch_concurrency=2, stats=None, clock=None):
+        self.resolver = resolver
+        self.size = max(1, size)
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.prefetch_concurrency = prefetch_concurrency
+        self.num_prefetching = 0
+        self.stats = stats
+        # clock is used in unittests
+        self.clock = clock or reactor
+        self.cache = OrderedDict()  # name -> (expiration time, address or failure)
+        self.pending = {}  # name -> list of deferreds waiting for the lookup
+
+    def getHostByName(self, name, timeout=(1, 3, 11, 45)):
+        result = self._get_cached(name)
+        if result is not None:
+            self._inc_stats('dns/hit')
+            if isinstance(result, Failure):
+                return defer.fail(Failure(result.value))
+            return defer.succeed(result)
+        self._inc_stats('dns/miss')
+        return self._lookup(name, timeout)
+
+    def prefetch(self, name):
+        '''Resolve the hostname in the background, so that it is already
+        cached, when needed.
+        '''
+        if name in self.pending or self._get_cached(name) is not None:
+            return
+        # don't hold up the real lookups
+        if self.num_prefetching >= self.prefetch_concurrency:
+            self._inc_stats('dns/prefetch_skipped')
+            return
+        self._inc_stats('dns/prefetch')
+        self.num_prefetching += 1
+        self._lookup(name).addBoth(self._prefetch_finished)
+
+    def _prefetch_finished(self, _):
+        self.num_prefetching -= 1
+
+    def _get_cached(self, name):
+        entry = self.cache.pop(name, None)
+        if entry is None:
+            return None
+        expiration, result = entry
+        if expiration <= self.clock.seconds():
+            return None
+        # move to the end - most recently used
+        self.cache[name] = entry
+        return result
+
+    def _lookup(self, name, timeout=(1, 3, 11, 45)):
+        dfd = defer.Deferred()
+        if name in self.pending:
+            self.pending[name].append(dfd)
+            return dfd
+        self.pending[name] = [dfd]
+        start = self.clock.seconds()
+        if hasattr(self.resolver, 'lookupAddress'):
+            lookup = self.resolver.lookupAddress(name, timeout)
+            lookup.addCallbacks(self._get_address_and_ttl, self._lookup_error,
+                                callbackArgs=(name,), errbackArgs=(name,))
+        else:
+            lookup = self.resolver.getHostByName(name, timeout)
+            lookup.addCallback(lambda address: (address, self.ttl))
+        lookup.addBoth(self._lookup_finished, name, start)
+        return dfd
+
+    def _get_address_and_ttl(self, result, name):
+        # imported here, because twisted.names is needed only by this branch
+        from twisted.names import dns
+        answers = result[0]
+        addresses = [a.payload.dottedQuad() for a in answers if a.type == dns.A]
+        if not addresses:
+            raise DNSLookupError(name)
+        # records of the whole CNAME chain have to be valid
+        return (addresses[0], min(a.ttl for a in answers))
+
+    def _lookup_error(self, failure, name):
+        from twisted.names import error
+        # server failures are temporary, but the non-existent domains are
+        # reported as DNSLookupError, like by the system resolver
+        if (not failure.check(error.DNSServerError) and
+                failure.check(error.DomainError, error.AuthoritativeDomainError)):
+            raise DNSLookupError(name)
+        return failure
+
+    def _lookup_finished(self, result, name, start):
+        now = self.clock.seconds()
+        if self.stats is not None:
+            self.stats.add_value('dns/latency', now - start)
+
+        if isinstance(result, Failure):
+            # timeouts and other errors are temporary - don't cache them
+            ttl = self.negative_ttl if result.check(DNSLookupError) else 0
+        else:
+            result, ttl = result
+        if ttl > 0:
+            self.cache.pop(name, None)
+            self.cache[name] = (now + ttl, result)
+            while len(self.cache) > self.size:
+                self.cache.popitem(last=False)
+
+        for dfd in self.pending.pop(name):
+            if isinstance(result, Failure):
+                dfd.errback(Failure(result.value))
+            else:
+                dfd.callback(result)
+
+    def _inc_stats(self, key):
+        if self.stats is not None:
+            self.stats.inc_value(key)
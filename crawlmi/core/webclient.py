@@ -1,13 +1,18 @@
+import mmap
+import tempfile
 from time import time
 from urlparse import urlparse, urlunparse, urldefrag
 
 from twisted.web.client import HTTPClientFactory
-from twisted.web.http import HTTPClient
-from twisted.internet import defer
+from twisted.web.http import HTTPClient, NO_BODY_CODES
+from twisted.internet import defer, reactor
+from twisted.python.failure import Failure
 
 from crawlmi.exceptions import DownloadSizeError
 from crawlmi.http import Headers
 from crawlmi.http.response import factory as resp_factory
+from crawlmi.utils.chunked import ChunkedDecoder
+from crawlmi.utils.gz import StreamDecompressor, is_gzipped_headers
 
 
 def _parse_url_args(url):
@@ -23,6 +28,44 @@ def _parse_url_args(url):
     return scheme, netloc, host, port, path
 
 
+class BodyBuffer(object):
+    '''Buffer collecting the parts of the response body.
+
+    When the body exceeds `disk_threshold` bytes, it is moved to a temporary
+    file in `disk_dir` and all the following parts are written there. Such
+    body is returned as a read-only memory-mapped file, so it doesn't take up
+    the memory of the process.
+    '''
+
+    def __init__(self, disk_threshold=0, disk_dir=None):
+        self.disk_threshold = disk_threshold
+        self.disk_dir = disk_dir
+        self.size = 0
+        self._parts = []
+        self._file = None
+
+    def write(self, data):
+        self.size += len(data)
+        if self._file is not None:
+            self._file.write(data)
+            return
+        self._parts.append(data)
+        if self.disk_threshold and self.size > self.disk_threshold:
+            self._file = tempfile.TemporaryFile(dir=self.disk_dir)
+            self._file.write(''.join(self._parts))
+            self._parts = None
+
+    def getvalue(self):
+        if self._file is None:
+            return ''.join(self._parts)
+        # temporary file is deleted as soon as the mapping is released
+        self._file.flush()
+        body = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._file.close()
+        self._file = None
+        return body
+
+
 class BadHttpHeaderError(Exception):
     '''Raised when bad http header have beed received.'''
 
@@ -33,8 +76,17 @@ class CrawlmiHTTPClient(HTTPClient):
 
     def __init__(self):
         self.body_size = 0
+        self._body = None
+        self._decompressor = None
+        self._chunked = None
+        # True, if some data were received after the end of the response
+        self._unexpected_data = False
 
     def connectionMade(self):
+        self.send_request()
+
+    def send_request(self):
+        '''Send the request of the current factory.'''
         self.headers = Headers()
 
         # method command
@@ -64,29 +116,137 @@ class CrawlmiHTTPClient(HTTPClient):
                 self.transport.abortConnection()
             else:
                 self.transport.loseConnection()
+            return
+        # response without the body is finished right after the headers
+        if not self.line_mode and self.length == 0:
+            self.handleResponseEnd()
+
+    def rawDataReceived(self, data):
+        if self._chunked is not None:
+            self._chunked_data_received(data)
+            return
+        if self.length is not None:
+            data, rest = data[:self.length], data[self.length:]
+            self.length -= len(data)
+        else:
+            rest = ''
+        self.handleResponsePart(data)
+        if self.length == 0:
+            self._unexpected_data = bool(rest)
+            self.handleResponseEnd()
+
+    def _chunked_data_received(self, data):
+        try:
+            data = self._chunked.decode(data)
+        except ValueError:
+            self._abort(Failure())
+            return
+        self.handleResponsePart(data)
+        if self._chunked.finished:
+            self.length = 0
+            self._unexpected_data = bool(self._chunked.rest)
+            self.handleResponseEnd()
 
     def handleHeader(self, key, value):
-        self.headers.add(key, value)
+        self.headers.add_raw(key, value)
 
     def handleStatus(self, version, status, message):
         self.factory.gotStatus(version, status, message)
 
     def handleEndHeaders(self):
         self.factory.gotHeaders(self.headers)
+        self._body = BodyBuffer(self.factory.disk_threshold,
+                                self.factory.disk_dir)
+        if (self.factory.method.upper() == 'HEAD' or
+                self.factory.status in NO_BODY_CODES):
+            self.length = 0
+            return
+        if self.factory.filtered:
+            # the body is not needed
+            self.length = 0
+            return
+        if (self.factory.download_size and self.length is not None and
+                self.length > self.factory.download_size):
+            self._abort(DownloadSizeError('Response exceeded %s bytes.' %
+                                          self.factory.download_size))
+            return
+        if (self.headers.get('Transfer-Encoding') or '').lower() == 'chunked':
+            # the end of the body is determined by the last chunk
+            self._chunked = ChunkedDecoder()
+            self.length = None
+            # the response is passed on already decoded
+            del self.headers['Transfer-Encoding']
+        if self.factory.decompress:
+            self._set_decompressor()
+
+    def _set_decompressor(self):
+        '''Decompress the body while it is received, if it is encoded by
+        a single supported encoding.
+        '''
+        encodings = self.headers.getlist('Content-Encoding')
+        if len(encodings) != 1 or is_gzipped_headers(self.headers):
+            return
+        encoding = encodings[0].lower()
+        if encoding not in ('gzip', 'x-gzip', 'deflate'):
+            return
+        self._decompressor = StreamDecompressor(encoding,
+                                                self.factory.download_size)
+        # the response is passed on already decoded
+        del self.headers['Content-Encoding']
 
     def connectionLost(self, reason):
         self._connection_lost_reason = reason
         HTTPClient.connectionLost(self, reason)
         self.factory.noPage(reason)
+        if self.factory.pool is not None:
+            self.factory.pool.remove_connection(self.factory.pool_key, self)
 
     def handleResponse(self, response):
-        if self.factory.method.upper() == 'HEAD':
-            self.factory.page('')
-        elif self.length is not None and self.length > 0:
-            self.factory.noPage(self._connection_lost_reason)
+        factory = self.factory
+        incomplete = ((self.length is not None and self.length > 0) or
+                      (self._chunked is not None and
+                       not self._chunked.last_chunk))
+        # release the connection before firing the deferred, because its
+        # callbacks may want to reuse it
+        reusable = self._is_reusable()
+        if reusable:
+            self._reset()
+            factory.pool.put_connection(factory.pool_key, self)
+
+        if factory.method.upper() == 'HEAD':
+            factory.page('')
+        elif incomplete:
+            factory.noPage(self._connection_lost_reason)
         else:
-            self.factory.page(response)
-        self.transport.loseConnection()
+            factory.page(response)
+        if not reusable:
+            self.transport.loseConnection()
+
+    def _is_reusable(self):
+        '''Return True, if the connection can be used for the next request.
+        It is only possible, if the end of the response was determined from
+        its headers and the server agreed to keep the connection alive. The
+        request is sent as HTTP/1.0, so the server must agree explicitly.
+        '''
+        if (self.factory.pool is None or self.factory.invalid_headers or
+                self.factory.filtered or self.length != 0 or self._unexpected_data or
+                self.transport.disconnecting):
+            return False
+        if (self.factory.headers.get('Connection') or '').lower() != 'keep-alive':
+            return False
+        return (self.headers.get('Connection') or '').lower() == 'keep-alive'
+
+    def _reset(self):
+        '''Prepare the protocol for receiving the next response.'''
+        self.firstLine = True
+        self.length = None
+        self._header = ''
+        self.body_size = 0
+        self._body = None
+        self._decompressor = None
+        self._chunked = None
+        self._unexpected_data = False
+        self.setLineMode()
 
     def timeout(self):
         self.transport.loseConnection()
@@ -99,15 +259,49 @@ class CrawlmiHTTPClient(HTTPClient):
             defer.TimeoutError('Getting %s took longer than %s seconds.' %
                                (self.factory.url, self.factory.timeout)))
 
+    def handleResponseEnd(self):
+        # may be called more than once, e.g. when the connection is lost
+        if self._body is None:
+            return
+        if self._decompressor is not None:
+            self._decompress(self._decompressor.flush)
+            if self._body is None:
+                return
+        body, self._body = self._body.getvalue(), None
+        self.handleResponse(body)
+
     def handleResponsePart(self, data):
-        HTTPClient.handleResponsePart(self, data)
+        # the download was aborted
+        if self._body is None:
+            return
         self.body_size += len(data)
         if (self.factory.download_size and
                 self.body_size > self.factory.download_size):
+            self._abort(DownloadSizeError('Response exceeded %s bytes.' %
+                                          self.factory.download_size))
+            return
+        if self._decompressor is not None:
+            self._decompress(self._decompressor.decompress, data)
+        else:
+            self._body.write(data)
+
+    def _decompress(self, func, *args):
+        try:
+            data = func(*args)
+        except Exception:
+            self._abort(Failure())
+        else:
+            self._body.write(data)
+
+    def _abort(self, reason):
+        '''Stop receiving the response and fail the download.'''
+        self._body = None
+        self._decompressor = None
+        if hasattr(self.transport, 'abortConnection'):
+            self.transport.abortConnection()
+        else:
             self.transport.loseConnection()
-            self.factory.noPage(
-                DownloadSizeError('Response exceeded %s bytes.' %
-                                  self.factory.download_size))
+        self.factory.noPage(reason)
 
 
 class CrawlmiHTPPClientFactory(HTTPClientFactory):
@@ -117,7 +311,10 @@ class CrawlmiHTPPClientFactory(HTTPClientFactory):
     followRedirect = False
     afterFoundGet = False
 
-    def __init__(self, request, timeout=180, download_size=0):
+    def __init__(self, request, timeout=180, download_size=0, pool=None,
+                 disk_threshold=0, disk_dir=None, decompress=False,
+                 response_filter=None):
+        self.request = request
         self.url = urldefrag(request.url)[0]
         self.method = request.method
         self.body = request.body or None
@@ -128,6 +325,20 @@ class CrawlmiHTPPClientFactory(HTTPClientFactory):
         self.invalid_headers = []
         self.timeout = timeout
         self.download_size = download_size
+        # pool of the persistent connections. If None, connection is closed
+        # after the response is received
+        self.pool = pool
+        # bodies bigger than `disk_threshold` bytes are stored in a temporary
+        # file inside `disk_dir`
+        self.disk_threshold = disk_threshold
+        self.disk_dir = disk_dir
+        # if True, gzip and deflate bodies are decompressed while received
+        self.decompress = decompress
+        # function returning not-None value, if the response with the given
+        # status and headers should be filtered out. The body of such response
+        # is not downloaded.
+        self.response_filter = response_filter
+        self.filtered = False
 
         # Fixes Twisted 11.1.0+ support as HTTPClientFactory is expected
         # to have _disconnectedDeferred. See Twisted r32329.
@@ -151,6 +362,13 @@ class CrawlmiHTPPClientFactory(HTTPClientFactory):
         elif self.method == 'POST':
             self.headers['Content-Length'] = 0
 
+        # only the idempotent requests without body are sent through the
+        # persistent connections, so that they can be safely repeated, when
+        # the connection is closed by the server meanwhile
+        if (self.pool is not None and self.body is None and
+                self.method in ('GET', 'HEAD')):
+            self.headers.setdefault('Connection', 'keep-alive')
+
     def _build_response(self, body, request):
         if self.invalid_headers:
             raise BadHttpHeaderError('Invalid headers received: %s' %
@@ -162,19 +380,37 @@ class CrawlmiHTPPClientFactory(HTTPClientFactory):
             url=self.url, status=self.status, headers=self.response_headers,
             body=body, request=request)
         response.download_latency = self.headers_time - self.start_time
+        if self.filtered:
+            response.flags.append('filtered')
         return response
 
     def _set_connection_attributes(self, request):
         self.scheme, self.netloc, self.host, self.port, self.path = \
             _parse_url_args(request.url)
+        # key identifying the connection in the connection pool
+        self.pool_key = (self.scheme, self.host, self.port, request.proxy,
+                         request.meta.get('bind_address'))
         if request.proxy:
             self.scheme, _, self.host, self.port, _ = \
                 _parse_url_args(request.proxy)
             self.path = self.url
 
+    def reuse_connection(self, protocol):
+        '''Send the request through the already opened connection.'''
+        protocol.factory = self
+        if self.timeout:
+            timeout_call = reactor.callLater(self.timeout, protocol.timeout)
+            self.deferred.addBoth(self._cancelTimeout, timeout_call)
+        protocol.send_request()
+
     def gotStatus(self, version, status, message):
         self.version, self.status, self.message = version, int(status), message
 
     def gotHeaders(self, headers):
         self.headers_time = time()
         self.response_headers = headers
+        if self.response_filter is not None and not self.invalid_headers:
+            response_cls = resp_factory.from_args(headers=headers, url=self.url)
+            response = response_cls(url=self.url, status=self.status,
+                                    headers=headers, request=self.request)
+            self.filtered = self.response_filter(response) is not None
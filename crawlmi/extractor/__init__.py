@@ -1,6 +1,7 @@
 from .ignored_extensions import IGNORED_EXTENSIONS
 from .link import Link
 from .base_link_extractor import BaseLinkExtractor
+from .fast_link_extractor import FastLinkExtractor
 
 try:
     import lxml
@@ -1,13 +1,69 @@
-from urlparse import urlparse
+import posixpath
+import re
+from urlparse import urlsplit
 
 from crawlmi.extractor import IGNORED_EXTENSIONS
 from crawlmi.utils.misc import arg_to_iter
 from crawlmi.utils.python import to_str, unique_list, regex
-from crawlmi.utils.url import is_url_from_any_domain, has_url_any_extension
 
 
 _matches = lambda url, regexs: any((r.search(url) for r in regexs))
 
+_allowed_schemes = frozenset(['http', 'https', 'file'])
+
+# patterns, which change their meaning in the combined regex: backreferences
+# and the global inline flags
+_uncombinable_re = re.compile(r'\\[1-9]|\(\?P=|\(\?[iLmsux]+\)')
+
+
+def _combine_regexes(regexs):
+    '''Return the single regex matching, when any of the `regexs` matches or
+    None, if they can't be combined.
+    '''
+    if not regexs:
+        return None
+    if len(regexs) == 1:
+        return regexs[0]
+    flags = regexs[0].flags
+    if any(r.flags != flags or _uncombinable_re.search(r.pattern)
+           for r in regexs):
+        return None
+    # python 2 limits the number of groups to 100
+    if sum(r.groups for r in regexs) >= 100:
+        return None
+    try:
+        return re.compile('|'.join('(?:%s)' % r.pattern for r in regexs),
+                          flags)
+    except (re.error, AssertionError, OverflowError):
+        return None
+
+
+class _DomainTrie(object):
+    '''Trie of the reversed domain labels. Host matches, when it's one of
+    the domains or their subdomain. Lookup doesn't depend on the number of
+    the domains.
+    '''
+
+    def __init__(self, domains):
+        self.root = {}
+        for domain in domains:
+            node = self.root
+            for label in reversed(domain.lower().split('.')):
+                node = node.setdefault(label, {})
+            node[None] = True  # end of the domain
+
+    def match(self, host):
+        if not host:
+            return False
+        node = self.root
+        for label in reversed(host.split('.')):
+            node = node.get(label)
+            if node is None:
+                return False
+            if None in node:
+                return True
+        return False
+
 
 class BaseLinkExtractor(object):
     def __init__(self, allow=None, deny=None,
@@ -24,12 +80,23 @@ class BaseLinkExtractor(object):
         self.deny_extensions = set(['.' + e for e in deny_extensions])
         self.filter_mobile = filter_mobile
 
-        tags = list(arg_to_iter(tags))  # make a local copy
+        self.tags = tags = list(arg_to_iter(tags))  # make a local copy
         self.tag_func = lambda x: x in tags
 
-        attrs = list(arg_to_iter(attrs))
+        self.attrs = attrs = list(arg_to_iter(attrs))
         self.attr_func = lambda x: x in attrs
 
+        self._compile_rules()
+
+    def _compile_rules(self):
+        '''Compile the url filtering rules. Call it after changing them.'''
+        self._allow_re = _combine_regexes(self.allow_res)
+        self._deny_re = _combine_regexes(self.deny_res)
+        self._allow_trie = (_DomainTrie(self.allow_domains)
+                            if self.allow_domains else None)
+        self._deny_trie = (_DomainTrie(self.deny_domains)
+                           if self.deny_domains else None)
+
     def _extract_links(self, response):
         raise NotImplementedError
 
@@ -38,24 +105,39 @@ class BaseLinkExtractor(object):
 
     def url_allowed(self, url):
         url = to_str(url)
-        parsed_url = urlparse(url)
-        allowed = parsed_url.scheme in ['http', 'https', 'file']
+        scheme, netloc, path, _, _ = urlsplit(url)
+        allowed = scheme in _allowed_schemes
         # filter mobile and pda sites
         if allowed and self.filter_mobile:
-            allowed &= not parsed_url.netloc.startswith('m.')
-            allowed &= not parsed_url.netloc.startswith('pda.')
+            allowed &= not netloc.startswith(('m.', 'pda.'))
         if allowed and self.allow_res:
-            allowed &= _matches(url, self.allow_res)
+            if self._allow_re is not None:
+                allowed &= self._allow_re.search(url) is not None
+            else:
+                allowed &= _matches(url, self.allow_res)
         if allowed and self.deny_res:
-            allowed &= not _matches(url, self.deny_res)
-        if allowed and self.allow_domains:
-            allowed &= is_url_from_any_domain(parsed_url, self.allow_domains)
-        if allowed and self.deny_domains:
-            allowed &= not is_url_from_any_domain(parsed_url, self.deny_domains)
+            if self._deny_re is not None:
+                allowed &= self._deny_re.search(url) is None
+            else:
+                allowed &= not _matches(url, self.deny_res)
+        if allowed and self._allow_trie is not None:
+            allowed &= self._allow_trie.match(netloc.lower())
+        if allowed and self._deny_trie is not None:
+            allowed &= not self._deny_trie.match(netloc.lower())
         if allowed and self.deny_extensions:
-            allowed &= not has_url_any_extension(parsed_url, self.deny_extensions)
+            # strip the parameters of the last path segment, as urlparse does
+            if ';' in path and scheme != 'file':
+                i = path.find(';', max(path.rfind('/'), 0))
+                if i != -1:
+                    path = path[:i]
+            allowed &= posixpath.splitext(path)[1].lower() not in self.deny_extensions
         return allowed
 
+    def filter_urls(self, urls):
+        '''Return the list of the allowed `urls`.'''
+        url_allowed = self.url_allowed
+        return [url for url in urls if url_allowed(url)]
+
     def _process_links(self, links, process_links=None):
         # filter bad links
         links = filter(self.link_allowed, links)
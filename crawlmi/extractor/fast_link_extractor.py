@@ -0,0 +1,111 @@
+import re
+from urlparse import urljoin
+
+from crawlmi import log
+from crawlmi.extractor import Link, BaseLinkExtractor
+from crawlmi.http import HtmlResponse
+from crawlmi.utils.encoding import is_ascii_compatible
+from crawlmi.utils.html import remove_entities, parse_tag_attrs
+from crawlmi.utils.python import to_str
+from crawlmi.utils.url import requote_url, correct_relative_path
+
+
+# elements without the content - their links have no text
+_void_tags = frozenset(['area', 'base', 'br', 'col', 'embed', 'hr', 'img',
+                        'input', 'keygen', 'link', 'meta', 'param', 'source',
+                        'track', 'wbr'])
+
+
+class FastLinkExtractor(BaseLinkExtractor):
+    '''Link extractor scanning the raw response body for the start tags of
+    `tags`, without building the document tree. It returns the same links as
+    LxmlLinkExtractor for the usual pages, but it is several times faster.
+
+    Comments and contents of script and style elements are skipped. Link's
+    text is the text between the start tag and the next tag, as in lxml.
+    '''
+
+    def __init__(self, *args, **kwargs):
+        super(FastLinkExtractor, self).__init__(*args, **kwargs)
+        tags = '|'.join(re.escape(t) for t in self.tags)
+        # comment, skipped element or the start tag of a link
+        self._token_re = re.compile(
+            r'''<(?:!--.*?-->|(script|style)\b.*?</\1\s*>|(%s)(?=[\s/>])'''
+            r'''((?:[^>"']|"[^"]*"|'[^']*')*)>)''' % tags,
+            re.DOTALL | re.IGNORECASE)
+
+    def _extract_links(self, response):
+        # only works for html documents
+        if not isinstance(response, HtmlResponse) or not response.body:
+            return []
+
+        encoding = response.encoding
+        body = response.body
+        # tags can be found only in the ascii compatible bytes
+        if not is_ascii_compatible(encoding):
+            body = response.text.encode('utf-8')
+            encoding = 'utf-8'
+        return self._extract_links_from_body(body, encoding, response.base_url)
+
+    def _extract_links_from_body(self, body, encoding, base_url):
+        links = []
+        urls = {}  # the same hrefs are usually repeated on the page
+        for m in self._token_re.finditer(body):
+            tag = m.group(2)
+            if tag is None:
+                continue
+            tag = tag.lower()
+            attr_list = parse_tag_attrs(m.group(3))
+            attrs = dict(attr_list)
+            for attr, value in attr_list:
+                if not self.attr_func(attr):
+                    continue
+                try:
+                    url = urls.get(value)
+                    if url is None:
+                        url = self._decode_attr(value, encoding)
+                        url = urljoin(base_url, url.strip())
+                        url = requote_url(url)
+                        url = urls[value] = correct_relative_path(url)
+                    if tag in _void_tags:
+                        text = u''
+                    else:
+                        end = body.find('<', m.end())
+                        text = body[m.end():end if end != -1 else len(body)]
+                        text = self._decode_text(text, encoding)
+                    rel = attrs.get('rel')
+                    nofollow = (rel is not None and
+                                self._decode_attr(rel, encoding) == 'nofollow')
+                except Exception as e:
+                    log.msg(
+                        format='Error occurred while extracting links from %(url)s. Error (%(etype)s): %(error)s',
+                        level=log.WARNING, url=base_url, etype=type(e),
+                        error=e)
+                else:
+                    links.append(Link(url=url, text=text, nofollow=nofollow))
+        return links
+
+    def _decode_attr(self, value, encoding):
+        '''Return the attribute's value as str in the `encoding`.'''
+        if '&' not in value:
+            return value
+        value = remove_entities(unicode(value, encoding, 'replace'),
+                                remove_illegal=False)
+        try:
+            return to_str(value, encoding)
+        except UnicodeEncodeError:
+            # fallback
+            return to_str(value, 'utf-8')
+
+    def _decode_text(self, text, encoding):
+        text = unicode(text, encoding, 'replace')
+        if '\r' in text:
+            text = text.replace('\r\n', '\n').replace('\r', '\n')
+        if '&' in text:
+            text = remove_entities(text, remove_illegal=False)
+        return text
+
+    def extract_links_from_body(self, body, encoding, base_url,
+                                process_links=None):
+        links = self._extract_links_from_body(body, encoding, base_url)
+        return self._process_links(links, process_links)
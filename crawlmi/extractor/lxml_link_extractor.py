@@ -1,7 +1,8 @@
+from urlparse import urljoin
+
 from crawlmi import log
 from crawlmi.extractor import Link, BaseLinkExtractor
 from crawlmi.http import HtmlResponse
-from crawlmi.utils.lxml_fix import get_html
 from crawlmi.utils.python import to_str, to_unicode
 from crawlmi.utils.url import requote_url, correct_relative_path
 
@@ -12,17 +13,20 @@ class LxmlLinkExtractor(BaseLinkExtractor):
         if not isinstance(response, HtmlResponse) or not response.body:
             return []
 
-        html = get_html(response)
-        html.make_links_absolute(response.url)
-        return self._extract_links_from_html(html, response.encoding)
+        # shared document is not modified - only the selected links are made
+        # absolute
+        return self._extract_links_from_html(response.html, response.encoding,
+                                             response.base_url)
 
-    def _extract_links_from_html(self, html, response_encoding):
+    def _extract_links_from_html(self, html, response_encoding, base_url=None):
         links = []
         for el, attr, attr_val, pos in html.iterlinks():
             if self.tag_func(el.tag):
                 if self.attr_func(attr):
                     try:
                         url = attr_val
+                        if base_url is not None:
+                            url = urljoin(base_url, url.strip())
                         if isinstance(url, unicode):
                             try:
                                 url = to_str(url, response_encoding)
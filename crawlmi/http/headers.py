@@ -1,6 +1,26 @@
 from crawlmi.utils.python import to_str
 
 
+# raw header name -> interned normalized name
+_normkeys = {}
+_normkeys_limit = 1000  # don't let the unusual header names fill the memory
+
+def _add_normkeys(names):
+    for name in names:
+        for key in (name, name.lower(), name.upper()):
+            _normkeys[key] = intern(key.title())
+
+_add_normkeys([
+    'Accept', 'Accept-Charset', 'Accept-Encoding', 'Accept-Language',
+    'Accept-Ranges', 'Age', 'Cache-Control', 'Connection', 'Content-Encoding',
+    'Content-Language', 'Content-Length', 'Content-Location', 'Content-Type',
+    'Cookie', 'Date', 'Etag', 'Expires', 'Host', 'If-Modified-Since',
+    'If-None-Match', 'Keep-Alive', 'Last-Modified', 'Link', 'Location',
+    'Pragma', 'Proxy-Authorization', 'Proxy-Connection', 'Refresh', 'Referer',
+    'Server', 'Set-Cookie', 'Transfer-Encoding', 'User-Agent', 'Vary', 'Via',
+    'X-Powered-By'])
+
+
 class Headers(dict):
 
     def __init__(self, seq=None, encoding='utf-8'):
@@ -9,7 +29,15 @@ class Headers(dict):
             self.update(seq)
 
     def normkey(self, key):
-        return to_str(key.title(), self.encoding)
+        try:
+            return _normkeys[key]
+        except KeyError:
+            pass
+        normalized = to_str(key.title(), self.encoding)
+        # unicode keys depend on the encoding
+        if isinstance(key, str) and len(_normkeys) < _normkeys_limit:
+            normalized = _normkeys[key] = intern(normalized)
+        return normalized
 
     def normvalue(self, value):
         if not hasattr(value, '__iter__'):
@@ -37,46 +65,58 @@ class Headers(dict):
         return dict.setdefault(self, self.normkey(key), self.normvalue(default))
 
     def get(self, key, default=None):
-        key = self.normkey(key)
-        return self[key] if key in self else default
+        value = dict.get(self, self.normkey(key))
+        return default if value is None else value[-1]
 
     def getlist(self, key, default=None):
-        key = self.normkey(key)
-        if key in self:
-            return dict.__getitem__(self, key)
-        else:
-            if default is None:
-                default = []
-            if not hasattr(default, '__iter__'):
-                default = [default]
-            return default
+        value = dict.get(self, self.normkey(key))
+        if value is not None:
+            return value
+        if default is None:
+            default = []
+        if not hasattr(default, '__iter__'):
+            default = [default]
+        return default
 
     def appendlist(self, key, value):
-        lst = self.getlist(key)
-        lst.extend(self.normvalue(value))
-        self[key] = lst
+        key = self.normkey(key)
+        dict.__setitem__(self, key,
+                         dict.get(self, key, []) + self.normvalue(value))
 
     def add(self, key, value):
-        key = self.normkey(key)
-        value = self.normvalue(value)
-        if key not in self:
+        self._add(self.normkey(key), self.normvalue(value))
+
+    def add_raw(self, key, value):
+        '''Add the single str value without normalizing it. Used for the
+        headers received from the network.
+        '''
+        self._add(self.normkey(key), [value])
+
+    def _add(self, key, value):
+        lst = dict.get(self, key)
+        if lst is None:
             dict.__setitem__(self, key, value)
         else:
-            dict.__getitem__(self, key).extend(value)
+            lst.extend(value)
 
     def update(self, seq):
+        if isinstance(seq, Headers):
+            # keys and values are already normalized
+            for k, v in dict.iteritems(seq):
+                self._add(k, list(v))
+            return
         seq = seq.iteritems() if isinstance(seq, dict) else seq
         for (k, v) in seq:
             self.add(k, v)
 
     def values(self):
-        return [self[k] for k in self.keys()]
+        return [v[-1] for v in dict.itervalues(self)]
 
     def items(self):
         return list(self.iteritems())
 
     def iteritems(self):
-        return ((k, self.getlist(k)) for k in self.keys())
+        return dict.iteritems(self)
 
     def to_string(self):
         '''Returns a raw HTTP headers representation of headers.
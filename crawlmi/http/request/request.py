@@ -7,33 +7,109 @@ from crawlmi.utils.trackref import object_ref
 from crawlmi.utils.url import requote_url, requote_ajax
 
 
+# flags of the attributes shared with another request (created by replace)
+_SHARED_HEADERS = 1
+_SHARED_META = 2
+_SHARED_HISTORY = 4
+
+
 class Request(object_ref):
+    __slots__ = ('callback', 'errback', 'proxy', 'priority', '_headers',
+                 '_meta', '_history', '_cookies', '_encoding', '_method',
+                 '_url', '_body', '_parsed_url', '_shared', '__weakref__')
+
+    _replace_args = frozenset(['url', 'callback', 'errback', 'method',
+                               'headers', 'priority', 'cookies', 'meta', 'body',
+                               'proxy', 'history', 'encoding'])
+
     def __init__(self, url, callback=None, method='GET', headers={},
                  params={}, body='', cookies=None, meta={}, errback=None,
                  proxy=None, priority=0, history=[], encoding='utf-8'):
         self.callback = callback
         self.errback = errback
 
-        self.headers = Headers(headers, encoding)
-        self.meta = dict(meta)
-        self.history = list(history)
+        # headers, meta, history and cookies are created when first accessed,
+        # if they are empty
+        self._headers = Headers(headers, encoding) if headers else None
+        self._meta = dict(meta) if meta else None
+        self._history = list(history) if history else None
+        self._cookies = cookies or None
         self.proxy = proxy
         self.priority = priority
-        self.cookies = cookies or {}
 
         # following attributes are immutable
         self._encoding = encoding
         self._method = self._prepare_method(method)
         self._url = self._prepare_url(url, params)
         self._body = self._prepare_body(body)
+        self._parsed_url = None
+        self._shared = 0
 
     def __repr__(self):
         return '<Request [%s] %s>' % (self._method, self._url)
 
+    @property
+    def headers(self):
+        if self._headers is None:
+            self._headers = Headers(encoding=self._encoding)
+        elif self._shared & _SHARED_HEADERS:
+            self._headers = Headers(self._headers, self._encoding)
+            self._shared &= ~_SHARED_HEADERS
+        return self._headers
+
+    @headers.setter
+    def headers(self, value):
+        self._headers = value
+        self._shared &= ~_SHARED_HEADERS
+
+    @property
+    def meta(self):
+        if self._meta is None:
+            self._meta = {}
+        elif self._shared & _SHARED_META:
+            self._meta = dict(self._meta)
+            self._shared &= ~_SHARED_META
+        return self._meta
+
+    @meta.setter
+    def meta(self, value):
+        self._meta = value
+        self._shared &= ~_SHARED_META
+
+    @property
+    def history(self):
+        if self._history is None:
+            self._history = []
+        elif self._shared & _SHARED_HISTORY:
+            self._history = list(self._history)
+            self._shared &= ~_SHARED_HISTORY
+        return self._history
+
+    @history.setter
+    def history(self, value):
+        self._history = value
+        self._shared &= ~_SHARED_HISTORY
+
+    @property
+    def cookies(self):
+        if self._cookies is None:
+            self._cookies = {}
+        return self._cookies
+
+    @cookies.setter
+    def cookies(self, value):
+        self._cookies = value
+
     @property
     def url(self):
         return self._url
 
+    @property
+    def parsed_url(self):
+        if self._parsed_url is None:
+            self._parsed_url = urlparse(self._url)
+        return self._parsed_url
+
     @property
     def method(self):
         return self._method
@@ -54,7 +130,7 @@ class Request(object_ref):
 
     @property
     def original_url(self):
-        return self.history[0] if self.history else self._url
+        return self._history[0] if self._history else self._url
 
     def _prepare_method(self, method):
         return str(method).upper()
@@ -92,10 +168,8 @@ class Request(object_ref):
                 query = '_escaped_fragment_=%s' % fragment
             fragment = ''
 
-        quoted = requote_url(urlunparse([scheme, netloc, path, _params, query,
-                                         fragment]))
-        self.parsed_url = urlparse(quoted)
-        return quoted
+        return requote_url(urlunparse([scheme, netloc, path, _params, query,
+                                       fragment]))
 
     def _encode_params(self, data):
         '''Encode parameters in a piece of data.
@@ -133,9 +207,55 @@ class Request(object_ref):
     def replace(self, *args, **kwargs):
         '''Create a new Request with the same attributes except for those
         given new values.
+
+        Unchanged headers, meta and history are shared by both requests and
+        each request copies them, when it first accesses them.
         '''
-        for x in ['url', 'callback', 'errback', 'method', 'headers', 'priority',
-                  'cookies', 'meta', 'body', 'proxy', 'history', 'encoding']:
-            kwargs.setdefault(x, getattr(self, x))
         cls = kwargs.pop('cls', self.__class__)
-        return cls(*args, **kwargs)
+        if (args or cls.__init__.im_func is not Request.__init__.im_func or
+                not self._replace_args.issuperset(kwargs)):
+            for x in self._replace_args:
+                kwargs.setdefault(x, getattr(self, x))
+            return cls(*args, **kwargs)
+
+        obj = cls.__new__(cls)
+        obj.callback = kwargs.get('callback', self.callback)
+        obj.errback = kwargs.get('errback', self.errback)
+        obj.proxy = kwargs.get('proxy', self.proxy)
+        obj.priority = kwargs.get('priority', self.priority)
+        obj._cookies = kwargs.get('cookies', self._cookies) or None
+        obj._encoding = kwargs.get('encoding', self._encoding)
+        obj._method = (obj._prepare_method(kwargs['method'])
+                       if 'method' in kwargs else self._method)
+        obj._body = (obj._prepare_body(kwargs['body'])
+                     if 'body' in kwargs else self._body)
+        url = kwargs.get('url', self._url)
+        if url == self._url:
+            # already prepared
+            obj._url, obj._parsed_url = self._url, self._parsed_url
+        else:
+            obj._url, obj._parsed_url = obj._prepare_url(url, {}), None
+
+        obj._shared = 0
+        if 'headers' in kwargs:
+            headers = kwargs['headers']
+            obj._headers = Headers(headers, obj._encoding) if headers else None
+        else:
+            obj._headers = self._headers
+            if obj._headers is not None:
+                obj._shared |= _SHARED_HEADERS
+        if 'meta' in kwargs:
+            obj._meta = dict(kwargs['meta']) if kwargs['meta'] else None
+        else:
+            obj._meta = self._meta
+            if obj._meta is not None:
+                obj._shared |= _SHARED_META
+        if 'history' in kwargs:
+            obj._history = list(kwargs['history']) if kwargs['history'] else None
+        else:
+            obj._history = self._history
+            if obj._history is not None:
+                obj._shared |= _SHARED_HISTORY
+        # this request mustn't modify the shared attributes either
+        self._shared |= obj._shared
+        return obj
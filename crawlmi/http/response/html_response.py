@@ -1,4 +1,3 @@
-import re
 from urlparse import urljoin
 
 from crawlmi.http import TextResponse
@@ -7,28 +6,37 @@ from crawlmi.utils.url import requote_url
 from xextract.extractors.lxml_extractor import HtmlXPathExtractor
 
 
-_base_url_re = re.compile(r'<base\s+href\s*=\s*[\"\']\s*([^\"\'\s]+)\s*[\"\']', re.IGNORECASE)
-
-
 class HtmlResponse(TextResponse):
+    __slots__ = ('_extractor', '_base_url', '_html')
+
     def __init__(self, *args, **kwargs):
         super(HtmlResponse, self).__init__(*args, **kwargs)
         self._extractor = None
         self._base_url = None
+        self._html = None
+
+    @property
+    def html(self):
+        '''Parsed lxml document shared by the extractor and the link
+        extractors. Don't modify it - use `get_html()` to get a private copy.
+        '''
+        if self._html is None:
+            # lxml_fix imports this module
+            from crawlmi.utils.lxml_fix import get_html_document
+            self._html = get_html_document(self)
+        return self._html
 
     @property
     def extractor(self):
         if self._extractor is None:
-            self._extractor = HtmlXPathExtractor(self.text)
+            self._extractor = HtmlXPathExtractor(_root=self.html)
         return self._extractor
 
     @property
     def base_url(self):
         if self._base_url is None:
-            self._base_url = self.url
-            chunk = self.body[:4096]
-            m = _base_url_re.search(chunk)
-            if m:
-                self._base_url = urljoin(self._base_url, m.group(1))
-            self._base_url = requote_url(self._base_url)
+            base_url = self.url
+            if self.head.base_href is not None:
+                base_url = urljoin(base_url, self.head.base_href)
+            self._base_url = requote_url(base_url)
         return self._base_url
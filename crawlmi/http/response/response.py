@@ -8,15 +8,22 @@ _no_request_error = 'Response is not tied to any request.'
 
 
 class Response(object_ref):
+    __slots__ = ('url', 'status', 'request', 'download_latency', '_headers',
+                 '_flags', '_body', '_shared_headers', '__weakref__')
+
     def __init__(self, url, status=200, headers={}, body=None, request=None,
                  flags=None):
         self.url = url
         self.status = int(status)
-        self.headers = Headers(headers)
+        # headers and flags are created when first accessed, if they are empty
+        self._headers = Headers(headers) if headers else None
+        # True, if headers are shared with another response (created by replace)
+        self._shared_headers = False
         self.request = request
-        self.flags = [] if flags is None else list(flags)
+        self._flags = list(flags) if flags else None
 
         # following attributes are immutable
+        # big downloaded bodies are read-only memory-mapped files (mmap)
         self._body = body or ''
 
     def __repr__(self):
@@ -25,6 +32,30 @@ class Response(object_ref):
         return '<%s %s [%s%s]>%s' % (self.__class__.__name__, self.url,
                                      self.status, msg, flags)
 
+    @property
+    def headers(self):
+        if self._headers is None:
+            self._headers = Headers()
+        elif self._shared_headers:
+            self._headers = Headers(self._headers)
+            self._shared_headers = False
+        return self._headers
+
+    @headers.setter
+    def headers(self, value):
+        self._headers = value
+        self._shared_headers = False
+
+    @property
+    def flags(self):
+        if self._flags is None:
+            self._flags = []
+        return self._flags
+
+    @flags.setter
+    def flags(self, value):
+        self._flags = value
+
     @property
     def base_url(self):
         return self.url
@@ -68,8 +99,17 @@ class Response(object_ref):
     def replace(self, *args, **kwargs):
         '''Create a new Response with the same attributes except for those
         given new values.
+
+        Unchanged headers are shared by both responses and each response
+        copies them, when it first accesses them.
         '''
-        for x in ['url', 'status', 'headers', 'request', 'body', 'flags']:
+        share_headers = 'headers' not in kwargs and self._headers is not None
+        for x in ['url', 'status', 'request', 'body']:
             kwargs.setdefault(x, getattr(self, x))
+        kwargs.setdefault('flags', self._flags)
         cls = kwargs.pop('cls', self.__class__)
-        return cls(*args, **kwargs)
+        obj = cls(*args, **kwargs)
+        if share_headers:
+            obj._headers = self._headers
+            obj._shared_headers = self._shared_headers = True
+        return obj
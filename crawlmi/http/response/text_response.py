@@ -1,12 +1,25 @@
 from crawlmi.http import Response
-from crawlmi.utils.encoding import get_unicode_from_response
+from crawlmi.utils.encoding import get_encoding_resolver, strip_bom
+from crawlmi.utils.html import scan_head
 
 
 class TextResponse(Response):
+    __slots__ = ('_encoding', '_unicode_body', '_head')
+
     def __init__(self, *args, **kwargs):
         self._encoding = kwargs.pop('encoding', None)
         super(TextResponse, self).__init__(*args, **kwargs)
         self._unicode_body = None
+        self._head = None
+
+    @property
+    def head(self):
+        '''Result of `scan_head()` of the body, shared by the encoding
+        detection, base url, canonical and meta refresh.
+        '''
+        if self._head is None:
+            self._head = scan_head(self.body)
+        return self._head
 
     @property
     def text(self):
@@ -16,15 +29,15 @@ class TextResponse(Response):
 
     @property
     def encoding(self):
+        # detecting the encoding doesn't need the body to be decoded
         if self._encoding is None:
-            self._prepare_unicode_body()
+            self._encoding = get_encoding_resolver().resolve(self)
         return self._encoding
 
     def _prepare_unicode_body(self):
-        if self._encoding is None:
-            self._encoding, self._unicode_body = get_unicode_from_response(self)
-        else:
-            self._unicode_body = unicode(self.body, self._encoding, 'replace')
+        encoding = self.encoding
+        self._unicode_body = unicode(strip_bom(self.body, encoding), encoding,
+                                     'replace')
 
     def replace(self, *args, **kwargs):
         obj = super(TextResponse, self).replace(*args, **kwargs)
@@ -33,4 +46,6 @@ class TextResponse(Response):
                 self.body == obj.body):
             obj._encoding = self._encoding
             obj._unicode_body = self._unicode_body
+        if self.body == obj.body:
+            obj._head = self._head
         return obj
@@ -3,6 +3,8 @@ from xextract.extractors.lxml_extractor import XmlXPathExtractor
 
 
 class XmlResponse(TextResponse):
+    __slots__ = ('_extractor',)
+
     def __init__(self, *args, **kwargs):
         super(XmlResponse, self).__init__(*args, **kwargs)
         self._extractor = None
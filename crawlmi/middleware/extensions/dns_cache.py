@@ -0,0 +1,58 @@
+from twisted.internet import reactor
+from twisted.internet.abstract import isIPAddress
+
+from crawlmi import signals
+from crawlmi.core.resolver import CachingResolver
+from crawlmi.exceptions import NotConfigured
+
+
+class DnsCache(object):
+    '''Install the caching resolver to the reactor, so that every connection
+    opened by the download handlers uses the cached DNS lookups.
+
+    When `DNS_PREFETCH_ENABLED` is set, the hostnames of the requests taken
+    by the downloader are resolved in advance, while the requests wait in the
+    per-domain queues.
+    '''
+
+    def __init__(self, engine, reactor=reactor):
+        settings = engine.settings
+        if not settings.get_bool('DNS_CACHE_ENABLED'):
+            raise NotConfigured()
+        self.reactor = reactor
+        self.original_resolver = None
+        if settings.get_bool('DNS_CACHE_USE_NAMESERVERS'):
+            from twisted.names import client
+            base_resolver = client.createResolver()
+        else:
+            base_resolver = reactor.resolver
+        self.resolver = CachingResolver(
+            base_resolver,
+            size=settings.get_int('DNS_CACHE_SIZE'),
+            ttl=settings.get_float('DNS_CACHE_TTL'),
+            negative_ttl=settings.get_float('DNS_CACHE_NEGATIVE_TTL'),
+            prefetch_concurrency=settings.get_int('DNS_PREFETCH_CONCURRENCY'),
+            stats=engine.stats,
+            clock=engine.clock)
+
+        engine.signals.connect(self.engine_started, signal=signals.engine_started)
+        engine.signals.connect(self.engine_stopped, signal=signals.engine_stopped)
+        if settings.get_bool('DNS_PREFETCH_ENABLED'):
+            engine.signals.connect(self.request_scheduled,
+                                   signal=signals.request_scheduled)
+
+    def engine_started(self):
+        self.original_resolver = self.reactor.installResolver(self.resolver)
+
+    def engine_stopped(self):
+        if self.original_resolver is not None:
+            self.reactor.installResolver(self.original_resolver)
+            self.original_resolver = None
+
+    def request_scheduled(self, request):
+        # proxied requests are resolved by the proxy
+        if request.proxy:
+            return
+        hostname = request.parsed_url.hostname
+        if hostname and not isIPAddress(hostname):
+            self.resolver.prefetch(hostname)
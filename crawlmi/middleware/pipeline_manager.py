@@ -1,3 +1,4 @@
+from twisted.internet import defer
 from twisted.python.failure import Failure
 
 from crawlmi.exceptions import RestartPipeline, DropRequest
@@ -42,31 +43,63 @@ class PipelineManager(MiddlewareManager):
 
         Return value is either Request or Response object or the exception
         DropRequest is raised.
+
+        Middlewares can return Deferred as well. In such case, the rest of the
+        pipeline is processed, when the Deferred fires and Deferred with the
+        final result is returned.
         '''
+        return self._process_request_from(request, 0)
+
+    def _process_request_from(self, request, start):
         while True:
             try:
-                for name, enabled_setting, method in self._process_request:
+                for i in xrange(start, len(self._process_request)):
+                    name, enabled_setting, method = self._process_request[i]
                     # skip disabled mw through meta
                     if not request.meta.get(enabled_setting, True):
                         continue
-                    request = method(request)
-                    assert request is None or isinstance(request, (Request, Response)), \
-                        'Middleware %s.process_request must return None, Response or Request, got %s' % \
-                        (method.im_self.__class__.__name__, type(request))
-                    if request is None:
-                        raise DropRequest(
-                            '`%s` pipeline middleware dropped the request in `process_request()` method' %
-                            name)
-                    elif isinstance(request, Response):
+                    result = method(request)
+                    if isinstance(result, defer.Deferred):
+                        result.addCallback(self._check_request_result, name, method)
+                        result.addCallback(self._continue_request, i + 1)
+                        result.addErrback(self._restart_request, method)
+                        return result
+                    request = self._check_request_result(result, name, method)
+                    if isinstance(request, Response):
                         return request
             except RestartPipeline as e:
-                request = e.new_request
-                assert isinstance(request, Request), \
-                    'Middleware %s.process_request must raise RestartPipeline with Request, got %s' % \
-                    (method.im_self.__class__.__name__, type(request))
+                request = self._get_restarted_request(e, method)
+                start = 0
             else:
                 return request
 
+    def _check_request_result(self, request, name, method):
+        assert request is None or isinstance(request, (Request, Response)), \
+            'Middleware %s.process_request must return None, Response or Request, got %s' % \
+            (method.im_self.__class__.__name__, type(request))
+        if request is None:
+            raise DropRequest(
+                '`%s` pipeline middleware dropped the request in `process_request()` method' %
+                name)
+        return request
+
+    def _continue_request(self, request, start):
+        if isinstance(request, Response):
+            return request
+        return self._process_request_from(request, start)
+
+    def _restart_request(self, failure, method):
+        failure.trap(RestartPipeline)
+        request = self._get_restarted_request(failure.value, method)
+        return self._process_request_from(request, 0)
+
+    def _get_restarted_request(self, exc, method):
+        request = exc.new_request
+        assert isinstance(request, Request), \
+            'Middleware %s.process_request must raise RestartPipeline with Request, got %s' % \
+            (method.im_self.__class__.__name__, type(request))
+        return request
+
     def process_response(self, response):
         '''Passes response (Response or Failure object) received from
         Downloader thought pipeline middlewares.
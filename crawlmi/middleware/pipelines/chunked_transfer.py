@@ -1,6 +1,12 @@
+from crawlmi.utils.chunked import ChunkedDecoder
+
+
 class ChunkedTransfer(object):
     '''Adds support for chunked transfer encoding. See:
     http://en.wikipedia.org/wiki/Chunked_transfer_encoding
+
+    Downloaded responses are decoded by the web client already, so this only
+    decodes the responses still marked as chunked, e.g. the cached ones.
     '''
 
     def __init__(self, engine):
@@ -13,12 +19,4 @@ class ChunkedTransfer(object):
         return response
 
     def _decode_chunked_transfer(self, chunked_body):
-        body, h, t = '', '', chunked_body
-        while t:
-            h, t = t.split('\r\n', 1)
-            if h == '0':
-                break
-            size = int(h, 16)
-            body += t[:size]
-            t = t[size + 2:]
-        return body
+        return ChunkedDecoder().decode(chunked_body)
@@ -1,6 +1,14 @@
-from collections import defaultdict
+import hashlib
+import mmap
+import os
+import threading
 
+from twisted.internet import threads
+
+from crawlmi import log, signals
 from crawlmi.signals import Signal
+from crawlmi.utils.defer import LoopingCall
+from crawlmi.utils.misc import load_object
 from crawlmi.utils.request import request_fingerprint
 
 
@@ -10,20 +18,153 @@ clear_duplicate_filter = Signal('clear_duplicate_filter')
 
 
 class DuplicateFilter(object):
+    '''Filter out the requests with the already seen fingerprints. Requests
+    with different `df_tag` meta are filtered separately, each tag having its
+    own `DUPLICATE_FILTER_STORE` of the fingerprints.
+
+    When `DUPLICATE_FILTER_DIR` is set, the stores are saved there every
+    `DUPLICATE_FILTER_CHECKPOINT_INTERVAL` seconds and when the engine stops.
+    They are loaded, when the tag is first used in the next run. Checkpoints
+    write the copies of the stores in the thread, so they don't stall the
+    crawling.
+    '''
+
     def __init__(self, engine):
-        self.fingerprints = defaultdict(set)
+        self.engine = engine
+        self.settings = engine.settings
+        self.store_class = load_object(self.settings['DUPLICATE_FILTER_STORE'])
+        self.fingerprints = {}  # df_tag -> fingerprint store
+        self.dir = None
+        self._modified = set()  # tags modified since the last save
+        self._saving = None  # Deferred of the running checkpoint
+        self._saving_tags = set()  # tags written by the running checkpoint
+        # serializes the writes; checkpoint is skipped, when the generation
+        # changes meanwhile (the stores were saved or cleared)
+        self._lock = threading.Lock()
+        self._generation = 0
         engine.signals.connect(self.clear_duplicate_filter,
                                signal=clear_duplicate_filter)
 
+        if self.settings.get('DUPLICATE_FILTER_DIR'):
+            self.dir = engine.project.data_path(
+                self.settings['DUPLICATE_FILTER_DIR'], create_dir=True)
+            self.checkpoint_interval = self.settings.get_float(
+                'DUPLICATE_FILTER_CHECKPOINT_INTERVAL')
+            self.checkpointing = LoopingCall(self.checkpoint,
+                                             clock=engine.clock)
+            engine.signals.connect(self.engine_started,
+                                   signal=signals.engine_started)
+            engine.signals.connect(self.engine_stopped,
+                                   signal=signals.engine_stopped)
+
+    def engine_started(self):
+        if self.checkpoint_interval > 0:
+            self.checkpointing.schedule(self.checkpoint_interval)
+
+    def engine_stopped(self):
+        self.checkpointing.cancel()
+        self.save()
+
     def process_request(self, request):
         df_tag = request.meta.get('df_tag')
-        fps = self.fingerprints[df_tag]
-        fp = request_fingerprint(request)
-        if fp in fps:
+        fps = self.fingerprints.get(df_tag)
+        if fps is None:
+            fps = self.fingerprints[df_tag] = self._load(df_tag)
+        if not fps.add(request_fingerprint(request)):
             return
-        fps.add(fp)
+        if self.dir is not None:
+            self._modified.add(df_tag)
         return request
 
     def clear_duplicate_filter(self, df_tag=None):
         if df_tag in self.fingerprints:
             del self.fingerprints[df_tag]
+        if self.dir is not None:
+            self._modified.discard(df_tag)
+            path = self._get_path(df_tag)
+            with self._lock:
+                self._generation += 1
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def save(self):
+        '''Save the fingerprint stores modified since the last save. The
+        running checkpoint is waited for.
+        '''
+        tags = (self._modified | self._saving_tags) & set(self.fingerprints)
+        with self._lock:
+            self._generation += 1
+            for df_tag in tags:
+                self._write(df_tag, self.fingerprints[df_tag])
+        self._modified.clear()
+
+    def checkpoint(self):
+        '''Save the modified fingerprint stores in the thread. Return Deferred
+        or None, when there is nothing to save or the previous checkpoint is
+        still running.
+        '''
+        if self._saving is not None or not self._modified:
+            return None
+        self._saving_tags, self._modified = self._modified, set()
+        # stores are modified, while the copies are written
+        stores = [(df_tag, self.fingerprints[df_tag].copy())
+                  for df_tag in self._saving_tags]
+        self._saving = threads.deferToThread(self._write_checkpoint, stores,
+                                             self._generation)
+        self._saving.addErrback(self._checkpoint_failed)
+        self._saving.addCallback(self._checkpoint_finished)
+        return self._saving
+
+    def _write_checkpoint(self, stores, generation):
+        with self._lock:
+            if generation != self._generation:
+                return False
+            for df_tag, store in stores:
+                self._write(df_tag, store)
+        return True
+
+    def _checkpoint_failed(self, failure):
+        log.err(failure, 'Error when saving the fingerprints')
+        return False
+
+    def _checkpoint_finished(self, written):
+        if not written:
+            self._modified.update(self._saving_tags & set(self.fingerprints))
+        self._saving = None
+        self._saving_tags = set()
+
+    def _write(self, df_tag, store):
+        # the file is replaced only by the complete store
+        path = self._get_path(df_tag)
+        with open(path + '.tmp', 'wb') as f:
+            store.write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(path + '.tmp', path)
+
+    def _load(self, df_tag):
+        store = self.store_class(self.settings)
+        if self.dir is None:
+            return store
+        path = self._get_path(df_tag)
+        if not os.path.exists(path):
+            return store
+        try:
+            with open(path, 'rb') as f:
+                # raises ValueError for the empty file
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                store.load(data)
+            finally:
+                data.close()
+        except (EnvironmentError, ValueError) as e:
+            log.msg(format='Ignoring the fingerprints %(path)s: %(error)s',
+                    level=log.WARNING, path=path, error=str(e))
+            store = self.store_class(self.settings)
+        return store
+
+    def _get_path(self, df_tag):
+        # tags can be arbitrary objects - file is named by the hash of the repr
+        name = '%s_%s.fps' % (self.engine.spider.name,
+                              hashlib.sha1(repr(df_tag)).hexdigest())
+        return os.path.join(self.dir, name)
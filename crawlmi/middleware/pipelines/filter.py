@@ -6,6 +6,27 @@ class FilterError(DropRequest):
     '''Raised when filtering out the request.'''
 
 
+def get_filter_reason(settings, response):
+    '''Return the tuple (stats key, reason), if the response should be
+    filtered out, or None otherwise. Only the status and headers of the
+    response are checked, so that it can be used before the body is
+    downloaded.
+    '''
+    filter_non_200 = settings.get('FILTER_NON_200_RESPONSE_STATUS',
+                                  req_or_resp=response)
+    if filter_non_200 and not (200 <= response.status < 300):
+        return 'filter/non_200', 'Non-200 status: %s' % response.status
+
+    filter_status = settings.get('FILTER_RESPONSE_STATUS', req_or_resp=response)
+    if filter_status(response.status):
+        return 'filter/bad_status', 'Bad status: %s' % response.status
+
+    filter_nontext = settings.get_bool('FILTER_NONTEXT_RESPONSE',
+                                       req_or_resp=response)
+    if filter_nontext and not isinstance(response, TextResponse):
+        return 'filter/non_text', 'Nontext response'
+
+
 class Filter(object):
     def __init__(self, engine):
         self.stats = engine.stats
@@ -27,22 +48,11 @@ class Filter(object):
         return request
 
     def process_response(self, response):
-        filter_non_200 = self.settings.get('FILTER_NON_200_RESPONSE_STATUS',
-                                           req_or_resp=response)
-        if filter_non_200 and not (200 <= response.status < 300):
-            self.stats.inc_value('filter/non_200')
-            raise FilterError('Non-200 status: %s' % response.status)
-
-        filter_status = self.settings.get('FILTER_RESPONSE_STATUS',
-                                          req_or_resp=response)
-        if filter_status(response.status):
-            self.stats.inc_value('filter/bad_status')
-            raise FilterError('Bad status: %s' % response.status)
-
-        filter_nontext = self.settings.get_bool('FILTER_NONTEXT_RESPONSE',
-                                                req_or_resp=response)
-        if filter_nontext and not isinstance(response, TextResponse):
-            self.stats.inc_value('filter/non_text')
-            raise FilterError('Nontext response')
-
+        # responses flagged as `filtered` were not downloaded completely.
+        # See FILTER_ON_HEADERS setting.
+        filtered = get_filter_reason(self.settings, response)
+        if filtered is not None:
+            stats_key, reason = filtered
+            self.stats.inc_value(stats_key)
+            raise FilterError(reason)
         return response
@@ -1,6 +1,10 @@
 from email.utils import formatdate
 
+from twisted.internet import defer
+
 from crawlmi import signals
+from crawlmi.middleware.pipelines.http_cache.storage import (
+    BackgroundCacheStorage, MemoryCacheStorage)
 from crawlmi.utils.misc import load_object
 
 
@@ -10,6 +14,17 @@ class HttpCache(object):
         settings = engine.settings
         self.policy = load_object(settings['HTTP_CACHE_POLICY'])(settings)
         self.storage = load_object(settings['HTTP_CACHE_STORAGE'])(engine)
+        threads = settings.get_int('HTTP_CACHE_THREADS')
+        if threads > 0:
+            self.storage = BackgroundCacheStorage(
+                self.storage, threads,
+                settings.get_int('HTTP_CACHE_WRITE_BATCH'),
+                settings.get_int('HTTP_CACHE_WRITE_QUEUE_SIZE'))
+        memory_size = settings.get_int('HTTP_CACHE_MEMORY_SIZE')
+        if memory_size > 0:
+            self.storage = MemoryCacheStorage(
+                self.storage, memory_size,
+                settings.get_int('HTTP_CACHE_EXPIRATION_SECS'), engine.stats)
         self.ignore_missing = settings.get_bool('HTTP_CACHE_IGNORE_MISSING')
         self.stats = engine.stats
 
@@ -30,6 +45,12 @@ class HttpCache(object):
 
         # Look for cached response and check if expired
         cached_response = self.storage.retrieve_response(request)
+        if isinstance(cached_response, defer.Deferred):
+            return cached_response.addCallback(self._process_cached_response,
+                                               request)
+        return self._process_cached_response(cached_response, request)
+
+    def _process_cached_response(self, cached_response, request):
         if cached_response is None:
             self.stats.inc_value('httpcache/miss')
             if self.ignore_missing:
@@ -76,7 +97,10 @@ class HttpCache(object):
         return response
 
     def _cache_response(self, response, request, cached_response):
-        if self.policy.should_cache_response(response, request):
+        # body of the filtered response wasn't downloaded (see
+        # FILTER_ON_HEADERS setting)
+        if ('filtered' not in response.flags and
+                self.policy.should_cache_response(response, request)):
             self.stats.inc_value('httpcache/store')
             self.storage.store_response(request, response)
         else:
@@ -1,8 +1,19 @@
+from binascii import hexlify, unhexlify
+from collections import OrderedDict
 from importlib import import_module
+import mmap
 import os
 import pickle
+import sqlite3
+import struct
+import threading
 from time import time
+import zlib
 
+from twisted.internet import defer, reactor, threads
+from twisted.python.threadpool import ThreadPool
+
+from crawlmi import log
 from crawlmi.http import Headers
 from crawlmi.http.response.factory import from_args
 from crawlmi.utils.request import request_fingerprint
@@ -29,7 +40,10 @@ class DbmCacheStorage(object):
         self.db.close()
 
     def retrieve_response(self, request):
-        data = self._read_data(request)
+        return self.retrieve_by_fingerprint(self._request_key(request))
+
+    def retrieve_by_fingerprint(self, key):
+        data = self._read_data(key)
         if data is None:
             return  # not cached
         url = data['url']
@@ -41,18 +55,19 @@ class DbmCacheStorage(object):
         return response
 
     def store_response(self, request, response):
-        key = self._request_key(request)
+        self.store_by_fingerprint(self._request_key(request), response)
+
+    def store_by_fingerprint(self, key, response):
         data = {
             'status': response.status,
             'url': response.url,
             'headers': dict(response.headers),
-            'body': response.body,
+            'body': response.body[:],
         }
         self.db['%s_data' % key] = pickle.dumps(data, protocol=2)
         self.db['%s_time' % key] = str(time())
 
-    def _read_data(self, request):
-        key = self._request_key(request)
+    def _read_data(self, key):
         db = self.db
         tkey = '%s_time' % key
         if tkey not in db:
@@ -66,3 +81,516 @@ class DbmCacheStorage(object):
 
     def _request_key(self, request):
         return request_fingerprint(request)
+
+
+class SqliteCacheStorage(object):
+    '''Cache storage using sqlite3 database. Every response is stored in
+    a single row identified by the request fingerprint. Bodies are compressed
+    by zlib.
+
+    Changes are committed after every `HTTP_CACHE_SQLITE_COMMIT_BATCH` stored
+    responses and when the storage is closed.
+    '''
+
+    def __init__(self, engine):
+        project = engine.project
+        settings = engine.settings
+
+        self.engine = engine
+        self.cache_dir = project.data_path(settings['HTTP_CACHE_DIR'],
+                                           create_dir=True)
+        self.expiration_secs = settings.get_int('HTTP_CACHE_EXPIRATION_SECS')
+        self.commit_batch = max(1, settings.get_int('HTTP_CACHE_SQLITE_COMMIT_BATCH'))
+        self.db = None
+        self._uncommitted = 0
+
+    def open(self):
+        dbpath = os.path.join(self.cache_dir, '%s.sqlite' % self.engine.spider.name)
+        # BackgroundCacheStorage uses the connection from its threads
+        self.db = sqlite3.connect(dbpath, check_same_thread=False)
+        self.db.text_factory = str
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            'fingerprint TEXT PRIMARY KEY, timestamp REAL NOT NULL, '
+            'url TEXT NOT NULL, status INTEGER NOT NULL, '
+            'headers BLOB NOT NULL, body BLOB NOT NULL)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS responses_timestamp '
+                        'ON responses (timestamp)')
+        self.remove_expired()
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+        self.db = None
+
+    def retrieve_response(self, request):
+        return self.retrieve_by_fingerprint(self._request_key(request))
+
+    def retrieve_by_fingerprint(self, key):
+        row = self.db.execute(
+            'SELECT timestamp, url, status, headers, body FROM responses '
+            'WHERE fingerprint = ?', (key,)).fetchone()
+        if row is None:
+            return  # not cached
+        ts, url, status, headers, body = row
+        if 0 < self.expiration_secs < time() - ts:
+            return  # expired
+        headers = Headers(pickle.loads(str(headers)))
+        body = zlib.decompress(body)
+        respcls = from_args(headers=headers, url=url)
+        return respcls(url=url, headers=headers, status=status, body=body)
+
+    def store_response(self, request, response):
+        self.store_by_fingerprint(self._request_key(request), response)
+
+    def store_by_fingerprint(self, key, response):
+        headers = pickle.dumps(dict(response.headers), protocol=2)
+        body = zlib.compress(response.body)
+        self.db.execute(
+            'INSERT OR REPLACE INTO responses '
+            '(fingerprint, timestamp, url, status, headers, body) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (key, time(), response.url,
+             response.status, sqlite3.Binary(headers), sqlite3.Binary(body)))
+        self._uncommitted += 1
+        if self._uncommitted >= self.commit_batch:
+            self.db.commit()
+            self._uncommitted = 0
+
+    def remove_expired(self):
+        '''Delete the expired responses from the database.'''
+        if self.expiration_secs > 0:
+            self.db.execute('DELETE FROM responses WHERE timestamp < ?',
+                            (time() - self.expiration_secs,))
+            self.db.commit()
+            self._uncommitted = 0
+
+    def __len__(self):
+        return self.db.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+
+    def __iter__(self):
+        '''Iterate over the fingerprints of all the cached responses.'''
+        for row in self.db.execute('SELECT fingerprint FROM responses'):
+            yield row[0]
+
+    def _request_key(self, request):
+        return request_fingerprint(request)
+
+
+class LogCacheStorage(object):
+    '''Append-only cache storage. Responses are appended to the segment files
+    of at most `HTTP_CACHE_LOG_SEGMENT_SIZE` bytes. The index of
+    fingerprint -> (segment, offset, length, timestamp) is kept in memory and
+    it is saved to the `index` file when the storage is closed. Responses
+    stored after the last save of the index are recovered by scanning the
+    segments.
+
+    Segments are memory-mapped, so that reading a response doesn't need any
+    system call. When more than `HTTP_CACHE_LOG_COMPACT_RATIO` of the segments
+    are taken by the replaced or expired responses, the storage is compacted
+    when opened.
+    '''
+
+    # magic, fingerprint, timestamp, status, meta length, body length
+    record_header = struct.Struct('>4s20sdHII')
+    record_magic = 'CMLR'
+    # magic, active segment, its size
+    index_header = struct.Struct('>4sIQ')
+    index_magic = 'CMLI'
+    # fingerprint, segment, offset, length, timestamp
+    index_entry = struct.Struct('>20sIQId')
+
+    def __init__(self, engine):
+        project = engine.project
+        settings = engine.settings
+
+        self.engine = engine
+        self.cache_dir = project.data_path(settings['HTTP_CACHE_DIR'],
+                                           create_dir=True)
+        self.expiration_secs = settings.get_int('HTTP_CACHE_EXPIRATION_SECS')
+        self.segment_size = settings.get_int('HTTP_CACHE_LOG_SEGMENT_SIZE')
+        self.compact_ratio = settings.get_float('HTTP_CACHE_LOG_COMPACT_RATIO')
+        self.log_dir = None
+        self.index = {}
+        self.segment = 0  # number of the active segment
+        self.dead_size = 0  # size of the replaced responses
+        self._file = None  # active segment
+        self._file_size = 0
+        self._maps = {}  # segment -> mmap
+
+    def open(self):
+        self.log_dir = os.path.join(self.cache_dir,
+                                    '%s.log' % self.engine.spider.name)
+        if not os.path.isdir(self.log_dir):
+            os.makedirs(self.log_dir)
+        self._load_index()
+        segments = self._list_segments()
+        self._open_segment(segments[-1] if segments else 1)
+        total_size = sum(os.path.getsize(self._segment_path(s))
+                         for s in segments)
+        self.dead_size = total_size - sum(e[2] for e in self.index.itervalues())
+        if (self.compact_ratio > 0 and
+                self.dead_size > self.compact_ratio * total_size):
+            self.compact()
+
+    def close(self):
+        self._file.close()
+        self._file = None
+        self._close_maps()
+        self._save_index()
+
+    def retrieve_response(self, request):
+        return self.retrieve_by_fingerprint(request_fingerprint(request))
+
+    def retrieve_by_fingerprint(self, fingerprint):
+        entry = self.index.get(unhexlify(fingerprint))
+        if entry is None:
+            return  # not cached
+        segment, offset, length, ts = entry
+        if 0 < self.expiration_secs < time() - ts:
+            return  # expired
+        mm = self._get_map(segment, offset + length)
+        _, _, _, status, meta_len, body_len = \
+            self.record_header.unpack_from(mm, offset)
+        start = offset + self.record_header.size
+        url, headers = pickle.loads(mm[start:start + meta_len])
+        start += meta_len
+        body = mm[start:start + body_len]
+        headers = Headers(headers)
+        respcls = from_args(headers=headers, url=url)
+        return respcls(url=url, headers=headers, status=status, body=body)
+
+    def store_response(self, request, response):
+        self.store_by_fingerprint(request_fingerprint(request), response)
+
+    def store_by_fingerprint(self, fingerprint, response):
+        key = unhexlify(fingerprint)
+        ts = time()
+        meta = pickle.dumps((response.url, dict(response.headers)), protocol=2)
+        body = response.body[:]
+        header = self.record_header.pack(self.record_magic, key, ts,
+                                         response.status, len(meta), len(body))
+        self._append(key, ''.join([header, meta, body]), ts)
+
+    def compact(self):
+        '''Rewrite the valid responses to the new segments and remove the old
+        ones.
+        '''
+        old_segments = self._list_segments()
+        self._open_segment(self.segment + 1)
+        now = time()
+        # read the segments sequentially
+        entries = sorted(self.index.iteritems(), key=lambda e: e[1][:2])
+        for key, (segment, offset, length, ts) in entries:
+            if 0 < self.expiration_secs < now - ts:
+                del self.index[key]
+                continue
+            mm = self._get_map(segment, offset + length)
+            self._append(key, mm[offset:offset + length], ts)
+        self._file.flush()
+        # the index has to be saved before the old segments are removed
+        self._save_index()
+        for segment in old_segments:
+            mm = self._maps.pop(segment, None)
+            if mm is not None:
+                mm.close()
+            os.remove(self._segment_path(segment))
+        self.dead_size = 0
+
+    def __len__(self):
+        return len(self.index)
+
+    def __iter__(self):
+        '''Iterate over the fingerprints of all the cached responses.'''
+        for key in self.index:
+            yield hexlify(key)
+
+    def _segment_path(self, segment):
+        return os.path.join(self.log_dir, '%08d.seg' % segment)
+
+    def _list_segments(self):
+        return sorted(int(name[:-4]) for name in os.listdir(self.log_dir)
+                      if name.endswith('.seg') and name[:-4].isdigit())
+
+    def _open_segment(self, segment):
+        if self._file is not None:
+            self._file.close()
+        self.segment = segment
+        self._file = open(self._segment_path(segment), 'ab')
+        self._file_size = self._file.tell()
+
+    def _append(self, key, record, ts):
+        if self._file_size and self._file_size + len(record) > self.segment_size:
+            self._open_segment(self.segment + 1)
+        self._file.write(record)
+        old = self.index.get(key)
+        if old is not None:
+            self.dead_size += old[2]
+        self.index[key] = (self.segment, self._file_size, len(record), ts)
+        self._file_size += len(record)
+
+    def _get_map(self, segment, end):
+        mm = self._maps.get(segment)
+        if mm is None or len(mm) < end:
+            if segment == self.segment:
+                self._file.flush()
+            if mm is not None:
+                mm.close()
+            with open(self._segment_path(segment), 'rb') as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[segment] = mm
+        return mm
+
+    def _close_maps(self):
+        for mm in self._maps.itervalues():
+            mm.close()
+        self._maps.clear()
+
+    def _load_index(self):
+        self.index = {}
+        segments = self._list_segments()
+        # position, from which the segments are not indexed
+        scan_from = (segments[0] if segments else 0, 0)
+        path = os.path.join(self.log_dir, 'index')
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                data = f.read()
+            if data[:4] == self.index_magic:
+                _, segment, size = self.index_header.unpack_from(data)
+                entry = self.index_entry
+                for offset in xrange(self.index_header.size, len(data),
+                                     entry.size):
+                    values = entry.unpack_from(data, offset)
+                    self.index[values[0]] = values[1:]
+                scan_from = (segment, size)
+            else:
+                log.msg(format='Invalid HttpCache index %(path)s', path=path,
+                        level=log.WARNING)
+        for segment in segments:
+            if segment >= scan_from[0]:
+                self._scan_segment(
+                    segment, scan_from[1] if segment == scan_from[0] else 0)
+
+    def _scan_segment(self, segment, offset):
+        path = self._segment_path(segment)
+        size = os.path.getsize(path)
+        header = self.record_header
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            while offset < size:
+                data = f.read(header.size)
+                if len(data) < header.size:
+                    break
+                magic, key, ts, _, meta_len, body_len = header.unpack(data)
+                length = header.size + meta_len + body_len
+                if magic != self.record_magic or offset + length > size:
+                    break
+                self.index[key] = (segment, offset, length, ts)
+                offset += length
+                f.seek(offset)
+        if offset < size:
+            # the last record wasn't written completely
+            log.msg(format='Truncating HttpCache segment %(path)s at %(offset)s',
+                    path=path, offset=offset, level=log.WARNING)
+            with open(path, 'r+b') as f:
+                f.truncate(offset)
+
+    def _save_index(self):
+        path = os.path.join(self.log_dir, 'index')
+        entry = self.index_entry
+        with open(path + '.tmp', 'wb') as f:
+            f.write(self.index_header.pack(self.index_magic, self.segment,
+                                           self._file_size))
+            for key, value in self.index.iteritems():
+                f.write(entry.pack(key, *value))
+        os.rename(path + '.tmp', path)
+
+
+class BackgroundCacheStorage(object):
+    '''Wrapper of the cache storage, which moves the storage I/O out of the
+    reactor thread.
+
+    Responses are retrieved by the pool of `threads` threads and Deferred is
+    returned. Stored responses are buffered and written by the threads in
+    batches of `write_batch` responses. When the writing can't keep up and
+    there are more than `write_queue_size` buffered responses, they are
+    written right away in the reactor thread. Buffered responses are written
+    when the storage is closed.
+
+    Access to the wrapped storage is serialized, so it doesn't have to be
+    thread-safe. Request fingerprints are computed in the reactor thread and
+    the threads use only `retrieve_by_fingerprint()` and
+    `store_by_fingerprint()` of the wrapped storage.
+    '''
+
+    def __init__(self, storage, threads=1, write_batch=100,
+                 write_queue_size=1000, reactor=reactor):
+        self.storage = storage
+        self.write_batch = max(1, write_batch)
+        self.write_queue_size = max(self.write_batch, write_queue_size)
+        self.reactor = reactor
+        self.threadpool = ThreadPool(1, max(1, threads), 'HttpCacheStorage')
+        self.lock = threading.Lock()
+        self._pending = OrderedDict()  # fingerprint -> response
+        self._flushing = OrderedDict()  # responses being written by threads
+
+    def open(self):
+        self.storage.open()
+        self.threadpool.start()
+
+    def close(self):
+        # wait for the running and scheduled jobs
+        self.threadpool.stop()
+        self._flushing.clear()
+        self._store_batch(self._pending.items())
+        self._pending.clear()
+        self.storage.close()
+
+    def retrieve_response(self, request):
+        return self.retrieve_by_fingerprint(request_fingerprint(request))
+
+    def retrieve_by_fingerprint(self, key):
+        buffered = self._pending.get(key) or self._flushing.get(key)
+        if buffered is not None:
+            return defer.succeed(buffered.copy())
+        return threads.deferToThreadPool(self.reactor, self.threadpool,
+                                         self._locked,
+                                         self.storage.retrieve_by_fingerprint,
+                                         key)
+
+    def store_response(self, request, response):
+        self.store_by_fingerprint(request_fingerprint(request), response)
+
+    def store_by_fingerprint(self, key, response):
+        self._pending.pop(key, None)
+        # the following pipelines modify the response in place (e.g.
+        # HttpCompression removes Content-Encoding header), so the snapshot of
+        # the response is buffered
+        self._pending[key] = response.replace(headers=response.headers)
+        if len(self._pending) >= self.write_batch:
+            self._flush()
+
+    def _flush(self):
+        if self._flushing:
+            # previous batch is still being written
+            if len(self._pending) >= self.write_queue_size:
+                self._store_batch(self._pending.items())
+                self._pending.clear()
+            return
+        self._flushing, self._pending = self._pending, OrderedDict()
+        dfd = threads.deferToThreadPool(self.reactor, self.threadpool,
+                                        self._store_batch,
+                                        self._flushing.items())
+        dfd.addErrback(log.err, 'Error when storing responses to the cache')
+        dfd.addBoth(self._flushed)
+
+    def _flushed(self, _):
+        self._flushing = OrderedDict()
+        if len(self._pending) >= self.write_batch:
+            self._flush()
+
+    def _store_batch(self, items):
+        with self.lock:
+            for key, response in items:
+                self.storage.store_by_fingerprint(key, response)
+
+    def _locked(self, func, *args):
+        with self.lock:
+            return func(*args)
+
+
+class MemoryCacheStorage(object):
+    '''Wrapper of the cache storage, which keeps the recently used responses
+    in memory. Responses of at most `max_size` bytes in total are kept, the
+    least recently used ones are dropped first. Responses are kept in memory
+    for at most `expiration_secs` seconds (0 for no limit).
+
+    Storing the new version of the response removes the old one from memory.
+    '''
+
+    def __init__(self, storage, max_size, expiration_secs=0, stats=None):
+        self.storage = storage
+        self.max_size = max_size
+        self.expiration_secs = expiration_secs
+        self.stats = stats
+        self.size = 0
+        self.cache = OrderedDict()  # fingerprint -> (time, response)
+        # fingerprint -> [number of running lookups, True if stored meanwhile]
+        self._loading = {}
+
+    def open(self):
+        self.storage.open()
+
+    def close(self):
+        self.cache.clear()
+        self.size = 0
+        self.storage.close()
+
+    def retrieve_response(self, request):
+        return self.retrieve_by_fingerprint(request_fingerprint(request))
+
+    def retrieve_by_fingerprint(self, key):
+        response = self._get(key)
+        if response is not None:
+            if self.stats is not None:
+                self.stats.inc_value('httpcache/mem_hit')
+            return response.copy()
+
+        result = self.storage.retrieve_by_fingerprint(key)
+        if isinstance(result, defer.Deferred):
+            self._loading.setdefault(key, [0, False])[0] += 1
+            return result.addCallback(self._loaded, key)
+        return self._add(key, result)
+
+    def store_response(self, request, response):
+        self.store_by_fingerprint(request_fingerprint(request), response)
+
+    def store_by_fingerprint(self, key, response):
+        self._remove(key)
+        # the older version must not get to the memory from the running lookup
+        if key in self._loading:
+            self._loading[key][1] = True
+        self.storage.store_by_fingerprint(key, response)
+
+    def _loaded(self, response, key):
+        loading = self._loading[key]
+        loading[0] -= 1
+        if not loading[0]:
+            del self._loading[key]
+        if loading[1]:
+            return response
+        return self._add(key, response)
+
+    def _get(self, key):
+        entry = self.cache.pop(key, None)
+        if entry is None:
+            return None
+        ts, response = entry
+        if 0 < self.expiration_secs < time() - ts:
+            self.size -= self._get_size(response)
+            return None
+        # move to the end - most recently used
+        self.cache[key] = entry
+        return response
+
+    def _add(self, key, response):
+        if response is None:
+            return None
+        size = self._get_size(response)
+        if size <= self.max_size:
+            self._remove(key)
+            self.cache[key] = (time(), response)
+            self.size += size
+            while self.size > self.max_size:
+                _, (_, old) = self.cache.popitem(last=False)
+                self.size -= self._get_size(old)
+        # callers modify the returned response (e.g. its flags)
+        return response.copy()
+
+    def _remove(self, key):
+        entry = self.cache.pop(key, None)
+        if entry is not None:
+            self.size -= self._get_size(entry[1])
+
+    def _get_size(self, response):
+        return len(response.url) + len(response.body)
@@ -7,6 +7,10 @@ from crawlmi.utils.gz import gunzip, is_gzipped
 
 class HttpCompression(object):
     '''Allows compressed (gzip, deflate) traffic to be received from web sites.
+
+    Downloaded responses are usually decompressed already by the web client
+    (see `DOWNLOAD_DECOMPRESS`). This pipeline decodes the rest, e.g. cached
+    responses or the responses with multiple encodings.
     '''
 
     def __init__(self, engine):
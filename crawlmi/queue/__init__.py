@@ -1,3 +1,4 @@
+from .disk_queue import DiskQueue
 from .heap import Heap
 from .memory_queue import MemoryQueue
 from .priority_queue import PriorityQueue
@@ -0,0 +1,98 @@
+from collections import deque
+import cPickle as pickle
+import struct
+import tempfile
+
+from .queue import Queue
+
+
+class DiskQueue(Queue):
+    '''FIFO queue, which stores its objects serialized in a temporary file on
+    disk. Only the first `buffer_size` objects (the head of the queue) are kept
+    in memory, so the memory consumption stays flat no matter how many objects
+    are pushed to the queue.
+
+    Objects are converted to strings by `serialize` function and back by
+    `deserialize` function. By default, pickle is used. Objects, which can't
+    be serialized (`serialize` raises an exception), are kept in memory,
+    without breaking the FIFO order.
+
+    Temporary file is created inside the `directory` (system default temporary
+    directory if None) and it is deleted, when the queue is closed.
+    '''
+
+    _header = struct.Struct('>L')
+    _in_memory = 0xffffffff  # size of the record of the object kept in memory
+
+    def __init__(self, directory=None, buffer_size=100, serialize=None,
+                 deserialize=None):
+        super(DiskQueue, self).__init__()
+        self.directory = directory
+        self.buffer_size = max(1, buffer_size)
+        self.serialize = serialize or (lambda x: pickle.dumps(x, protocol=2))
+        self.deserialize = deserialize or pickle.loads
+        self.head = deque()
+        self.unserializable = deque()  # objects on "disk" kept in memory
+        self._file = None
+        self._read_offset = 0
+        self._write_offset = 0
+        self._num_on_disk = 0
+
+    def _push(self, value):
+        # once there is something on disk, all the new objects have to go there
+        # as well, otherwise FIFO order would be broken
+        if self._num_on_disk == 0 and len(self.head) < self.buffer_size:
+            self.head.append(value)
+            return
+        try:
+            data = self.serialize(value)
+        except Exception:
+            data = None
+        if self._file is None:
+            self._file = tempfile.TemporaryFile(dir=self.directory)
+        self._file.seek(self._write_offset)
+        if data is None:
+            # only the placeholder is written, to preserve the order
+            self._file.write(self._header.pack(self._in_memory))
+            self._write_offset += self._header.size
+            self.unserializable.append(value)
+        else:
+            self._file.write(self._header.pack(len(data)))
+            self._file.write(data)
+            self._write_offset += self._header.size + len(data)
+        self._num_on_disk += 1
+
+    def _peek(self):
+        return self.head[0]
+
+    def _pop(self):
+        result = self.head.popleft()
+        if not self.head and self._num_on_disk:
+            self._fill_head()
+        return result
+
+    def _close(self):
+        del self.head
+        del self.unserializable
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _fill_head(self):
+        '''Move up to `buffer_size` objects from the disk to the memory.'''
+        self._file.seek(self._read_offset)
+        count = min(self.buffer_size, self._num_on_disk)
+        for _ in xrange(count):
+            size, = self._header.unpack(self._file.read(self._header.size))
+            self._read_offset += self._header.size
+            if size == self._in_memory:
+                self.head.append(self.unserializable.popleft())
+            else:
+                self.head.append(self.deserialize(self._file.read(size)))
+                self._read_offset += size
+        self._num_on_disk -= count
+        # everything was read - reclaim the disk space
+        if self._num_on_disk == 0:
+            self._file.seek(0)
+            self._file.truncate()
+            self._read_offset = self._write_offset = 0
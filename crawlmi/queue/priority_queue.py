@@ -26,14 +26,18 @@ class PriorityQueue(Queue):
         self._inactive_queues = {}
 
     def _push(self, priority, value):
-        if priority not in self._active_queues:
-            self._heap.push(priority)
-            if priority in self._inactive_queues:
-                self._active_queues[priority] = self._inactive_queues[priority]
-                del self._inactive_queues[priority]
-            else:
-                self._active_queues[priority] = self.qfactory(priority)
-        self._active_queues[priority].push(value)
+        q = self._active_queues.get(priority)
+        if q is not None:
+            q.push(value)
+            return
+        q = self._inactive_queues.get(priority)
+        if q is None:
+            q = self._inactive_queues[priority] = self.qfactory(priority)
+        # activate the queue only after the value was stored
+        q.push(value)
+        del self._inactive_queues[priority]
+        self._active_queues[priority] = q
+        self._heap.push(priority)
 
     def _peek(self):
         top_priority = self._heap.peek()
@@ -4,18 +4,29 @@ class Queue(object):
         - keep track of the number of stored objects
         - forbid operations on closed queue
         - forbid peeking and popping from empty queue
+        - notify the push listeners about the newly pushed objects
     Child classes only need to implement _push, _peek, _pop and _close.
     '''
 
     def __init__(self):
         self._closed = False
         self._num_objects = 0
+        self._push_listeners = []
+
+    def add_push_listener(self, func):
+        '''Call `func` (without arguments) every time an object is pushed to
+        the queue.
+        '''
+        self._push_listeners.append(func)
 
     def push(self, *args, **kwargs):
         if self._closed:
             raise RuntimeError('pushing to already closed queue')
-        self._num_objects += 1
+        # count the object only after it was successfully stored
         self._push(*args, **kwargs)
+        self._num_objects += 1
+        for func in self._push_listeners:
+            func()
 
     def peek(self, *args, **kwargs):
         if self._closed:
@@ -36,6 +47,7 @@ class Queue(object):
         if self._closed:
             raise RuntimeError('closing already closed queue')
         self._closed = True
+        self._push_listeners = []
         self._close(*args, **kwargs)
 
     def __len__(self):
@@ -1,24 +1,50 @@
+import mmap
+
 from .memory_queue import MemoryQueue
 from crawlmi.http import Response
 
 
 class ResponseQueue(MemoryQueue):
-    def __init__(self, active_size_limit=0):
+    '''Queue of the downloaded responses. Downloader holds back, when the
+    bodies in the queue take at least `active_size_limit` bytes of memory.
+    Memory-mapped bodies (stored in the temporary files) are limited
+    separately - by `disk_size_limit` bytes and `disk_count_limit` open
+    files. Use 0 for no limit.
+    '''
+
+    def __init__(self, active_size_limit=0, disk_size_limit=0,
+                 disk_count_limit=0):
         super(ResponseQueue, self).__init__()
         self.active_size_limit = active_size_limit
         self.active_size = 0
+        self.disk_size_limit = disk_size_limit
+        self.disk_size = 0
+        self.disk_count_limit = disk_count_limit
+        self.disk_count = 0
 
     def _push(self, response):
         super(ResponseQueue, self)._push(response)
         if isinstance(response, Response):
-            self.active_size += len(response.body)
+            self._update_size(response, 1)
 
     def _pop(self):
         response = super(ResponseQueue, self)._pop()
         if isinstance(response, Response):
-            self.active_size -= len(response.body)
+            self._update_size(response, -1)
         return response
 
+    def _update_size(self, response, sign):
+        if isinstance(response.body, mmap.mmap):
+            self.disk_size += sign * len(response.body)
+            self.disk_count += sign
+        else:
+            self.active_size += sign * len(response.body)
+
     def needs_backout(self):
-        return (self.active_size_limit and
-                self.active_size >= self.active_size_limit)
+        return bool(
+            (self.active_size_limit and
+                self.active_size >= self.active_size_limit) or
+            (self.disk_size_limit and
+                self.disk_size >= self.disk_size_limit) or
+            (self.disk_count_limit and
+                self.disk_count >= self.disk_count_limit))
@@ -10,6 +10,16 @@ SPIDER_MODULES = []
 STATS_CLASS = 'crawlmi.stats.MemoryStats'
 STATS_DUMP = True
 
+# record the live Requests, Responses and Spiders (see crawlmi.utils.trackref)
+TRACK_REFS = False
+
+# detect the encoding of the responses, which don't declare it (needs chardet)
+ENCODING_AUTO_DETECT = False
+ENCODING_DETECT_SAMPLE_SIZE = 16384  # detection reads only so many first bytes
+# remember the encodings of so many hosts and use them for their responses,
+# which don't declare the encoding (0 to disable)
+ENCODING_HOST_CACHE_SIZE = 10000
+
 
 # Log settings
 
@@ -32,22 +42,61 @@ DOWNLOAD_HANDLER_SSL_METHODS = [SSL.SSLv3_METHOD, SSL.TLSv1_METHOD]
 
 DOWNLOAD_TIMEOUT = 180  # 3mins
 DOWNLOAD_SIZE_LIMIT = 0  # size limit of object to download (600KB is good option)
+# bodies bigger than this are streamed to a temporary file and exposed as
+# a read-only memory-mapped `response.body` (use 0 to keep all bodies in memory)
+DOWNLOAD_BODY_DISK_THRESHOLD = 0
+DOWNLOAD_BODY_DISK_DIR = None  # directory of the temporary files (None for system default)
+# decompress gzip and deflate bodies while downloading. DOWNLOAD_SIZE_LIMIT is
+# then applied to the decompressed size as well
+DOWNLOAD_DECOMPRESS = True
+
+# reuse the HTTP connections (keep-alive)
+CONNECTION_POOL_ENABLED = False
+CONNECTION_POOL_MAX_IDLE_PER_HOST = 2  # max number of idle connections per host
+CONNECTION_POOL_IDLE_TIMEOUT = 60  # close the connection idle for so many seconds
+
+# cache the DNS lookups of the downloaded hosts. The caching resolver is
+# installed to the reactor, while the engine is running
+DNS_CACHE_ENABLED = False
+DNS_CACHE_SIZE = 10000  # max number of cached hostnames
+DNS_CACHE_TTL = 300  # used, when the TTL of the DNS records is unknown
+DNS_CACHE_NEGATIVE_TTL = 60  # cache the failed lookups for so many seconds
+# query the name servers directly (twisted.names) to respect the records' TTL
+DNS_CACHE_USE_NAMESERVERS = False
+# resolve the hostnames of the requests waiting in the downloader in advance
+DNS_PREFETCH_ENABLED = False
+DNS_PREFETCH_CONCURRENCY = 2  # max number of prefetches running at once
 
 # sum of sizes of active responses. When exceeded, downloader holds back
 RESPONSE_ACTIVE_SIZE_LIMIT = 10000000
+# the same for the memory-mapped bodies (see DOWNLOAD_BODY_DISK_THRESHOLD):
+# sum of their sizes and number of their open temporary files
+RESPONSE_ACTIVE_DISK_SIZE_LIMIT = 1000000000
+RESPONSE_ACTIVE_DISK_COUNT_LIMIT = 100
 
 CONCURRENT_REQUESTS = 16
 CONCURRENT_REQUESTS_PER_DOMAIN = 8  # use 0 not to limit requests per domain
+# max number of requests waiting in the per-domain queues of the downloader
+DOWNLOADER_QUEUE_SIZE = 1000
+# max number of responses processed by pipeline and spider at the same time
+CONCURRENT_RESPONSES = 8
 
 DOWNLOAD_DELAY = 0
 RANDOMIZE_DOWNLOAD_DELAY = True
 
+# store the requests waiting to be downloaded on disk, instead of in memory
+REQUEST_QUEUE_DISK_ENABLED = False
+REQUEST_QUEUE_DISK_DIR = 'requests'
+# number of requests per priority kept in memory, when using disk queue
+REQUEST_QUEUE_DISK_BUFFER_SIZE = 100
+
 
 # Extensions
 
 EXTENSIONS_BASE = {
     'crawlmi.middleware.extensions.core_stats.CoreStats': 0,
     'crawlmi.middleware.extensions.log_stats.LogStats': 0,
+    'crawlmi.middleware.extensions.dns_cache.DnsCache': 0,
     'crawlmi.middleware.extensions.save_response.SaveResponse': 0,
 }
 EXTENSIONS = {}
@@ -87,12 +136,27 @@ DEFAULT_REQUEST_HEADERS = {
 }
 
 DUPLICATE_FILTER_ENABLED = False
+DUPLICATE_FILTER_STORE = 'crawlmi.utils.fingerprint_store.PackedFingerprintStore'
+# initial number of fingerprints the stores are sized for
+DUPLICATE_FILTER_CAPACITY = 10000
+# PackedFingerprintStore keeps so many bytes (4-20) of every fingerprint
+DUPLICATE_FILTER_DIGEST_SIZE = 8
+# probability of BloomFingerprintStore reporting the new request as duplicate
+DUPLICATE_FILTER_ERROR_RATE = 0.0001
+# save the fingerprints to this dir (relative to DATA_DIR) and load them in
+# the next run. None to disable.
+DUPLICATE_FILTER_DIR = None
+# save the fingerprints every so many seconds (0 to save only on stop)
+DUPLICATE_FILTER_CHECKPOINT_INTERVAL = 300
 
 FILTER_NONTEXT_RESPONSE = False  # filter all binary responses (images, pdfs, etc.)
 FILTER_SCHEMES = ['mailto', 'ftp']
 FILTER_URL_LENGTH_LIMIT = 2083  # uses IE limit
 FILTER_NON_200_RESPONSE_STATUS = False  # filter all non-200 responses
 FILTER_RESPONSE_STATUS = lambda status_code: False  # if True, filter the response
+# check the responses as soon as their headers are received and don't download
+# the bodies of the filtered ones
+FILTER_ON_HEADERS = True
 
 HTTP_CACHE_ENABLED = False
 HTTP_CACHE_DIR = 'httpcache'
@@ -103,6 +167,20 @@ HTTP_CACHE_IGNORE_NON_200_STATUS = True
 HTTP_CACHE_IGNORE_STATUS = lambda status_code: False  # if True, don't cache the response
 HTTP_CACHE_IGNORE_SCHEMES = ['file']
 HTTP_CACHE_DBM_MODULE = 'anydbm'
+# number of threads doing the cache storage I/O. Use 0 to access the storage
+# synchronously from the reactor thread
+HTTP_CACHE_THREADS = 1
+HTTP_CACHE_WRITE_BATCH = 100  # stored responses are written in such batches
+# max number of buffered responses waiting to be written
+HTTP_CACHE_WRITE_QUEUE_SIZE = 1000
+# keep the recently used cached responses of so many bytes in memory (0 to disable)
+HTTP_CACHE_MEMORY_SIZE = 0
+# SqliteCacheStorage commits the changes after so many stored responses
+HTTP_CACHE_SQLITE_COMMIT_BATCH = 100
+# LogCacheStorage starts a new segment file after so many bytes
+HTTP_CACHE_LOG_SEGMENT_SIZE = 256 * 1024 * 1024
+# LogCacheStorage is compacted on open, when such part of it is not used (0 to disable)
+HTTP_CACHE_LOG_COMPACT_RATIO = 0.5
 HTTP_CACHE_POLICY = 'crawlmi.middleware.pipelines.http_cache.policy.DummyPolicy'
 
 RANDOM_USER_AGENT_LIST = []
@@ -19,6 +19,10 @@ engine_stopped = Signal('engine_stopped')
 # invoked when the request successfully passes through downloader pipeline.
 # args: request
 request_received = Signal('request_received')
+# invoked when the downloader takes the request from the request_queue. The
+# request is downloaded soon - it waits only in the per-domain queue.
+# args: request
+request_scheduled = Signal('request_scheduled')
 # invoked when the response was successfully downloaded and is popped out of
 # the response_queue
 # args: response
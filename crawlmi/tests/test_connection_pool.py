@@ -0,0 +1,78 @@
+from twisted.test.proto_helpers import StringTransport
+from twisted.trial import unittest
+
+from crawlmi.core.connection_pool import ConnectionPool
+from crawlmi.utils.clock import Clock
+
+
+class MockProtocol(object):
+    def __init__(self):
+        self.transport = StringTransport()
+
+
+class ConnectionPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        self.pool = ConnectionPool(max_idle_per_key=2, idle_timeout=10,
+                                   clock=self.clock)
+
+    def test_basic(self):
+        self.assertIsNone(self.pool.get_connection('a'))
+        p1, p2 = MockProtocol(), MockProtocol()
+        self.pool.put_connection('a', p1)
+        self.pool.put_connection('a', p2)
+        self.assertEqual(len(self.pool), 2)
+        self.assertIsNone(self.pool.get_connection('b'))
+        # the most recently used connection is returned first
+        self.assertIs(self.pool.get_connection('a'), p2)
+        self.assertIs(self.pool.get_connection('a'), p1)
+        self.assertIsNone(self.pool.get_connection('a'))
+        self.assertEqual(len(self.pool), 0)
+        self.assertFalse(p1.transport.disconnecting)
+        # reused connections don't expire
+        self.clock.advance(20)
+        self.assertFalse(p1.transport.disconnecting)
+        self.assertFalse(p2.transport.disconnecting)
+
+    def test_max_idle(self):
+        protocols = [MockProtocol() for _ in xrange(3)]
+        for p in protocols:
+            self.pool.put_connection('a', p)
+        self.assertEqual(len(self.pool), 2)
+        self.assertTrue(protocols[2].transport.disconnecting)
+        self.pool.put_connection('b', MockProtocol())
+        self.assertEqual(len(self.pool), 3)
+
+    def test_idle_timeout(self):
+        p1, p2 = MockProtocol(), MockProtocol()
+        self.pool.put_connection('a', p1)
+        self.clock.advance(5)
+        self.pool.put_connection('a', p2)
+        self.clock.advance(5)
+        self.assertTrue(p1.transport.disconnecting)
+        self.assertFalse(p2.transport.disconnecting)
+        self.assertEqual(len(self.pool), 1)
+        self.clock.advance(5)
+        self.assertTrue(p2.transport.disconnecting)
+        self.assertEqual(len(self.pool), 0)
+
+    def test_remove_connection(self):
+        p1, p2 = MockProtocol(), MockProtocol()
+        self.pool.put_connection('a', p1)
+        self.pool.put_connection('a', p2)
+        self.pool.remove_connection('a', p2)
+        self.pool.remove_connection('b', p2)
+        self.assertEqual(len(self.pool), 1)
+        self.assertIs(self.pool.get_connection('a'), p1)
+        self.pool.remove_connection('a', p1)
+        self.assertEqual(len(self.pool), 0)
+
+    def test_close(self):
+        p1, p2 = MockProtocol(), MockProtocol()
+        self.pool.put_connection('a', p1)
+        self.pool.put_connection('b', p2)
+        self.pool.close()
+        self.assertTrue(p1.transport.disconnecting)
+        self.assertTrue(p2.transport.disconnecting)
+        self.assertEqual(len(self.pool), 0)
+        self.assertEqual(self.clock.getDelayedCalls(), [])
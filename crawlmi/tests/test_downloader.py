@@ -63,6 +63,13 @@ class DownloaderSlotTest(unittest.TestCase):
                          self.default_delay, self.default_randomize_delay,
                          clock=self.clock)
 
+    def _download_ready(self):
+        '''Start downloading as many requests as the slot allows.'''
+        while self.slot.get_ready_time() is not None:
+            if self.slot.get_ready_time() > self.clock.seconds():
+                break
+            self.slot.download_next()
+
     def test_basic(self):
         received = []
         def downloaded(result):
@@ -72,20 +79,30 @@ class DownloaderSlotTest(unittest.TestCase):
         r1, dfd1 = get_request('1', func=downloaded)
         self.slot.enqueue(r1, dfd1)
         self.assertEqual(len(self.slot.in_progress), 1)
+        self.assertEqual(len(self.slot.transferring), 0)
+        self.assertEqual(self.slot.get_ready_time(), 0)
+        self._download_ready()
         self.assertEqual(len(self.slot.transferring), 1)
+        self.assertIsNone(self.slot.get_ready_time())
         r2, dfd2 = get_request('2', func=downloaded)
         r3, dfd3 = get_request('3', func=downloaded)
         self.slot.enqueue(r2, dfd2)
         self.slot.enqueue(r3, dfd3)
+        self._download_ready()
         self.assertEqual(len(self.slot.in_progress), 3)
         self.assertEqual(len(self.slot.transferring), 2)
         self.assertEqual(self.slot.free_slots, 0)
+        # slot is full
+        self.assertIsNone(self.slot.get_ready_time())
 
         # download r2
         self.handler.call(r2, Response(''))
         self.assertIs(received[-1].request, r2)
-        self.assertEqual(len(self.slot.transferring), 2)
+        self.assertEqual(len(self.slot.transferring), 1)
         self.assertEqual(len(self.slot.in_progress), 2)
+        self.assertEqual(self.slot.free_slots, 1)
+        self.assertEqual(self.slot.get_ready_time(), 0)
+        self._download_ready()
         self.assertEqual(self.slot.free_slots, 0)
 
         # download r1 and r3
@@ -99,6 +116,7 @@ class DownloaderSlotTest(unittest.TestCase):
         self.clock.advance(5)
         self.assertEqual(len(self.slot.in_progress), 0)
         self.assertEqual(self.slot.free_slots, 2)
+        self.assertIsNone(self.slot.get_ready_time())
 
     def test_delay(self):
         self.slot.concurrency = 1
@@ -112,33 +130,32 @@ class DownloaderSlotTest(unittest.TestCase):
         self.slot.enqueue(r2, dfd2)
         r3, dfd3 = get_request('3')
         self.slot.enqueue(r3, dfd3)
+        self._download_ready()
         self.assertEqual(len(self.slot.in_progress), 3)
         self.assertEqual(len(self.slot.transferring), 1)
         self.assertEqual(self.slot.last_download_time, 10)
-        self.assertEqual(self.slot.delayed_processing.get_time(), 15)
+        self.assertIsNone(self.slot.get_ready_time())
 
         # download the 1st request
         self.handler.call(r1, Response(''))
         self.assertEqual(len(self.slot.in_progress), 2)
         self.assertEqual(len(self.slot.transferring), 0)
         self.assertEqual(self.slot.free_slots, 1)
+        self.assertEqual(self.slot.get_ready_time(), 15)
         # we should still wait
         self.clock.advance(3)
+        self._download_ready()
         self.assertEqual(len(self.slot.in_progress), 2)
         self.assertEqual(len(self.slot.transferring), 0)
         self.assertEqual(self.slot.free_slots, 1)
         # make the 2nd request downloading
         self.clock.advance(3)
+        self._download_ready()
         self.assertEqual(len(self.slot.in_progress), 2)
         self.assertEqual(len(self.slot.transferring), 1)
         self.assertEqual(self.slot.free_slots, 0)
         self.assertEqual(self.slot.last_download_time, 16)
-        self.assertEqual(self.slot.delayed_processing.get_time(), 21)
-        # wait and nothing happens
-        self.clock.advance(10)
-        self.assertEqual(len(self.slot.in_progress), 2)
-        self.assertEqual(len(self.slot.transferring), 1)
-        self.assertFalse(self.slot.delayed_processing.is_scheduled())
+        self.assertEqual(self.slot.next_download_time, 21)
 
     def test_random_delay(self):
         self.slot.delay = 5
@@ -170,10 +187,12 @@ class DownloaderSlotTest(unittest.TestCase):
         self.slot.enqueue(r2, dfd2)
         r3, dfd3 = get_request('3', func=downloaded)
         self.slot.enqueue(r3, dfd3)
+        self._download_ready()
         # fail the first request
         err = ValueError('my bad')
         self.handler.fail(r1, err)
         self.assertEqual(received[-1].value, err)
+        self._download_ready()
         # other requests should be ok
         self.assertEqual(len(self.slot.in_progress), 2)
         self.assertEqual(len(self.slot.transferring), 2)
@@ -188,6 +207,7 @@ class DownloaderSlotTest(unittest.TestCase):
         self.slot.download_handler = ExceptionDownloaderHandler(Settings())
         r1, dfd1 = get_request('1')
         self.slot.enqueue(r1, dfd1)
+        self._download_ready()
         return self.assertFailure(dfd1, Exception)
 
     def test_failure(self):
@@ -200,6 +220,7 @@ class DownloaderSlotTest(unittest.TestCase):
             r, dfd = get_request(str(i))
             dfd.addBoth(downloaded)
             self.slot.enqueue(r, dfd)
+            self._download_ready()
 
         self.assertEqual(len(download_values), 2)
         self.assertIsInstance(download_values[0], Failure)
@@ -212,6 +233,7 @@ class DownloaderTest(unittest.TestCase):
     default_settings = {
         'CONCURRENT_REQUESTS': 2,
         'CONCURRENT_REQUESTS_PER_DOMAIN': 1,
+        'DOWNLOADER_QUEUE_SIZE': 1000,
         'DOWNLOAD_DELAY': 0,
         'RANDOMIZE_DOWNLOAD_DELAY': False}
 
@@ -230,7 +252,7 @@ class DownloaderTest(unittest.TestCase):
         '''
         new_settings = self.default_settings.copy()
         new_settings.update(**kwargs)
-        self.dwn.processing.cancel()
+        self.dwn.close()
         self.dwn = Downloader(Settings(new_settings), self.request_queue, self.response_queue,
                               download_handler=MockDownloaderHandler(Settings()),
                               clock=self.clock)
@@ -291,9 +313,12 @@ class DownloaderTest(unittest.TestCase):
         self.clock.advance(0)
         self.assertEqual(self.dwn.free_slots, 0)
         self.assertFalse(self.dwn.is_idle())
+        # the rest of the requests wait in the request queue
+        self.assertEqual(len(self.request_queue), 3)
+        self.assertEqual(self.dwn.num_in_progress, 2)
         # no more requests are scheduled, until download is finished
         self.clock.advance(20)
-        self.assertEqual(len(self.request_queue), 3)
+        self.assertEqual(self.dwn.free_slots, 0)
         # download the first request
         self.handler.call(requests[0], Response('hello'))
         self.assertEqual(self.dwn.free_slots, 1)  # slot is immediately available
@@ -301,25 +326,126 @@ class DownloaderTest(unittest.TestCase):
         result = self.response_queue.peek()
         self.assertIs(result.request, requests[0])
         self.assertEqual(result.url, 'hello')
-        # enqueue third request
-        self.clock.advance(Downloader.QUEUE_CHECK_FREQUENCY)
+        # start downloading third request
+        self.clock.advance(0)
         self.assertEqual(self.dwn.free_slots, 0)
         # download second request
         self.handler.call(requests[1], Response(''))
-        # enqueue fourth request
-        self.clock.advance(Downloader.QUEUE_CHECK_FREQUENCY)
+        # fifth request is downloaded before the fourth one, because domain
+        # `a` is still busy
+        self.clock.advance(0)
         self.assertEqual(self.dwn.free_slots, 0)
-        # fourth request should not begin download, until 3rd request is done
         self.assertRaises(KeyError, self.handler.call, requests[3], Response(''))
+        self.handler.call(requests[4], Response(''))
         # finish
         self.handler.call(requests[2], Response(''))
+        self.clock.advance(0)
         self.handler.call(requests[3], Response(''))
-        self.clock.advance(Downloader.QUEUE_CHECK_FREQUENCY)
-        self.handler.call(requests[4], Response(''))
         # final checks
         self.clock.pump([1] * 10)
         self.assertEqual(len(self.response_queue), 5)
         self.assertTrue(self.dwn.is_idle())
+        self.assertEqual(self.dwn.free_slots, 2)
+
+    def test_head_of_line_blocking(self):
+        # requests from the busy domain don't block the others
+        requests = [get_request(id)[0] for id in 'aaab']
+        map(lambda r: self.request_queue.push(r), requests)
+        self.clock.advance(0)
+        self.assertEqual(self.dwn.free_slots, 0)
+        self.handler.call(requests[3], Response(''))
+        self.assertIs(self.response_queue.pop().request, requests[3])
+        # only one request from domain `a` can be downloaded at the time
+        self.clock.advance(0)
+        self.assertEqual(self.dwn.free_slots, 1)
+        self.assertRaises(KeyError, self.handler.call, requests[1], Response(''))
+
+    def test_queue_size(self):
+        self._update_dwn(DOWNLOADER_QUEUE_SIZE=3)
+        requests = [get_request(id)[0] for id in 'aaabc']
+        map(lambda r: self.request_queue.push(r), requests)
+        self.clock.advance(0)
+        # requests are taken only until the concurrency is used
+        self.assertEqual(self.dwn.num_in_progress, 4)
+        self.assertEqual(len(self.request_queue), 1)
+        self.assertEqual(self.dwn.free_slots, 0)
+        # `b` doesn't wait behind `a`
+        self.handler.call(requests[3], Response(''))
+        self.assertRaises(KeyError, self.handler.call, requests[1], Response(''))
+        self.clock.advance(0)
+        self.handler.call(requests[4], Response(''))
+
+    def test_queue_size_limit(self):
+        self._update_dwn(DOWNLOADER_QUEUE_SIZE=2)
+        requests = [get_request(id)[0] for id in 'aaaab']
+        map(lambda r: self.request_queue.push(r), requests)
+        self.clock.advance(0)
+        # only 2 requests wait in the slot of the busy domain
+        self.assertEqual(self.dwn.num_in_progress, 3)
+        self.assertEqual(len(self.request_queue), 2)
+        self.assertEqual(self.dwn.free_slots, 1)
+
+    def test_enqueue_listener(self):
+        self._update_dwn(DOWNLOADER_QUEUE_SIZE=2)
+        enqueued = []
+        self.dwn.add_enqueue_listener(enqueued.append)
+        requests = [get_request(id)[0] for id in 'aaaab']
+        map(lambda r: self.request_queue.push(r), requests)
+        self.clock.advance(0)
+        # only the requests taken from the request queue
+        self.assertListEqual(enqueued, requests[:3])
+
+    def test_delay(self):
+        self._update_dwn(DOWNLOAD_DELAY=5)
+        requests = [get_request(id)[0] for id in 'ab']
+        self.clock.advance(10)
+        map(lambda r: self.request_queue.push(r), requests)
+        self.clock.advance(0)
+        self.handler.call(requests[0], Response(''))
+        # downloader wakes up, when the delay is over
+        self.clock.advance(4)
+        self.assertRaises(KeyError, self.handler.call, requests[1], Response(''))
+        self.clock.advance(1)
+        self.handler.call(requests[1], Response(''))
+        self.assertEqual(len(self.response_queue), 2)
+
+    def test_wake_up(self):
+        requests = [get_request(id)[0] for id in 'abc']
+        self.clock.advance(0)
+        # new request is downloaded in the next reactor loop
+        self.request_queue.push(requests[0])
+        self.request_queue.push(requests[1])
+        self.request_queue.push(requests[2])
+        self.assertEqual(self.dwn.free_slots, 2)
+        self.clock.advance(0)
+        self.assertEqual(self.dwn.free_slots, 0)
+        self.assertEqual(len(self.request_queue), 1)
+        # finished download wakes up the downloader
+        self.handler.call(requests[0], Response(''))
+        self.clock.advance(0)
+        self.assertEqual(self.dwn.free_slots, 0)
+        self.handler.call(requests[2], Response(''))
+
+    def test_wake_up_during_delay(self):
+        self._update_dwn(DOWNLOAD_DELAY=5)
+        requests = [get_request(id)[0] for id in 'abc']
+        self.clock.advance(10)
+        self.request_queue.push(requests[0])
+        self.clock.advance(0)
+        self.handler.call(requests[0], Response(''))
+        self.clock.advance(1)
+        # processing waits for the slot's delay
+        self.request_queue.push(requests[1])
+        self.clock.advance(0)
+        self.assertEqual(self.dwn.wake_processing.get_time(), 15)
+        # the push wakes it up right away
+        self.request_queue.push(requests[2])
+        self.assertEqual(self.dwn.wake_processing.get_time(), 11)
+        self.clock.advance(0)
+        # delay is still respected
+        self.assertRaises(KeyError, self.handler.call, requests[1], Response(''))
+        self.clock.advance(4)
+        self.handler.call(requests[1], Response(''))
 
     def test_close(self):
         req1 = get_request('a')[0]
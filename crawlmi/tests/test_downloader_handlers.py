@@ -1,6 +1,8 @@
 import os
 
 from twisted.internet import reactor, defer, error
+from twisted.internet.protocol import ServerFactory
+from twisted.protocols.basic import LineReceiver
 from twisted.protocols.policies import WrappingFactory
 from twisted.python.filepath import FilePath
 from twisted.trial import unittest
@@ -145,6 +147,85 @@ class HttpTest(unittest.TestCase):
         yield self.assertFailure(d, DownloadSizeError)
 
 
+class KeepAliveServer(LineReceiver):
+    '''Respond to every request with its path and keep the connection
+    alive.
+    '''
+
+    def connectionMade(self):
+        self.factory.connections += 1
+        self.path = None
+
+    def lineReceived(self, line):
+        if self.path is None:
+            self.path = line.split()[1]
+        elif not line:
+            self.transport.write('HTTP/1.1 200 OK\r\nConnection: keep-alive\r\n'
+                                 'Content-Length: %d\r\n\r\n%s' %
+                                 (len(self.path), self.path))
+            self.path = None
+
+
+class KeepAliveTest(unittest.TestCase):
+
+    def setUp(self):
+        factory = ServerFactory()
+        factory.protocol = KeepAliveServer
+        factory.connections = 0
+        self.factory = factory
+        self.port = reactor.listenTCP(0, factory, interface='127.0.0.1')
+        self.portno = self.port.getHost().port
+        self.download_handler = HttpDownloadHandler(Settings({
+            'CONNECTION_POOL_ENABLED': True,
+            'CONNECTION_POOL_MAX_IDLE_PER_HOST': 2,
+            'CONNECTION_POOL_IDLE_TIMEOUT': 10}))
+        self.download_request = self.download_handler.download_request
+
+    @defer.inlineCallbacks
+    def tearDown(self):
+        self.download_handler.close()
+        yield self.port.stopListening()
+
+    def getURL(self, path):
+        return 'http://127.0.0.1:%d/%s' % (self.portno, path)
+
+    @defer.inlineCallbacks
+    def test_reuse(self):
+        for path in ['a', 'b', 'c']:
+            response = yield self.download_request(Request(self.getURL(path)))
+            self.assertEqual(response.body, '/' + path)
+        self.assertEqual(self.factory.connections, 1)
+        self.assertEqual(len(self.download_handler.pool), 1)
+
+    @defer.inlineCallbacks
+    def test_stale_connection(self):
+        response = yield self.download_request(Request(self.getURL('a')))
+        self.assertEqual(len(self.download_handler.pool), 1)
+        # connection is closed, before the client notices it
+        pool = self.download_handler.pool
+        key = pool._idle.keys()[0]
+        protocol = pool.get_connection(key)
+        protocol.transport.loseConnection()
+        pool.put_connection(key, protocol)
+        response = yield self.download_request(Request(self.getURL('b')))
+        self.assertEqual(response.body, '/b')
+        self.assertEqual(self.factory.connections, 2)
+
+    @defer.inlineCallbacks
+    def test_stale_connection_post(self):
+        response = yield self.download_request(Request(self.getURL('a')))
+        pool = self.download_handler.pool
+        key = pool._idle.keys()[0]
+        protocol = pool.get_connection(key)
+        protocol.transport.loseConnection()
+        pool.put_connection(key, protocol)
+        # POST is not repeated - the server could have processed it already
+        request = Request(self.getURL('b'), method='POST')
+        yield self.assertFailure(self.download_request(request),
+                                 error.ConnectionDone, error.ConnectionLost)
+        self.assertEqual(self.factory.connections, 1)
+
+
 class UriResource(resource.Resource):
     '''Return the full uri that was requested'''
 
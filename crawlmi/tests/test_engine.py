@@ -1,3 +1,8 @@
+from functools import partial
+import shutil
+import tempfile
+
+from twisted.internet import defer
 from twisted.python.failure import Failure
 from twisted.trial import unittest
 
@@ -8,7 +13,7 @@ from crawlmi.exceptions import DontStopEngine, StopEngine
 from crawlmi.http import Request, Response
 from crawlmi.middleware.extension_manager import ExtensionManager
 from crawlmi.middleware.pipeline_manager import PipelineManager
-from crawlmi.queue import PriorityQueue, MemoryQueue
+from crawlmi.queue import DiskQueue, PriorityQueue, MemoryQueue
 from crawlmi.settings import EngineSettings
 from crawlmi.spider import BaseSpider
 from crawlmi.stats import MemoryStats
@@ -62,9 +67,13 @@ class EngineTest(unittest.TestCase):
     def setUp(self):
         self.engine = get_engine(
             LOG_ENABLED=False,
+            DNS_CACHE_ENABLED=False,
             PIPELINE_BASE={'crawlmi.tests.test_engine.Pipeline': 10})
         self.clock = self.engine.clock
         self.engine.setup()
+        # downloader is woken up by the pushes to request_queue. Close it, so
+        # that the requests stay in the queue and are not really downloaded
+        self.engine.downloader.close()
         self.sp = SignalProcessor(self.engine)
         self.pipeline = Pipeline.obj
 
@@ -108,6 +117,8 @@ class EngineTest(unittest.TestCase):
 
     def test_download(self):
         self.engine.start()
+        # don't process the responses pushed to response_queue
+        self.engine.pause()
         del self.sp.received[:]
 
         req = Request('http://github.com/')
@@ -180,6 +191,64 @@ class EngineTest(unittest.TestCase):
                             signals.failure_received,
                             signals.spider_error])
 
+    def test_concurrent_responses(self):
+        dfds = []
+
+        def _callback(response):
+            dfd = defer.Deferred()
+            dfds.append(dfd)
+            return dfd
+
+        self.engine.concurrent_responses = 2
+        self.engine.start()
+        self.clock.advance(0)
+        for i in xrange(3):
+            req = Request('http://github.com/', callback=_callback)
+            self.engine.response_queue.push(Response('', request=req))
+        self.clock.pump([0, 0, 0])
+        # only two responses are processed at the same time
+        self.assertEqual(len(dfds), 2)
+        self.assertEqual(len(self.engine.response_queue), 1)
+        self.assertEqual(self.engine.responses_in_progress, 2)
+        self.assertEqual(
+            self.engine.stats.get_value('engine/responses_in_progress'), 2)
+
+        dfds[1].callback(None)
+        self.clock.pump([0, 0, 0])
+        self.assertEqual(len(dfds), 3)
+        self.assertEqual(len(self.engine.response_queue), 0)
+        self.assertEqual(self.engine.responses_in_progress, 2)
+
+        dfds[0].callback(None)
+        dfds[2].callback(None)
+        self.assertEqual(self.engine.responses_in_progress, 0)
+        self.assertEqual(
+            self.engine.stats.get_value('engine/responses_in_progress'), 0)
+        self.assertEqual(
+            self.engine.stats.get_value('engine/max_responses_in_progress'), 2)
+
+    def test_wake_up(self):
+        self.engine.start()
+        self.clock.advance(0)
+        del self.sp.received[:]
+
+        # response is processed immediately, not after QUEUE_CHECK_FREQUENCY
+        req = Request('http://github.com/')
+        self.engine.response_queue.push(Response('', request=req))
+        self.clock.pump([0, 0])
+        self.check_signals([signals.response_downloaded,
+                            signals.response_received])
+
+        # paused engine is not woken up
+        self.engine.pause()
+        self.engine.response_queue.push(Response('', request=req))
+        self.clock.pump([0, 0])
+        self.check_signals([])
+        self.engine.unpause()
+        self.clock.pump([0, 0])
+        self.check_signals([signals.response_downloaded,
+                            signals.response_received])
+
     def test_idle(self):
         def _spider_idle_exception():
             raise DontStopEngine()
@@ -232,18 +301,71 @@ class EngineTest(unittest.TestCase):
         def _stop_engine(response):
             raise StopEngine()
 
-        def _engine_stopped():
-            self.assertEqual(len(self.engine.response_queue), 1)
+        def _parse(response):
+            parsed.append(response)
+        parsed = []
+
+        # process responses one by one
+        self.engine.concurrent_responses = 1
 
         req1 = Request('http://github.com/', callback=_stop_engine)
         resp1 = Response('', request=req1)
         self.engine.response_queue.push(resp1)
-        req2 = Request('http://github.com/')
+        req2 = Request('http://github.com/', callback=_parse)
         resp2 = Response('', request=req2)
         self.engine.response_queue.push(resp2)
 
-        self.engine.signals.connect(_engine_stopped, signal=signals.engine_stopped)
         self.engine.start()
         self.assertTrue(self.engine.running)
         self.clock.pump([self.engine.QUEUE_CHECK_FREQUENCY, 0, 0, 0])
         self.assertFalse(self.engine.running)
+        # second response was not processed
+        self.clock.pump([0, 0, 0])
+        self.assertListEqual(parsed, [])
+
+
+class EngineDiskQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.engine = get_engine(
+            LOG_ENABLED=False,
+            REQUEST_QUEUE_DISK_ENABLED=True,
+            REQUEST_QUEUE_DISK_DIR=self.tmpdir,
+            REQUEST_QUEUE_DISK_BUFFER_SIZE=1)
+        self.engine.setup()
+
+    def tearDown(self):
+        self.engine.request_queue.close()
+        shutil.rmtree(self.tmpdir)
+
+    def test_disk_queue(self):
+        spider = self.engine.spider
+        q = self.engine.request_queue
+        q.push(0, Request('http://github.com/1/'))
+        q.push(0, Request('http://github.com/2/', callback=spider.parse,
+                          meta={'a': 1}))
+        self.assertIsInstance(q._active_queues[0], DiskQueue)
+        self.assertEqual(q._active_queues[0]._num_on_disk, 1)
+        self.assertEqual(q.pop().url, 'http://github.com/1/')
+        req = q.pop()
+        self.assertEqual(req.url, 'http://github.com/2/')
+        self.assertEqual(req.callback, spider.parse)
+        self.assertDictEqual(req.meta, {'a': 1})
+
+    def test_disk_queue_unserializable(self):
+        spider = self.engine.spider
+        q = self.engine.request_queue
+        q.push(0, Request('http://github.com/1/'))
+        # callback, which is not the spider's method
+        q.push(0, Request('http://github.com/2/',
+                          callback=partial(spider.parse)))
+        # meta, which can't be pickled
+        q.push(0, Request('http://github.com/3/', meta={'f': lambda x: x}))
+        q.push(0, Request('http://github.com/4/'))
+        self.assertEqual(len(q), 4)
+        self.assertEqual(len(q._active_queues[0]), 4)
+        self.assertListEqual([q.pop().url for _ in xrange(4)],
+                             ['http://github.com/1/', 'http://github.com/2/',
+                              'http://github.com/3/', 'http://github.com/4/'])
+        self.assertEqual(len(q), 0)
+        self.assertRaises(IndexError, q.pop)
@@ -0,0 +1,63 @@
+import re
+
+from twisted.trial import unittest
+
+from crawlmi.extractor import BaseLinkExtractor
+from crawlmi.extractor.base_link_extractor import _combine_regexes, _DomainTrie
+
+
+class BaseLinkExtractorTest(unittest.TestCase):
+    def test_combine_regexes(self):
+        regexs = [re.compile(r'/item/(\d+)'), re.compile(r'\?page=')]
+        combined = _combine_regexes(regexs)
+        self.assertIsNot(combined, None)
+        self.assertTrue(combined.search('http://a.com/item/12'))
+        self.assertTrue(combined.search('http://a.com/?page=2'))
+        self.assertFalse(combined.search('http://a.com/about'))
+
+        self.assertIs(_combine_regexes([]), None)
+        self.assertIs(_combine_regexes(regexs[:1]), regexs[0])
+        # different flags, backreferences and inline flags
+        self.assertIs(_combine_regexes(
+            [re.compile('a'), re.compile('b', re.I)]), None)
+        self.assertIs(_combine_regexes(
+            [re.compile(r'(a)\1'), re.compile('b')]), None)
+        self.assertIs(_combine_regexes(
+            [re.compile('(?i)a'), re.compile('b')]), None)
+
+    def test_domain_trie(self):
+        trie = _DomainTrie(['example.com', 'Other.org', 'a.b.net'])
+        for host in ['example.com', 'www.example.com', 'a.b.example.com',
+                     'other.org', 'a.b.net', 'x.a.b.net']:
+            self.assertTrue(trie.match(host), host)
+        for host in ['', 'com', 'myexample.com', 'example.com.cz', 'b.net',
+                     'example.com:8080']:
+            self.assertFalse(trie.match(host), host)
+
+    def test_url_allowed(self):
+        lx = BaseLinkExtractor(allow=[r'/item/', re.compile(r'/cat/\d+')],
+                               deny=[r'\?print', r'(x)\1'],
+                               allow_domains=['Example.com', 'example.org'],
+                               deny_domains=['private.example.com'])
+        self.assertIs(lx._deny_re, None)
+        allowed = ['http://example.com/item/1', 'https://www.example.org/cat/2',
+                   'http://EXAMPLE.com/item/a.html;jsessionid=1',
+                   'http://example.com/item/;a.pdf/b']
+        denied = ['ftp://example.com/item/1', 'http://m.example.com/item/1',
+                  'http://example.com/about', 'http://example.com/item/1?print',
+                  'http://example.com/item/xx', 'http://example.net/item/1',
+                  'http://private.example.com/item/1',
+                  'http://example.com/item/a.pdf',
+                  'http://example.com/item/a.PDF;jsessionid=1']
+        for url in allowed:
+            self.assertTrue(lx.url_allowed(url), url)
+        for url in denied:
+            self.assertFalse(lx.url_allowed(url), url)
+        self.assertListEqual(lx.filter_urls(denied + allowed), allowed)
+
+    def test_compile_rules(self):
+        lx = BaseLinkExtractor(allow_domains=['example.com'])
+        self.assertFalse(lx.url_allowed('http://example.org/'))
+        lx.allow_domains.add('example.org')
+        lx._compile_rules()
+        self.assertTrue(lx.url_allowed('http://example.org/'))
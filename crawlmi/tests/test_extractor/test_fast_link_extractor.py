@@ -0,0 +1,44 @@
+from crawlmi.extractor import Link, FastLinkExtractor, LxmlLinkExtractor
+from crawlmi.http import HtmlResponse
+from crawlmi.tests import get_testdata
+from crawlmi.tests.test_extractor import test_lxml_link_extractor
+
+
+class FastLinkExtractorTest(test_lxml_link_extractor.LxmlLinkExtractorTest):
+    extractor_class = FastLinkExtractor
+
+    def test_skipped_content(self):
+        html = '''<html><head><script>var a = '<a href="script.html">';</script>
+        <style>a[href="<a href=style.html>"] {}</style></head>
+        <body><!-- <a href="comment.html">Comment</a> -->
+        <A HREF=upper.html REL=nofollow>Upper &amp; case</A>
+        <a title="a > b" href='quoted.html' href="repeated.html">Quoted</a>
+        <a href="entity.html?a=1&amp;b=2">Entity<b>bold</b></a>
+        <link rel="stylesheet" href="style.css">
+        </body></html>'''
+        response = HtmlResponse('http://example.org/', body=html)
+        lx = self.extractor_class(deny_extensions=[])
+        self.assertListEqual(lx.extract_links(response), [
+            Link(url='http://example.org/upper.html', text=u'Upper & case', nofollow=True),
+            Link(url='http://example.org/quoted.html', text=u'Quoted'),
+            Link(url='http://example.org/entity.html?a=1&b=2', text=u'Entity'),
+            Link(url='http://example.org/style.css', text=u''),
+        ])
+        self.assertListEqual(lx.extract_links(response),
+                             LxmlLinkExtractor(deny_extensions=[]).extract_links(response))
+
+    def test_same_as_lxml(self):
+        for name in ['sgml_linkextractor.html', 'linkextractor_noenc.html',
+                     'linkextractor_latin1.html', 'linkextractor_fallback.html']:
+            body = get_testdata('link_extractor', name)
+            response = HtmlResponse('http://example.com/a/', body=body)
+            self.assertListEqual(
+                FastLinkExtractor(unique=False).extract_links(response),
+                LxmlLinkExtractor(unique=False).extract_links(response))
+
+    def test_utf16(self):
+        html = u'<a href="\u010d.html">\u010d</a>'.encode('utf-16')
+        response = HtmlResponse('http://example.org/', body=html,
+                                encoding='utf-16')
+        self.assertListEqual(FastLinkExtractor().extract_links(response), [
+            Link(url='http://example.org/%C4%8D.html', text=u'\u010d')])
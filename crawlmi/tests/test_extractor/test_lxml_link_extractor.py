@@ -6,6 +6,8 @@ from crawlmi.tests import get_testdata
 
 
 class LxmlLinkExtractorTest(unittest.TestCase):
+    extractor_class = LxmlLinkExtractor
+
     def setUp(self):
         body = get_testdata('link_extractor', 'sgml_linkextractor.html')
         self.response = HtmlResponse(url='http://example.com/index', body=body)
@@ -21,7 +23,7 @@ class LxmlLinkExtractorTest(unittest.TestCase):
         </body></html>'''
         response = HtmlResponse('http://example.org/somepage/index.html', body=html)
 
-        lx = LxmlLinkExtractor(unique=False)
+        lx = self.extractor_class(unique=False)
         self.assertListEqual(lx.extract_links(response),
                              [Link(url='http://example.org/somepage/item/12.html', text='Item 12'),
                               Link(url='http://example.org/about.html', text='About us'),
@@ -35,7 +37,7 @@ class LxmlLinkExtractorTest(unittest.TestCase):
         </body></html>'''
         response = HtmlResponse('http://example.org/somepage/index.html', body=html)
 
-        lx = LxmlLinkExtractor(unique=False)
+        lx = self.extractor_class(unique=False)
         self.assertEqual(lx.extract_links(response),
                          [Link(url='http://otherdomain.com/base/item/12.html', text='Item 12')])
 
@@ -56,7 +58,7 @@ class LxmlLinkExtractorTest(unittest.TestCase):
     def test_link_text_wrong_encoding(self):
         html = '''<body><p><a href="item/12.html">Wrong: \xed</a></p></body></html>'''
         response = HtmlResponse('http://www.example.com', body=html, encoding='utf-8')
-        lx = LxmlLinkExtractor(unique=False)
+        lx = self.extractor_class(unique=False)
         self.assertEqual(lx.extract_links(response), [
             Link(url='http://www.example.com/item/12.html', text=u'Wrong: \ufffd'),
         ])
@@ -70,7 +72,7 @@ class LxmlLinkExtractorTest(unittest.TestCase):
             </body>
             </html>'''
         response = HtmlResponse('http://www.example.com', body=html, encoding='utf-8')
-        lx = LxmlLinkExtractor(unique=False)
+        lx = self.extractor_class(unique=False)
         self.assertEqual(lx.extract_links(response), [])
 
     def test_extraction_encoding(self):
@@ -80,7 +82,7 @@ class LxmlLinkExtractorTest(unittest.TestCase):
         body = get_testdata('link_extractor', 'linkextractor_latin1.html')
         response_latin1 = HtmlResponse(url='http://example.com/latin1', body=body)
 
-        lx = LxmlLinkExtractor(unique=False)
+        lx = self.extractor_class(unique=False)
         self.assertEqual(lx.extract_links(response_utf8), [
             Link(url='http://example.com/sample_%C3%B1.html', text=''),
             Link(url='http://example.com/sample_%E2%82%AC.html', text='sample \xe2\x82\xac text'.decode('utf-8')),
@@ -99,7 +101,7 @@ class LxmlLinkExtractorTest(unittest.TestCase):
     def test_extraction_encoding_fallback(self):
         body = get_testdata('link_extractor', 'linkextractor_fallback.html')
         response = HtmlResponse(url='http://example.com/fallback', body=body)
-        lx = LxmlLinkExtractor(unique=False)
+        lx = self.extractor_class(unique=False)
         self.assertEqual(lx.extract_links(response), [
             Link(url='http://example.com/aktu%C3%A1ln%C3%AD_sd%C4%9Blen%C3%AD.htm', text=''),
         ])
@@ -110,13 +112,13 @@ class LxmlLinkExtractorTest(unittest.TestCase):
         <a href="about.html">About us</a>
         '''
         response = HtmlResponse('http://example.org/page.html', body=html)
-        lx = LxmlLinkExtractor()
+        lx = self.extractor_class()
         self.assertEqual(lx.extract_links(response),
             [Link(url='http://example.org/page.html?action=print', text=u'Printer-friendly page', nofollow=True),
              Link(url='http://example.org/about.html', text=u'About us', nofollow=False)])
 
     def test_empty_body(self):
-        lx = LxmlLinkExtractor()
+        lx = self.extractor_class()
         response = HtmlResponse('http://www.example.com')
         self.assertEqual(lx.extract_links(response), [])
         response = HtmlResponse('http://www.example.com', body='\n\r\n\n')
@@ -125,13 +127,13 @@ class LxmlLinkExtractorTest(unittest.TestCase):
     def test_urls_type(self):
         '''Test that the resulting urls are regular strings and not a unicode objects.
         '''
-        lx = LxmlLinkExtractor()
+        lx = self.extractor_class()
         self.assertTrue(all(isinstance(link.url, str) for link in lx.extract_links(self.response)))
 
     def test_extraction(self):
         '''Test the extractor's behaviour among different situations.
         '''
-        lx = LxmlLinkExtractor()
+        lx = self.extractor_class()
         self.assertEqual([link for link in lx.extract_links(self.response)], [
             Link(url='http://example.com/sample1.html', text=u''),
             Link(url='http://example.com/sample2.html', text=u'sample 2'),
@@ -139,14 +141,14 @@ class LxmlLinkExtractorTest(unittest.TestCase):
             Link(url='http://www.google.com/something', text=u''),
         ])
 
-        lx = LxmlLinkExtractor(allow=('sample', ))
+        lx = self.extractor_class(allow=('sample', ))
         self.assertEqual([link for link in lx.extract_links(self.response)], [
             Link(url='http://example.com/sample1.html', text=u''),
             Link(url='http://example.com/sample2.html', text=u'sample 2'),
             Link(url='http://example.com/sample3.html', text=u'sample 3 text'),
         ])
 
-        lx = LxmlLinkExtractor(allow=('sample', ), unique=False)
+        lx = self.extractor_class(allow=('sample', ), unique=False)
         self.assertEqual([link for link in lx.extract_links(self.response)], [
             Link(url='http://example.com/sample1.html', text=u''),
             Link(url='http://example.com/sample2.html', text=u'sample 2'),
@@ -154,20 +156,20 @@ class LxmlLinkExtractorTest(unittest.TestCase):
             Link(url='http://example.com/sample3.html', text=u'sample 3 repetition'),
         ])
 
-        lx = LxmlLinkExtractor(allow=('sample', ))
+        lx = self.extractor_class(allow=('sample', ))
         self.assertEqual([link for link in lx.extract_links(self.response)], [
             Link(url='http://example.com/sample1.html', text=u''),
             Link(url='http://example.com/sample2.html', text=u'sample 2'),
             Link(url='http://example.com/sample3.html', text=u'sample 3 text'),
         ])
 
-        lx = LxmlLinkExtractor(allow=('sample', ), deny=('3', ))
+        lx = self.extractor_class(allow=('sample', ), deny=('3', ))
         self.assertEqual([link for link in lx.extract_links(self.response)], [
             Link(url='http://example.com/sample1.html', text=u''),
             Link(url='http://example.com/sample2.html', text=u'sample 2'),
         ])
 
-        lx = LxmlLinkExtractor(allow_domains=('google.com', ))
+        lx = self.extractor_class(allow_domains=('google.com', ))
         self.assertEqual([link for link in lx.extract_links(self.response)], [
             Link(url='http://www.google.com/something', text=u''),
         ])
@@ -175,25 +177,25 @@ class LxmlLinkExtractorTest(unittest.TestCase):
     def test_extraction_using_single_values(self):
         '''Test the extractor's behaviour among different situations.
         '''
-        lx = LxmlLinkExtractor(allow='sample')
+        lx = self.extractor_class(allow='sample')
         self.assertEqual([link for link in lx.extract_links(self.response)], [
             Link(url='http://example.com/sample1.html', text=u''),
             Link(url='http://example.com/sample2.html', text=u'sample 2'),
             Link(url='http://example.com/sample3.html', text=u'sample 3 text'),
         ])
 
-        lx = LxmlLinkExtractor(allow='sample', deny='3')
+        lx = self.extractor_class(allow='sample', deny='3')
         self.assertEqual([link for link in lx.extract_links(self.response)], [
             Link(url='http://example.com/sample1.html', text=u''),
             Link(url='http://example.com/sample2.html', text=u'sample 2'),
         ])
 
-        lx = LxmlLinkExtractor(allow_domains='google.com')
+        lx = self.extractor_class(allow_domains='google.com')
         self.assertEqual([link for link in lx.extract_links(self.response)], [
             Link(url='http://www.google.com/something', text=u''),
         ])
 
-        lx = LxmlLinkExtractor(deny_domains='example.com')
+        lx = self.extractor_class(deny_domains='example.com')
         self.assertEqual([link for link in lx.extract_links(self.response)], [
             Link(url='http://www.google.com/something', text=u''),
         ])
@@ -202,23 +204,23 @@ class LxmlLinkExtractorTest(unittest.TestCase):
         url1 = 'http://lotsofstuff.com/stuff1/index'
         url2 = 'http://evenmorestuff.com/uglystuff/index'
 
-        lx = LxmlLinkExtractor(allow=(r'stuff1', ))
+        lx = self.extractor_class(allow=(r'stuff1', ))
         self.assertEqual(lx.url_allowed(url1), True)
         self.assertEqual(lx.url_allowed(url2), False)
 
-        lx = LxmlLinkExtractor(deny=(r'uglystuff', ))
+        lx = self.extractor_class(deny=(r'uglystuff', ))
         self.assertEqual(lx.url_allowed(url1), True)
         self.assertEqual(lx.url_allowed(url2), False)
 
-        lx = LxmlLinkExtractor(allow_domains=('evenmorestuff.com', ))
+        lx = self.extractor_class(allow_domains=('evenmorestuff.com', ))
         self.assertEqual(lx.url_allowed(url1), False)
         self.assertEqual(lx.url_allowed(url2), True)
 
-        lx = LxmlLinkExtractor(deny_domains=('lotsofstuff.com', ))
+        lx = self.extractor_class(deny_domains=('lotsofstuff.com', ))
         self.assertEqual(lx.url_allowed(url1), False)
         self.assertEqual(lx.url_allowed(url2), True)
 
-        lx = LxmlLinkExtractor(allow=('blah1',), deny=('blah2',),
+        lx = self.extractor_class(allow=('blah1',), deny=('blah2',),
                                allow_domains=('blah1.com',),
                                deny_domains=('blah2.com',))
         self.assertEqual(lx.url_allowed('http://blah1.com/blah1'), True)
@@ -229,7 +231,7 @@ class LxmlLinkExtractorTest(unittest.TestCase):
     def test_encoded_url(self):
         body = '''<html><body><div><a href="?page=2">BinB</a></body></html>'''
         response = HtmlResponse("http://known.fm/AC%2FDC/", body=body, encoding='utf8')
-        lx = LxmlLinkExtractor()
+        lx = self.extractor_class()
         self.assertEqual(lx.extract_links(response), [
             Link(url='http://known.fm/AC%2FDC/?page=2', text=u'BinB'),
         ])
@@ -237,7 +239,7 @@ class LxmlLinkExtractorTest(unittest.TestCase):
     def test_deny_extensions(self):
         html = '''<a href="page.html">asd</a> and <a href="photo.jpg">'''
         response = HtmlResponse('http://example.org/', body=html)
-        lx = LxmlLinkExtractor()
+        lx = self.extractor_class()
         self.assertEqual(lx.extract_links(response), [
             Link(url='http://example.org/page.html', text=u'asd'),
         ])
@@ -257,7 +259,7 @@ class LxmlLinkExtractorTest(unittest.TestCase):
         <p><a href="/hello">mimino</a></p>
         </body></html>'''
         response = HtmlResponse('http://example.org/', body=html)
-        lx = LxmlLinkExtractor()
+        lx = self.extractor_class()
         self.assertEqual(lx.extract_links(response, process_links=_process), [
             Link(url='http://gogo.com/', text=u'>>')
         ])
@@ -273,7 +275,7 @@ class LxmlLinkExtractorTest(unittest.TestCase):
         <a href="../../hello/././world"></a>
         </body></html>'''
         response = HtmlResponse('http://exmaple.org/yay/', body=html)
-        lx = LxmlLinkExtractor(unique=False)
+        lx = self.extractor_class(unique=False)
         self.assertEqual([link.url for link in lx.extract_links(response)], [
             'http://exmaple.org/yay/hello/world/',
             'http://exmaple.org/hello/world/',
@@ -283,3 +285,15 @@ class LxmlLinkExtractorTest(unittest.TestCase):
             'http://exmaple.org/yay/hello/world',
             'http://exmaple.org/hello/world',
         ])
+
+    def test_shared_html(self):
+        html = '''<html><head><base href="/base/" /></head>
+        <body><a href=" item.html ">Item</a><img src="logo.png" /></body></html>'''
+        response = HtmlResponse('http://example.org/page.html', body=html)
+        lx = self.extractor_class()
+        self.assertEqual(lx.extract_links(response),
+                         [Link(url='http://example.org/base/item.html', text='Item')])
+        # the document parsed by the response is used and not modified
+        self.assertEqual(response.html.xpath('//a/@href'), [' item.html '])
+        self.assertEqual(response.html.xpath('//img/@src'), ['logo.png'])
+        self.assertEqual(len(response.html.xpath('//base')), 1)
@@ -127,3 +127,28 @@ class HeadersTest(unittest.TestCase):
         h.appendlist('header1', 'value1')
         h.appendlist('header1', 'value3')
         self.assertListEqual(h.getlist('header1'), ['value1', 'value3'])
+
+    def test_add_raw(self):
+        h = Headers()
+        h.add_raw('content-type', 'text/html')
+        h.add_raw('SET-COOKIE', 'a=1')
+        h.add_raw('Set-Cookie', 'b=2')
+        self.assertListEqual(h.getlist('Content-Type'), ['text/html'])
+        self.assertListEqual(h.getlist('set-cookie'), ['a=1', 'b=2'])
+
+    def test_normkey_cache(self):
+        h = Headers()
+        for key in ['x-my-header', 'X-MY-HEADER', u'x-my-header']:
+            self.assertEqual(h.normkey(key), 'X-My-Header')
+            self.assertIsInstance(h.normkey(key), str)
+        self.assertEqual(Headers(encoding='latin1').normkey(u'x-\xfc'), 'X-\xdc')
+        self.assertEqual(Headers().normkey(u'x-\xfc'), 'X-\xc3\x9c')
+
+    def test_update_headers(self):
+        h1 = Headers({'a': ['1', '2'], 'b': '3'})
+        h2 = Headers({'a': '0'})
+        h2.update(h1)
+        self.assertListEqual(h2.getlist('a'), ['0', '1', '2'])
+        self.assertListEqual(h2.getlist('b'), ['3'])
+        h2.getlist('b').append('4')
+        self.assertListEqual(h1.getlist('b'), ['3'])
@@ -1,3 +1,6 @@
+import mmap
+import tempfile
+
 from twisted.trial import unittest
 
 from crawlmi.http import HtmlResponse
@@ -11,3 +14,45 @@ class HtmlResponseTest(unittest.TestCase):
 
     def test_base_url(self):
         self.assertEqual(self.resp.base_url, 'http://www.w3schools.com/')
+
+    def test_html(self):
+        html = self.resp.html
+        self.assertIs(self.resp.html, html)
+        self.assertEqual(html.tag, 'html')
+        # extractor shares the document
+        self.assertIs(self.resp.extractor._root, html)
+        self.assertEqual(self.resp.extractor.select('//base/@href').extract(),
+                         [u'http://www.w3schools.com/'])
+
+    def test_html_encoding(self):
+        for body, encoding in [('<p>\xc3\xa1</p>', 'utf-8'),
+                               ('\xef\xbb\xbf<p>\xc3\xa1</p>', 'utf-8'),
+                               ('<p>\xe1</p>', 'latin1'),
+                               # invalid input is decoded with replacement
+                               ('<p>\xe1</p>', 'utf-8'),
+                               ('<p>a\x81b</p>', 'cp1252')]:
+            resp = HtmlResponse('http://github.com/', body=body,
+                                encoding=encoding)
+            self.assertEqual(resp.html.xpath('//p/text()'), [resp.text[3:-4]])
+
+    def test_html_fragment(self):
+        resp = HtmlResponse('http://github.com/', body='<p>a</p><p>b</p>')
+        self.assertEqual(resp.html.tag, 'html')
+        self.assertEqual(resp.extractor.select('//p/text()').extract(),
+                         [u'a', u'b'])
+        resp = HtmlResponse('http://github.com/', body='')
+        self.assertEqual(resp.html.tag, 'html')
+
+    def test_html_mmap_body(self):
+        for body in ['<p>\xc3\xa1</p>', '\xef\xbb\xbf<p>\xc3\xa1</p>',
+                     '<p>\xe1</p>']:
+            with tempfile.TemporaryFile() as f:
+                f.write(body)
+                f.flush()
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            resp = HtmlResponse('http://github.com/', body=mm,
+                                encoding='utf-8')
+            self.assertEqual(resp.html.xpath('//p/text()'), [resp.text[3:-4]])
+            self.assertEqual(resp.extractor.select('//p/text()').extract(),
+                             [resp.text[3:-4]])
+            mm.close()
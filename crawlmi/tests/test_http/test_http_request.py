@@ -45,6 +45,21 @@ class RequestTest(unittest.TestCase):
         self.assertListEqual(r.history, history)
         self.assertIsNot(r.history, history)
 
+    def test_lazy_attributes(self):
+        r = Request(url=gh_url)
+        self.assertFalse(hasattr(r, '__dict__'))
+        for name in ['_headers', '_meta', '_history', '_cookies', '_parsed_url']:
+            self.assertIsNone(getattr(r, name), name)
+        r.meta['a'] = 'b'
+        self.assertDictEqual(r.meta, {'a': 'b'})
+        r.headers['Accept'] = 'gzip'
+        self.assertEqual(r.headers['Accept'], 'gzip')
+        self.assertEqual(r.headers.encoding, 'utf-8')
+        self.assertListEqual(r.history, [])
+        self.assertDictEqual(r.cookies, {})
+        self.assertEqual(r.parsed_url, urlparse(r.url))
+        self.assertIs(r.parsed_url, r.parsed_url)
+
     def test_properties(self):
         r = Request(url=gh_url, body='Hello', encoding='utf-8')
 
@@ -244,6 +259,62 @@ class RequestTest(unittest.TestCase):
         r2 = r1.copy()
         self.assertIsInstance(r2, CustomRequest)
 
+        class InitRequest(Request):
+            def __init__(self, url, extra='x', **kwargs):
+                super(InitRequest, self).__init__(url, **kwargs)
+                self.priority = extra
+
+        r1 = InitRequest('http://www.example.com', extra=5)
+        r2 = r1.copy()
+        self.assertIsInstance(r2, InitRequest)
+        self.assertEqual(r2.priority, 'x')
+
+    def test_copy_on_write(self):
+        r1 = Request('http://www.example.com/a b', headers={'A': 'b'},
+                     meta={'c': 'd'}, history=['http://www.example.com/'])
+        r1.parsed_url
+        r2 = r1.copy()
+        # url isn't prepared again
+        self.assertIs(r2.url, r1.url)
+        self.assertIs(r2.parsed_url, r1.parsed_url)
+        self.assertIs(r2._headers, r1._headers)
+        self.assertIs(r2._meta, r1._meta)
+        self.assertIs(r2._history, r1._history)
+        self.assertEqual(r2.original_url, 'http://www.example.com/')
+
+        r2.meta['e'] = 'f'
+        r2.headers['G'] = 'h'
+        r2.history.append('http://www.example.com/a%20b')
+        self.assertDictEqual(r1.meta, {'c': 'd'})
+        self.assertDictEqual(r2.meta, {'c': 'd', 'e': 'f'})
+        self.assertNotIn('G', r1.headers)
+        self.assertEqual(r2.headers['A'], 'b')
+        self.assertListEqual(r1.history, ['http://www.example.com/'])
+        self.assertEqual(len(r2.history), 2)
+        # no more copying
+        self.assertIs(r2.meta, r2.meta)
+
+        r3 = r1.replace(url='http://www.example.com/other', meta={})
+        self.assertEqual(r3.url, 'http://www.example.com/other')
+        self.assertEqual(r3.parsed_url.path, '/other')
+        self.assertDictEqual(r3.meta, {})
+        self.assertRaises(ValueError, r1.replace, url='no-scheme')
+        self.assertRaises(TypeError, r1.replace, unknown=1)
+
+        # modifying the original doesn't change the copy
+        r6 = r1.copy()
+        r1.meta['x'] = 1
+        r1.headers['X'] = '1'
+        r1.history.append('http://www.example.com/x')
+        self.assertDictEqual(r6.meta, {'c': 'd'})
+        self.assertNotIn('X', r6.headers)
+        self.assertListEqual(r6.history, ['http://www.example.com/'])
+
+        r4 = Request('http://www.example.com/')
+        r5 = r4.copy()
+        self.assertIsNone(r5._headers)
+        self.assertIsNone(r5._meta)
+
     def test_replace(self):
         r1 = Request('http://www.example.com', method='GET')
         headers = Headers(dict(r1.headers, key='value'))
@@ -34,6 +34,16 @@ class ResponseTest(unittest.TestCase):
         self.assertEqual(r.status, 301)
         self.assertRaises(ValueError, Response, 'http://example.com', status='lala200')
 
+    def test_lazy_attributes(self):
+        r = Response(url='http://github.com/')
+        self.assertFalse(hasattr(r, '__dict__'))
+        self.assertIsNone(r._headers)
+        self.assertIsNone(r._flags)
+        r.flags.append('cached')
+        self.assertListEqual(r.flags, ['cached'])
+        r.headers['Content-Type'] = 'text/html'
+        self.assertEqual(r.headers['Content-Type'], 'text/html')
+
     def test_repr(self):
         resp_200 = Response('a', status=200)
         self.assertEqual(repr(resp_200), '<Response a [200 (OK)]>')
@@ -78,6 +88,22 @@ class ResponseTest(unittest.TestCase):
         self.assertDictEqual(r1.headers, r2.headers)
         self.assertListEqual(r1.flags, r2.flags)
 
+    def test_copy_on_write(self):
+        r1 = Response(url='http://hey.com/', headers={'a': 'b'})
+        r2 = r1.copy()
+        self.assertIs(r2._headers, r1._headers)
+        r2.headers['c'] = 'd'
+        self.assertNotIn('c', r1.headers)
+        self.assertEqual(r2.headers['a'], 'b')
+        # modifying the original doesn't change the copy
+        r4 = r1.copy()
+        r1.headers['x'] = 'y'
+        self.assertNotIn('x', r4.headers)
+        self.assertNotIn('x', r2.headers)
+        r3 = r1.replace(headers={})
+        self.assertDictEqual(r3.headers, {})
+        self.assertIsNone(Response('http://hey.com/').copy()._flags)
+
     def test_copy_inherited_classes(self):
         class CustomResponse(Response):
             pass
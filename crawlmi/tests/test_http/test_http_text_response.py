@@ -37,3 +37,14 @@ class TextResponseTest(unittest.TestCase):
         response4 = response.replace(body='hello')
         self.assertIsNone(response4._encoding)
         self.assertIsNone(response4._unicode_body)
+
+    def test_head(self):
+        body = '''<link rel="canonical" href="/c"><meta charset="cp1251">'''
+        response = TextResponse('', body=body)
+        self.assertEqual(response.head.charset, 'cp1251')
+        self.assertEqual(response.head.canonical_href, '/c')
+        self.assertIs(response.head, response.head)
+        self.assertEqual(response.encoding, 'cp1251')
+
+        self.assertIs(response.copy()._head, response._head)
+        self.assertIsNone(response.replace(body='hello')._head)
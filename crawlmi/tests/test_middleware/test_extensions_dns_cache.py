@@ -0,0 +1,54 @@
+from twisted.internet import defer
+from twisted.trial import unittest
+
+from crawlmi import signals
+from crawlmi.exceptions import NotConfigured
+from crawlmi.http import Request
+from crawlmi.middleware.extensions.dns_cache import DnsCache
+from crawlmi.utils.test import get_engine
+
+
+class MockReactor(object):
+    def __init__(self):
+        self.resolver = MockResolver()
+
+    def installResolver(self, resolver):
+        old, self.resolver = self.resolver, resolver
+        return old
+
+
+class MockResolver(object):
+    def __init__(self):
+        self.names = []
+
+    def getHostByName(self, name, timeout=None):
+        self.names.append(name)
+        return defer.Deferred()
+
+
+class DnsCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.engine = get_engine(DNS_CACHE_ENABLED=True,
+                                 DNS_PREFETCH_ENABLED=True)
+        self.reactor = MockReactor()
+        self.base = self.reactor.resolver
+        self.dc = DnsCache(self.engine, reactor=self.reactor)
+
+    def test_config(self):
+        self.assertRaises(NotConfigured, DnsCache,
+                          get_engine(DNS_CACHE_ENABLED=False))
+
+    def test_install(self):
+        self.engine.signals.send(signals.engine_started)
+        self.assertIs(self.reactor.resolver, self.dc.resolver)
+        self.engine.signals.send(signals.engine_stopped, reason='finished')
+        self.assertIs(self.reactor.resolver, self.base)
+
+    def test_prefetch(self):
+        for url in ['http://github.com/', 'http://127.0.0.1/',
+                    'http://github.com/a/', 'https://www.python.org/']:
+            self.engine.signals.send(signals.request_scheduled,
+                                     request=Request(url))
+        self.engine.signals.send(signals.request_scheduled, request=Request(
+            'http://example.com/', proxy='http://127.0.0.1:8080/'))
+        self.assertListEqual(self.base.names, ['github.com', 'www.python.org'])
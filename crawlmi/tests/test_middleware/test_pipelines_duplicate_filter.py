@@ -1,5 +1,11 @@
+import os
+import shutil
+import tempfile
+
+from twisted.internet import defer
 from twisted.trial import unittest
 
+from crawlmi import signals
 from crawlmi.http import Request
 from crawlmi.middleware.pipelines.duplicate_filter import DuplicateFilter, clear_duplicate_filter
 from crawlmi.utils.test import get_engine
@@ -38,3 +44,134 @@ class DuplicateFilterTest(unittest.TestCase):
         self.assertIsNone(mw.process_request(r1))
         self.assertIs(mw.process_request(r2), r2)
         self.assertIsNone(mw.process_request(r3))
+
+    def test_stores(self):
+        for store in ['crawlmi.utils.fingerprint_store.SetFingerprintStore',
+                      'crawlmi.utils.fingerprint_store.PackedFingerprintStore',
+                      'crawlmi.utils.fingerprint_store.BloomFingerprintStore']:
+            engine = get_engine(DUPLICATE_FILTER_STORE=store)
+            mw = DuplicateFilter(engine)
+            r1 = Request('http://test.org/', meta={'df_tag': '1'})
+            r2 = Request('http://test.org/')
+            self.assertIs(mw.process_request(r1), r1)
+            self.assertIs(mw.process_request(r2), r2)
+            self.assertIsNone(mw.process_request(r1))
+            self.assertIsNone(mw.process_request(r2))
+            self.assertEqual(mw.fingerprints['1'].__class__.__name__,
+                             store.rsplit('.', 1)[1])
+
+
+class PersistentDuplicateFilterTest(unittest.TestCase):
+    store = 'crawlmi.utils.fingerprint_store.PackedFingerprintStore'
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _get_mw(self, **settings):
+        settings.setdefault('DUPLICATE_FILTER_STORE', self.store)
+        self.engine = get_engine(DUPLICATE_FILTER_DIR=self.tmpdir,
+                                 DUPLICATE_FILTER_CHECKPOINT_INTERVAL=10,
+                                 **settings)
+        mw = DuplicateFilter(self.engine)
+        self.engine.signals.send(signals.engine_started)
+        return mw
+
+    def _stop(self):
+        self.engine.signals.send(signals.engine_stopped, reason='finished')
+
+    def test_persistence(self):
+        r1 = Request('http://test.org/1')
+        r2 = Request('http://test.org/2', meta={'df_tag': 'a'})
+        r3 = Request('http://test.org/3')
+        mw = self._get_mw()
+        self.assertIs(mw.process_request(r1), r1)
+        self.assertIs(mw.process_request(r2), r2)
+        self._stop()
+        self.assertEqual(len(os.listdir(self.tmpdir)), 2)
+
+        mw = self._get_mw()
+        self.assertIsNone(mw.process_request(r1))
+        self.assertIsNone(mw.process_request(r2))
+        self.assertIs(mw.process_request(r3), r3)
+        self._stop()
+
+    @defer.inlineCallbacks
+    def test_checkpoint(self):
+        mw = self._get_mw()
+        mw.process_request(Request('http://test.org/1'))
+        self.assertEqual(os.listdir(self.tmpdir), [])
+        self.engine.clock.advance(10)
+        self.assertEqual(len(mw._modified), 0)
+        saving = mw._saving
+        self.assertIsNotNone(saving)
+        # modified while being written
+        mw.process_request(Request('http://test.org/2'))
+        self.assertIsNone(mw.checkpoint())
+        yield saving
+        self.assertIsNone(mw._saving)
+        self.assertEqual(len(os.listdir(self.tmpdir)), 1)
+        self.assertEqual(len(mw._modified), 1)
+        yield mw.checkpoint()
+        self.assertEqual(len(mw._modified), 0)
+        self.assertIsNone(mw.checkpoint())
+        self._stop()
+
+        mw = self._get_mw()
+        self.assertIsNone(mw.process_request(Request('http://test.org/2')))
+        self._stop()
+
+    @defer.inlineCallbacks
+    def test_checkpoint_outdated(self):
+        r1 = Request('http://test.org/', meta={'df_tag': 'a'})
+        mw = self._get_mw()
+        mw.process_request(r1)
+        saving = mw.checkpoint()
+        # cleared before the checkpoint was written
+        self.engine.signals.send(clear_duplicate_filter, df_tag='a')
+        yield saving
+        self.assertEqual(os.listdir(self.tmpdir), [])
+        self.assertEqual(len(mw._modified), 0)
+        self._stop()
+
+    def test_stop_during_checkpoint(self):
+        r1 = Request('http://test.org/')
+        mw = self._get_mw()
+        mw.process_request(r1)
+        self.assertIsNotNone(mw.checkpoint())
+        # stores being written by the checkpoint are saved as well
+        self._stop()
+        mw = self._get_mw()
+        self.assertIsNone(mw.process_request(r1))
+        self._stop()
+
+    def test_clear(self):
+        r1 = Request('http://test.org/', meta={'df_tag': 'a'})
+        mw = self._get_mw()
+        mw.process_request(r1)
+        mw.save()
+        self.engine.signals.send(clear_duplicate_filter, df_tag='a')
+        self.assertEqual(os.listdir(self.tmpdir), [])
+        self.assertIs(mw.process_request(r1), r1)
+        self._stop()
+
+    def test_invalid_file(self):
+        r1 = Request('http://test.org/')
+        mw = self._get_mw()
+        mw.process_request(r1)
+        self._stop()
+        # saved by the different store
+        mw = self._get_mw(DUPLICATE_FILTER_STORE=
+                          'crawlmi.utils.fingerprint_store.SetFingerprintStore')
+        self.assertIs(mw.process_request(r1), r1)
+        self._stop()
+
+    def test_empty_file(self):
+        r1 = Request('http://test.org/')
+        mw = self._get_mw()
+        open(mw._get_path(None), 'wb').close()
+        self.assertIs(mw.process_request(r1), r1)
+        self.assertIsNone(mw.process_request(r1))
+        self._stop()
@@ -1,12 +1,24 @@
 from contextlib import contextmanager
 import email.utils
+import os
 import shutil
 import tempfile
+import threading
 import time
 
+from twisted.internet import defer, reactor, threads
+from twisted.python.failure import Failure
 from twisted.trial import unittest
+
+from crawlmi import signals
 from crawlmi.http import Request, Response, HtmlResponse
+from crawlmi.middleware.pipeline_manager import PipelineManager
+from crawlmi.middleware.pipelines.filter import Filter, FilterError
 from crawlmi.middleware.pipelines.http_cache import HttpCache
+from crawlmi.middleware.pipelines.http_cache import storage as storage_module
+from crawlmi.middleware.pipelines.http_cache.storage import (
+    BackgroundCacheStorage, MemoryCacheStorage)
+from crawlmi.utils.request import request_fingerprint
 from crawlmi.utils.test import get_engine
 
 
@@ -39,6 +51,7 @@ class BaseTest(unittest.TestCase):
             'HTTP_CACHE_IGNORE_NON_200_STATUS': False,
             'HTTP_CACHE_POLICY': self.policy_class,
             'HTTP_CACHE_STORAGE': self.storage_class,
+            'HTTP_CACHE_THREADS': 0,
         }
         settings.update(new_settings)
         return settings
@@ -120,9 +133,350 @@ class DbmStorageWithCustomDbmModuleTest(DbmStorageTest):
             self.assertEqual(storage.db_module.__name__, self.db_module)
 
 
+class SqliteStorageTest(DbmStorageTest):
+    storage_class = 'crawlmi.middleware.pipelines.http_cache.storage.SqliteCacheStorage'
+
+    def test_persistence(self):
+        with self._storage(HTTP_CACHE_SQLITE_COMMIT_BATCH=10) as storage:
+            storage.store_response(self.request, self.response)
+            self.assertEqual(storage._uncommitted, 1)
+            # the same fingerprint replaces the previous response
+            storage.store_response(self.request, self.response)
+            self.assertEqual(len(storage), 1)
+            self.assertListEqual(list(storage), [storage._request_key(self.request)])
+        # uncommitted changes are committed on close
+        with self._storage() as storage:
+            self.assertEqualResponse(
+                storage.retrieve_response(self.request), self.response)
+
+    def test_remove_expired(self):
+        with self._storage() as storage:
+            storage.store_response(self.request, self.response)
+            time.sleep(1.1)
+            storage.remove_expired()
+            self.assertEqual(len(storage), 0)
+
+
+class LogStorageTest(DbmStorageTest):
+    storage_class = 'crawlmi.middleware.pipelines.http_cache.storage.LogCacheStorage'
+
+    def _get_requests(self, n):
+        return [Request('http://www.example.com/%s' % i) for i in xrange(n)]
+
+    def _get_response(self, request, body='test body'):
+        return Response(request.url, headers={'Content-Type': 'text/html'},
+                        body=body, request=request)
+
+    def test_persistence(self):
+        with self._storage() as storage:
+            storage.store_response(self.request, self.response)
+            # the same fingerprint replaces the previous response
+            storage.store_response(self.request, self.response)
+            self.assertEqual(len(storage), 1)
+            self.assertGreater(storage.dead_size, 0)
+            self.assertListEqual(list(storage),
+                                 [request_fingerprint(self.request)])
+        with self._storage() as storage:
+            self.assertEqualResponse(
+                storage.retrieve_response(self.request), self.response)
+
+    def test_segments(self):
+        requests = self._get_requests(5)
+        with self._storage(HTTP_CACHE_LOG_SEGMENT_SIZE=200) as storage:
+            for r in requests:
+                storage.store_response(r, self._get_response(r, 'x' * 100))
+            self.assertEqual(len(storage._list_segments()), 5)
+            for r in requests:
+                self.assertEqual(storage.retrieve_response(r).body, 'x' * 100)
+            # response stored after the segment was mapped
+            storage.store_response(requests[0], self._get_response(requests[0]))
+            self.assertEqual(storage.retrieve_response(requests[0]).body,
+                             'test body')
+
+    def test_recovery(self):
+        requests = self._get_requests(3)
+        with self._storage() as storage:
+            storage.store_response(requests[0], self._get_response(requests[0]))
+        with self._storage() as storage:
+            for r in requests[1:]:
+                storage.store_response(r, self._get_response(r))
+            log_dir = storage.log_dir
+            segment_path = storage._segment_path(storage.segment)
+            # simulate the crash - the index isn't saved
+            storage.close = storage._file.close
+        # incomplete record
+        with open(segment_path, 'ab') as f:
+            f.write(storage.record_magic + 'abc')
+        size = os.path.getsize(segment_path)
+        with self._storage() as storage:
+            self.assertEqual(len(storage), 3)
+            for r in requests:
+                self.assertEqualResponse(storage.retrieve_response(r),
+                                         self._get_response(r))
+        self.assertEqual(os.path.getsize(segment_path), size - 7)
+        # missing index
+        os.remove(os.path.join(log_dir, 'index'))
+        with self._storage() as storage:
+            self.assertEqual(len(storage), 3)
+
+    def test_compact(self):
+        requests = self._get_requests(3)
+        with self._storage(HTTP_CACHE_EXPIRATION_SECS=0,
+                           HTTP_CACHE_LOG_COMPACT_RATIO=0) as storage:
+            for i in xrange(3):
+                for r in requests:
+                    storage.store_response(r, self._get_response(r, str(i)))
+            old_segments = storage._list_segments()
+            storage.compact()
+            self.assertEqual(storage.dead_size, 0)
+            self.assertNotEqual(storage._list_segments(), old_segments)
+            for r in requests:
+                self.assertEqual(storage.retrieve_response(r).body, '2')
+            storage.store_response(requests[0], self._get_response(requests[0]))
+        # compacted on open
+        with self._storage(HTTP_CACHE_EXPIRATION_SECS=0,
+                           HTTP_CACHE_LOG_COMPACT_RATIO=0.1) as storage:
+            self.assertEqual(storage.dead_size, 0)
+            self.assertEqual(storage.retrieve_response(requests[0]).body,
+                             'test body')
+            self.assertEqual(storage.retrieve_response(requests[1]).body, '2')
+
+    def test_compact_expired(self):
+        with self._storage(HTTP_CACHE_LOG_COMPACT_RATIO=0) as storage:
+            storage.store_response(self.request, self.response)
+            time.sleep(1.1)
+            storage.compact()
+            self.assertEqual(len(storage), 0)
+
+
+class BackgroundStorageTest(BaseTest):
+    storage_class = 'crawlmi.middleware.pipelines.http_cache.storage.SqliteCacheStorage'
+    policy_class = 'crawlmi.middleware.pipelines.http_cache.policy.DummyPolicy'
+
+    def _get_request(self, i):
+        return Request('http://www.example.com/%s' % i)
+
+    def _get_response(self, i):
+        return Response('http://www.example.com/%s' % i, body=str(i),
+                        request=self._get_request(i))
+
+    @defer.inlineCallbacks
+    def test_storage(self):
+        engine = self._get_engine(HTTP_CACHE_THREADS=2,
+                                  HTTP_CACHE_WRITE_BATCH=3,
+                                  HTTP_CACHE_WRITE_QUEUE_SIZE=5)
+        mw = HttpCache(engine)
+        storage = mw.storage
+        self.assertIsInstance(storage, BackgroundCacheStorage)
+        mw.engine_started()
+
+        # lookups are deferred
+        result = mw.process_request(self._get_request(0))
+        self.assertIsInstance(result, defer.Deferred)
+        request = yield result
+        self.assertEqual(request.url, 'http://www.example.com/0')
+
+        # buffered responses are available before they are written
+        for i in xrange(2):
+            mw.process_response(self._get_response(i))
+        self.assertEqual(len(storage._pending), 2)
+        response = yield mw.process_request(self._get_request(1))
+        self.assertIsInstance(response, Response)
+        self.assertEqual(response.body, '1')
+        self.assertIn('cached', response.flags)
+
+        # full batch is written by the threads
+        mw.process_response(self._get_response(2))
+        self.assertEqual(len(storage._pending), 0)
+        self.assertEqual(len(storage._flushing), 3)
+        response = yield mw.process_request(self._get_request(2))
+        self.assertEqual(response.body, '2')
+
+        # the rest is written when engine stops
+        mw.process_response(self._get_response(3))
+        mw.engine_stopped()
+        mw = HttpCache(self._get_engine())
+        mw.engine_started()
+        try:
+            self.assertEqual(len(mw.storage), 4)
+        finally:
+            mw.engine_stopped()
+
+    def test_write_queue_size(self):
+        storage = BackgroundCacheStorage(DummyStorage(), write_batch=1,
+                                         write_queue_size=2)
+        # simulate the running write
+        storage._flushing['a'] = None
+        storage.store_response(self._get_request(0), self._get_response(0))
+        self.assertEqual(len(storage._pending), 1)
+        storage.store_response(self._get_request(1), self._get_response(1))
+        # queue is full - responses are written right away
+        self.assertEqual(len(storage._pending), 0)
+        self.assertEqual(len(storage.storage.stored), 2)
+
+    @defer.inlineCallbacks
+    def test_threads_use_fingerprints(self):
+        main_thread = threading.current_thread()
+        old_fingerprint = storage_module.request_fingerprint
+
+        def fingerprint(request):
+            assert threading.current_thread() is main_thread
+            return old_fingerprint(request)
+
+        mw = HttpCache(self._get_engine(HTTP_CACHE_THREADS=1,
+                                        HTTP_CACHE_WRITE_BATCH=10))
+        storage = mw.storage
+        mw.engine_started()
+        storage_module.request_fingerprint = fingerprint
+        try:
+            for i in xrange(3):
+                response = self._get_response(i)
+                storage.store_response(response.request, response)
+            items = storage._pending.items()
+            storage._pending.clear()
+            yield threads.deferToThreadPool(reactor, storage.threadpool,
+                                            storage._store_batch, items)
+            response = yield storage.retrieve_response(self._get_request(1))
+            self.assertEqual(response.body, '1')
+        finally:
+            storage_module.request_fingerprint = old_fingerprint
+            mw.engine_stopped()
+
+    def test_snapshot(self):
+        storage = BackgroundCacheStorage(DummyStorage(), write_batch=10)
+        response = Response('http://www.example.com/', status=200,
+                            headers={'Content-Encoding': 'gzip'},
+                            body='gzipped', request=self._get_request(0))
+        storage.store_response(response.request, response)
+        # the following pipelines modify the response
+        del response.headers['Content-Encoding']
+        response.status = 201
+        response.url = 'http://www.example.com/other'
+        storage._store_batch(storage._pending.items())
+        stored = storage.storage.stored[0]
+        self.assertEqual(stored.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(stored.status, 200)
+        self.assertEqual(stored.url, 'http://www.example.com/')
+        self.assertEqual(stored.body, 'gzipped')
+
+
+class MemoryStorageTest(BaseTest):
+    policy_class = 'crawlmi.middleware.pipelines.http_cache.policy.DummyPolicy'
+
+    def setUp(self):
+        super(MemoryStorageTest, self).setUp()
+        self.stats = get_engine().stats
+        self.backend = DummyStorage()
+        self.storage = MemoryCacheStorage(self.backend, 30, stats=self.stats)
+
+    def _get_response(self, url, body):
+        return Response(url, body=body, request=Request(url))
+
+    def test_hit(self):
+        r1 = self._get_response('http://a.com/', 'body')
+        self.backend.store_response(r1.request, r1)
+        response = self.storage.retrieve_response(r1.request)
+        self.assertEqual(response.body, 'body')
+        self.assertEqual(self.backend.retrieved, 1)
+        response.flags.append('cached')
+        # second lookup is served from memory
+        response = self.storage.retrieve_response(r1.request)
+        self.assertEqual(response.body, 'body')
+        self.assertListEqual(response.flags, [])
+        self.assertEqual(self.backend.retrieved, 1)
+        self.assertEqual(self.stats.get_value('httpcache/mem_hit'), 1)
+
+    def test_invalidate(self):
+        r1 = self._get_response('http://a.com/', 'old')
+        self.storage.store_response(r1.request, r1)
+        self.storage.retrieve_response(r1.request)
+        r2 = self._get_response('http://a.com/', 'new')
+        self.storage.store_response(r2.request, r2)
+        self.assertEqual(self.storage.size, 0)
+        self.assertEqual(self.storage.retrieve_response(r1.request).body, 'new')
+
+    def test_invalidate_running_lookup(self):
+        r1 = self._get_response('http://a.com/', 'old')
+        self.backend.store_response(r1.request, r1)
+        self.backend.deferred = True
+        dfd = self.storage.retrieve_response(r1.request)
+        r2 = self._get_response('http://a.com/', 'new')
+        self.storage.store_response(r2.request, r2)
+        self.backend.deferred = False
+        self.backend.dfd.callback(r1)
+        self.assertEqual(len(self.storage.cache), 0)
+        return dfd
+
+    def test_lru(self):
+        responses = [self._get_response('http://a.com/%s' % i, 'x' * 5)
+                     for i in xrange(3)]  # 19 bytes each
+        for r in responses:
+            self.backend.store_response(r.request, r)
+        self.storage.max_size = 40
+        self.storage.retrieve_response(responses[0].request)
+        self.storage.retrieve_response(responses[1].request)
+        self.assertEqual(self.storage.size, 38)
+        # the first response is the most recently used now
+        self.storage.retrieve_response(responses[0].request)
+        self.storage.retrieve_response(responses[2].request)
+        self.assertEqual(self.storage.size, 38)
+        self.assertListEqual(
+            [r.url for _, r in self.storage.cache.values()],
+            ['http://a.com/0', 'http://a.com/2'])
+        # too big responses are not kept in memory
+        big = self._get_response('http://a.com/big', 'x' * 100)
+        self.backend.store_response(big.request, big)
+        self.storage.retrieve_response(big.request)
+        self.assertNotIn(big.url, [r.url for _, r in self.storage.cache.values()])
+
+
+class DummyStorage(object):
+    def __init__(self):
+        self.stored = []
+        self.responses = {}
+        self.retrieved = 0
+        self.deferred = False
+        self.dfd = None
+
+    def retrieve_response(self, request):
+        return self.retrieve_by_fingerprint(request_fingerprint(request))
+
+    def retrieve_by_fingerprint(self, fingerprint):
+        self.retrieved += 1
+        if self.deferred:
+            self.dfd = defer.Deferred()
+            return self.dfd
+        return self.responses.get(fingerprint)
+
+    def store_response(self, request, response):
+        self.store_by_fingerprint(request_fingerprint(request), response)
+
+    def store_by_fingerprint(self, fingerprint, response):
+        self.stored.append(response)
+        self.responses[fingerprint] = response
+
+
 class DummyPolicyTest(BaseTest):
     policy_class = 'crawlmi.middleware.pipelines.http_cache.policy.DummyPolicy'
 
+    def test_filtered_response(self):
+        engine = self._get_engine(FILTER_NONTEXT_RESPONSE=True)
+        pm = PipelineManager(engine, mw_classes=[Filter, HttpCache])
+        engine.signals.send(signal=signals.engine_started)
+        try:
+            # response filtered, when its headers arrived
+            response = Response('http://www.example.com', body='',
+                                request=self.request, flags=['filtered'])
+            result = pm.process_response(response)
+            self.assertIsInstance(result, Failure)
+            self.assertIsInstance(result.value, FilterError)
+            self.assertIsNone(pm.middlewares[1].storage.retrieve_response(
+                self.request))
+            self.assertEqual(
+                engine.stats.get_value('httpcache/uncacheable'), 1)
+        finally:
+            engine.signals.send(signal=signals.engine_stopped)
+
     def test_middleware(self):
         with self._middleware() as mw:
             self.assertIs(mw.process_request(self.request), self.request)
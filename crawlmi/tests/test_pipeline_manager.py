@@ -1,3 +1,4 @@
+from twisted.internet import defer
 from twisted.python.failure import Failure
 from twisted.trial import unittest
 
@@ -78,6 +79,50 @@ class PipelineManagerTest(unittest.TestCase):
         self.assertIs(result, new_request)
         self.assertListEqual(self.mws, ['M1', 'M1', 'M2'])
 
+    def test_process_request_deferred(self):
+        dfd = defer.Deferred()
+        pm = self._get_pm(
+            self._build('M1', preq=True),
+            self._build('M2', preq=lambda x: dfd),
+            self._build('M3', preq=True))
+        result = pm.process_request(self.req)
+        self.assertIsInstance(result, defer.Deferred)
+        self.assertListEqual(self.mws, ['M1', 'M2'])
+        dfd.callback(self.req)
+        self.assertListEqual(self.mws, ['M1', 'M2', 'M3'])
+        return result.addCallback(self.assertIs, self.req)
+
+    def test_process_request_deferred_none(self):
+        pm = self._get_pm(
+            self._build('M1', preq=lambda x: defer.succeed(None)),
+            self._build('M2', preq=True))
+        result = pm.process_request(self.req)
+        self.assertListEqual(self.mws, ['M1'])
+        return self.assertFailure(result, DropRequest)
+
+    def test_process_request_deferred_response(self):
+        pm = self._get_pm(
+            self._build('M1', preq=lambda x: defer.succeed(Response(''))),
+            self._build('M2', preq=True))
+        result = pm.process_request(self.req)
+        self.assertListEqual(self.mws, ['M1'])
+        return result.addCallback(self.assertIsInstance, Response)
+
+    def test_process_request_deferred_restart(self):
+        new_request = Request('http://new.com/')
+
+        def preq(r):
+            if r is self.req:
+                return defer.fail(RestartPipeline(new_request))
+            return r
+
+        pm = self._get_pm(
+            self._build('M1', preq=preq),
+            self._build('M2', preq=True))
+        result = pm.process_request(self.req)
+        self.assertListEqual(self.mws, ['M1', 'M1', 'M2'])
+        return result.addCallback(self.assertIs, new_request)
+
     def test_process_request_invalid(self):
         pm = self._get_pm(self._build('M1', preq=lambda x: 10))
         self.assertRaises(AssertionError, pm.process_request, self.req)
@@ -0,0 +1,88 @@
+import os
+import shutil
+import tempfile
+
+from twisted.trial import unittest
+
+from crawlmi.queue import DiskQueue
+
+
+class DiskQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_buffer(self):
+        q = DiskQueue(self.tmpdir, buffer_size=2)
+        q.push(1)
+        q.push(2)
+        self.assertIsNone(q._file)
+        self.assertEqual(len(q.head), 2)
+        q.push(3)
+        q.push(4)
+        q.push(5)
+        self.assertEqual(len(q.head), 2)
+        self.assertEqual(q._num_on_disk, 3)
+        self.assertEqual(len(q), 5)
+
+        self.assertEqual(q.pop(), 1)
+        self.assertEqual(q._num_on_disk, 3)
+        self.assertEqual(q.pop(), 2)
+        self.assertEqual(len(q.head), 2)
+        self.assertEqual(q._num_on_disk, 1)
+        # FIFO order is preserved, while there are objects on disk
+        q.push(6)
+        self.assertEqual(q._num_on_disk, 2)
+        self.assertListEqual([q.pop() for _ in xrange(4)], [3, 4, 5, 6])
+        self.assertEqual(len(q), 0)
+        # disk space is reclaimed
+        self.assertEqual(q._write_offset, 0)
+        q.close()
+
+    def test_random_case(self):
+        q = DiskQueue(self.tmpdir, buffer_size=3)
+        expected = []
+        for i in xrange(200):
+            if i % 3 == 2:
+                self.assertEqual(q.pop(), expected.pop(0))
+            else:
+                q.push({'value': i})
+                expected.append({'value': i})
+            self.assertEqual(len(q), len(expected))
+        self.assertListEqual([q.pop() for _ in xrange(len(q))], expected)
+        q.close()
+
+    def test_serialize(self):
+        q = DiskQueue(self.tmpdir, buffer_size=1, serialize=str,
+                      deserialize=int)
+        q.push(1)
+        q.push(2)
+        q.push(3)
+        self.assertEqual(q.pop(), 1)
+        self.assertEqual(q.pop(), 2)
+        self.assertEqual(q.pop(), 3)
+        q.close()
+
+    def test_unserializable(self):
+        def serialize(x):
+            if x % 2:
+                raise ValueError('odd')
+            return str(x)
+        q = DiskQueue(self.tmpdir, buffer_size=1, serialize=serialize,
+                      deserialize=int)
+        for i in xrange(6):
+            q.push(i)
+        self.assertEqual(len(q), 6)
+        self.assertEqual(len(q.unserializable), 3)
+        self.assertListEqual([q.pop() for _ in xrange(6)], range(6))
+        self.assertEqual(len(q.unserializable), 0)
+        q.close()
+
+    def test_close(self):
+        q = DiskQueue(self.tmpdir, buffer_size=1)
+        q.push(1)
+        q.push(2)
+        q.close()
+        self.assertListEqual(os.listdir(self.tmpdir), [])
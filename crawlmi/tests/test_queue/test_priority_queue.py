@@ -95,3 +95,23 @@ class PriorityQueueTest(unittest.TestCase):
             active = set(q._active_queues)
             inactive = set(q._inactive_queues)
             self.assertSetEqual(active & inactive, set())
+
+    def test_push_error(self):
+        class FailingQueue(MemoryQueue):
+            def _push(self, value):
+                if value is None:
+                    raise ValueError('None')
+                super(FailingQueue, self)._push(value)
+
+        q = PriorityQueue(lambda priority: FailingQueue())
+        self.assertRaises(ValueError, q.push, 1, None)
+        self.assertEqual(len(q), 0)
+        self.assertRaises(IndexError, q.pop)
+        q.push(2, 2)
+        self.assertRaises(ValueError, q.push, 2, None)
+        self.assertEqual(len(q), 1)
+        self.assertEqual(len(q._active_queues[2]), 1)
+        self.assertEqual(q.pop(), 2)
+        self.assertRaises(IndexError, q.pop)
+        q.push(1, 1)
+        self.assertEqual(q.pop(), 1)
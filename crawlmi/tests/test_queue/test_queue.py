@@ -1,9 +1,9 @@
 from twisted.trial import unittest
 
-from crawlmi.queue import MemoryQueue, ResponseQueue
+from crawlmi.queue import DiskQueue, MemoryQueue, ResponseQueue
 
 
-test_queues = [MemoryQueue, ResponseQueue]
+test_queues = [DiskQueue, MemoryQueue, ResponseQueue]
 
 
 class QueueTest(unittest.TestCase):
@@ -43,3 +43,12 @@ class QueueTest(unittest.TestCase):
     def test_queues(self):
         for q in test_queues:
             self._test(q)
+
+    def test_push_listener(self):
+        pushed = []
+        q = MemoryQueue()
+        q.add_push_listener(lambda: pushed.append(len(q)))
+        q.push(1)
+        q.push(2)
+        q.pop()
+        self.assertListEqual(pushed, [1, 2])
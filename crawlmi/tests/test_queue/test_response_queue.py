@@ -1,3 +1,5 @@
+import mmap
+
 from twisted.trial import unittest
 
 from crawlmi.http import Response
@@ -27,3 +29,35 @@ class ResponseQueueTest(unittest.TestCase):
         q.push(r1)
         q.push(r2)
         self.assertFalse(q.needs_backout())
+
+    def test_disk_body(self):
+        q = ResponseQueue(10)
+        body = mmap.mmap(-1, 100)
+        q.push(Response('', body=body))
+        # memory-mapped bodies are counted separately
+        self.assertEqual(q.active_size, 0)
+        self.assertEqual(q.disk_size, 100)
+        self.assertEqual(q.disk_count, 1)
+        self.assertFalse(q.needs_backout())
+        q.push(Response('', body='x' * 5))
+        self.assertEqual(q.active_size, 5)
+        q.pop()
+        q.pop()
+        self.assertEqual(q.active_size, 0)
+        self.assertEqual(q.disk_size, 0)
+        self.assertEqual(q.disk_count, 0)
+
+    def test_disk_limits(self):
+        q = ResponseQueue(10, disk_size_limit=150)
+        q.push(Response('', body=mmap.mmap(-1, 100)))
+        self.assertFalse(q.needs_backout())
+        q.push(Response('', body=mmap.mmap(-1, 100)))
+        self.assertTrue(q.needs_backout())
+        q.pop()
+        self.assertFalse(q.needs_backout())
+
+        q = ResponseQueue(10, disk_count_limit=2)
+        q.push(Response('', body=mmap.mmap(-1, 10)))
+        self.assertFalse(q.needs_backout())
+        q.push(Response('', body=mmap.mmap(-1, 10)))
+        self.assertTrue(q.needs_backout())
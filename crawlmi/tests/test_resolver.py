@@ -0,0 +1,169 @@
+from twisted.internet import defer
+from twisted.internet.error import DNSLookupError
+from twisted.names import dns, error
+from twisted.trial import unittest
+
+from crawlmi.core.resolver import CachingResolver
+from crawlmi.utils.clock import Clock
+from crawlmi.utils.test import get_engine
+
+
+class MockResolver(object):
+    def __init__(self):
+        self.lookups = []
+
+    def getHostByName(self, name, timeout=None):
+        dfd = defer.Deferred()
+        self.lookups.append((name, dfd))
+        return dfd
+
+
+class MockNamesResolver(MockResolver):
+    def lookupAddress(self, name, timeout=None):
+        return self.getHostByName(name, timeout)
+
+
+class CachingResolverTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        self.stats = get_engine().stats
+        self.base = MockResolver()
+        self.resolver = CachingResolver(self.base, size=2, ttl=10,
+                                        negative_ttl=5, stats=self.stats,
+                                        clock=self.clock)
+        self.results = []
+
+    def _resolve(self, name):
+        dfd = self.resolver.getHostByName(name)
+        dfd.addBoth(self.results.append)
+        return dfd
+
+    def _answer(self, result):
+        name, dfd = self.base.lookups.pop(0)
+        if isinstance(result, Exception):
+            dfd.errback(result)
+        else:
+            dfd.callback(result)
+
+    def test_positive(self):
+        self._resolve('a.com')
+        self.clock.advance(2)
+        self._answer('1.1.1.1')
+        self.assertEqual(self.results, ['1.1.1.1'])
+        self.assertEqual(self.stats.get_value('dns/miss'), 1)
+        self.assertEqual(self.stats.get_value('dns/latency').average, 2)
+        # cached
+        self._resolve('a.com')
+        self.assertEqual(self.results, ['1.1.1.1', '1.1.1.1'])
+        self.assertEqual(len(self.base.lookups), 0)
+        self.assertEqual(self.stats.get_value('dns/hit'), 1)
+        # expired
+        self.clock.advance(10)
+        self._resolve('a.com')
+        self.assertEqual(len(self.base.lookups), 1)
+        self.assertEqual(self.stats.get_value('dns/miss'), 2)
+
+    def test_negative(self):
+        self._resolve('a.com')
+        self._answer(DNSLookupError('a.com'))
+        self._resolve('a.com')
+        self.assertEqual(len(self.base.lookups), 0)
+        self.assertEqual(len(self.results), 2)
+        for result in self.results:
+            self.assertTrue(result.check(DNSLookupError))
+        self.clock.advance(5)
+        self._resolve('a.com')
+        self.assertEqual(len(self.base.lookups), 1)
+
+    def test_timeout_not_cached(self):
+        self._resolve('a.com')
+        self._answer(defer.TimeoutError())
+        self.assertTrue(self.results[0].check(defer.TimeoutError))
+        self._resolve('a.com')
+        self.assertEqual(len(self.base.lookups), 1)
+
+    def test_merge_lookups(self):
+        self._resolve('a.com')
+        self._resolve('a.com')
+        self.assertEqual(len(self.base.lookups), 1)
+        self._answer('1.1.1.1')
+        self.assertEqual(self.results, ['1.1.1.1', '1.1.1.1'])
+
+    def test_lru(self):
+        for name in ['a.com', 'b.com']:
+            self._resolve(name)
+            self._answer('1.1.1.1')
+        # a.com is the most recently used now
+        self._resolve('a.com')
+        self._resolve('c.com')
+        self._answer('1.1.1.1')
+        self.assertListEqual(self.resolver.cache.keys(), ['a.com', 'c.com'])
+
+    def test_prefetch(self):
+        self.resolver.prefetch('a.com')
+        self.resolver.prefetch('a.com')
+        self.assertEqual(len(self.base.lookups), 1)
+        self._resolve('a.com')
+        self._answer('1.1.1.1')
+        self.assertEqual(self.results, ['1.1.1.1'])
+        self.resolver.prefetch('a.com')
+        self.assertEqual(len(self.base.lookups), 0)
+        self.assertEqual(self.stats.get_value('dns/prefetch'), 1)
+        # failed prefetch doesn't log an error
+        self.resolver.prefetch('b.com')
+        self._answer(DNSLookupError('b.com'))
+        self.assertEqual(self.resolver.num_prefetching, 0)
+
+    def test_prefetch_concurrency(self):
+        self.resolver.prefetch('a.com')
+        self.resolver.prefetch('b.com')
+        self.resolver.prefetch('c.com')
+        self.assertEqual(len(self.base.lookups), 2)
+        self.assertEqual(self.stats.get_value('dns/prefetch_skipped'), 1)
+        self._answer('1.1.1.1')
+        self.resolver.prefetch('c.com')
+        self.assertEqual(len(self.base.lookups), 2)
+        # real lookups aren't limited
+        self._resolve('d.com')
+        self.assertEqual(len(self.base.lookups), 3)
+
+    def test_record_ttl(self):
+        self.base = MockNamesResolver()
+        self.resolver.resolver = self.base
+        self._resolve('a.com')
+        answers = [
+            dns.RRHeader('a.com', dns.CNAME, ttl=100,
+                         payload=dns.Record_CNAME('b.com')),
+            dns.RRHeader('b.com', dns.A, ttl=20,
+                         payload=dns.Record_A('1.2.3.4')),
+        ]
+        self._answer((answers, [], []))
+        self.assertEqual(self.results, ['1.2.3.4'])
+        self.clock.advance(19)
+        self._resolve('a.com')
+        self.assertEqual(len(self.base.lookups), 0)
+        self.clock.advance(1)
+        self._resolve('a.com')
+        self.assertEqual(len(self.base.lookups), 1)
+        # no address records
+        self._answer(([], [], []))
+        self.assertTrue(self.results[-1].check(DNSLookupError))
+
+    def test_nameserver_errors(self):
+        self.base = MockNamesResolver()
+        self.resolver.resolver = self.base
+        # non-existent domains are cached
+        for name, exc in [('a.com', error.DNSNameError),
+                          ('b.com', error.AuthoritativeDomainError)]:
+            self._resolve(name)
+            self._answer(exc(name))
+            self.assertTrue(self.results[-1].check(DNSLookupError))
+            self._resolve(name)
+            self.assertEqual(len(self.base.lookups), 0)
+            self.assertTrue(self.results[-1].check(DNSLookupError))
+        # server failures aren't
+        self._resolve('c.com')
+        self._answer(error.DNSServerError('c.com'))
+        self.assertTrue(self.results[-1].check(error.DNSServerError))
+        self._resolve('c.com')
+        self.assertEqual(len(self.base.lookups), 1)
@@ -0,0 +1,41 @@
+from twisted.trial import unittest
+
+from crawlmi.utils.chunked import ChunkedDecoder
+
+
+class ChunkedDecoderTest(unittest.TestCase):
+    chunked_body = ('25\r\n' + 'This is the data in the first chunk\r\n\r\n' +
+                    '1C;name=value\r\n' + 'and this is the second one\r\n\r\n' +
+                    '3\r\n' + 'con\r\n' +
+                    '8\r\n' + 'sequence\r\n' +
+                    '0\r\n' + 'Trailer: value\r\n' + '\r\n')
+    body = ('This is the data in the first chunk\r\n' +
+            'and this is the second one\r\n' +
+            'consequence')
+
+    def test_decode(self):
+        d = ChunkedDecoder()
+        self.assertEqual(d.decode(self.chunked_body + 'rest'), self.body)
+        self.assertTrue(d.last_chunk)
+        self.assertTrue(d.finished)
+        self.assertEqual(d.rest, 'rest')
+
+    def test_incremental(self):
+        d = ChunkedDecoder()
+        output = []
+        for c in self.chunked_body:
+            self.assertFalse(d.finished)
+            output.append(d.decode(c))
+        self.assertEqual(''.join(output), self.body)
+        self.assertTrue(d.finished)
+        self.assertEqual(d.rest, '')
+
+    def test_last_chunk(self):
+        d = ChunkedDecoder()
+        self.assertEqual(d.decode('3\r\nabc\r\n0\r\n'), 'abc')
+        self.assertTrue(d.last_chunk)
+        self.assertFalse(d.finished)
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, ChunkedDecoder().decode, 'xyz\r\n')
+        self.assertRaises(ValueError, ChunkedDecoder().decode, '1\r\nab\r\n')
@@ -83,6 +83,29 @@ class ScheduledCallTest(unittest.TestCase):
         self.clock.advance(1)
         self._check(self.default_args, self.default_kwargs)
 
+    def test_reschedule(self):
+        # not scheduled yet
+        self.assertTrue(self.sc.reschedule(5))
+        self.assertEqual(self.sc.get_time(), 5)
+        # move sooner
+        self.assertTrue(self.sc.reschedule(2))
+        self.assertEqual(self.sc.get_time(), 2)
+        # don't move later
+        self.assertFalse(self.sc.reschedule(3))
+        self.assertEqual(self.sc.get_time(), 2)
+        self.clock.advance(2)
+        self._check(self.default_args, self.default_kwargs)
+        self.assertEqual(self.obj.num_calls, 1)
+        self.clock.advance(5)
+        self.assertEqual(self.obj.num_calls, 1)
+
+        # arguments of the scheduled call are kept
+        over_args = ('crawlmi',)
+        self.sc.schedule(5, *over_args)
+        self.sc.reschedule(0)
+        self.clock.advance(0)
+        self._check(over_args, {})
+
     def test_overwrite(self):
         over_args = ('crawlmi',)
         over_kwargs = {'a': 50, 'd': 'e'}
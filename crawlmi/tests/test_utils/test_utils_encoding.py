@@ -5,7 +5,9 @@ from twisted.trial import unittest
 from crawlmi.http import Headers
 from crawlmi.utils.encoding import (_read_bom, get_encoding_from_headers,
         get_encoding_from_content, normalize_encoding,
-        get_unicode_from_response)
+        get_unicode_from_response, get_encoding_from_response, strip_bom,
+        detect_encoding, EncodingResolver)
+import crawlmi.utils.encoding
 
 
 class EncodingDetectionTest(unittest.TestCase):
@@ -158,6 +160,14 @@ class HtmlConversionTests(unittest.TestCase):
         self._assert_encoding(bom_utf8_str, 'utf-8', 'utf-8', u"hi")
         self._assert_encoding(bom_utf8_str, None, 'utf-8', u"hi")
 
+    def test_strip_bom(self):
+        bom_utf8_str = codecs.BOM_UTF8 + 'hi'
+        self.assertEqual(get_encoding_from_response(
+            MockResponse(bom_utf8_str, None)), 'utf-8')
+        self.assertEqual(strip_bom(bom_utf8_str, 'utf-8'), 'hi')
+        self.assertEqual(strip_bom(bom_utf8_str, 'cp1252'), bom_utf8_str)
+        self.assertEqual(strip_bom('hi', 'utf-8'), 'hi')
+
     def test_utf16_32(self):
         # tools.ietf.org/html/rfc2781 section 4.3
 
@@ -232,3 +242,83 @@ class HtmlConversionTests(unittest.TestCase):
     def test_empty_body(self):
         # if no other method available, the default encoding of utf-8 is used
         self._assert_encoding_detected(None, 'utf-8', "")
+
+
+class MockUrlResponse(MockResponse):
+    def __init__(self, url, body, encoding=None):
+        super(MockUrlResponse, self).__init__(body, encoding)
+        self.url = url
+
+
+class MockChardet(object):
+    def __init__(self, encoding):
+        self.encoding = encoding
+        self.samples = []
+
+    def detect(self, sample):
+        self.samples.append(sample)
+        return {'encoding': self.encoding, 'confidence': 0.9}
+
+
+class EncodingResolverTest(unittest.TestCase):
+    def setUp(self):
+        self.resolver = EncodingResolver(host_cache_size=2)
+        self.old_chardet = crawlmi.utils.encoding.chardet
+
+    def tearDown(self):
+        crawlmi.utils.encoding.chardet = self.old_chardet
+
+    def _resolve(self, url, body, encoding=None):
+        return self.resolver.resolve(MockUrlResponse(url, body, encoding))
+
+    def test_host_encoding(self):
+        latin2 = u'\u010d\u0161'.encode('cp1250')
+        # not confirmed enough
+        self.assertEqual(self._resolve('http://a.com/1', 'x', 'cp1250'), 'cp1250')
+        self.assertEqual(self._resolve('http://a.com/2', latin2), 'utf-8')
+        self.assertEqual(self._resolve('http://a.com/3', 'x', 'cp1250'), 'cp1250')
+        self.assertEqual(self._resolve('http://A.com/4', latin2), 'cp1250')
+        self.assertEqual(self._resolve('http://a.com/5', 'ascii'), 'cp1250')
+        # valid utf-8 and declared encodings are used
+        self.assertEqual(self._resolve('http://a.com/6', '\xc4\x8d'), 'utf-8')
+        self.assertEqual(self._resolve('http://a.com/7', 'x', 'latin2'), 'iso8859-2')
+        # other hosts
+        self.assertEqual(self._resolve('http://b.com/', latin2), 'utf-8')
+
+    def test_confidence(self):
+        for i in xrange(3):
+            self._resolve('http://a.com/', 'x', 'cp1250')
+        self.assertListEqual(self.resolver.hosts['a.com'], ['cp1250', 3])
+        self._resolve('http://a.com/', 'x', 'cp1251')
+        self._resolve('http://a.com/', 'x', 'cp1251')
+        self.assertListEqual(self.resolver.hosts['a.com'], ['cp1250', 1])
+        self._resolve('http://a.com/', 'x', 'cp1251')
+        self.assertListEqual(self.resolver.hosts['a.com'], ['cp1251', 1])
+
+    def test_lru(self):
+        for host in ['a.com', 'b.com', 'a.com', 'c.com']:
+            self._resolve('http://%s/' % host, 'x', 'cp1250')
+        self.assertListEqual(self.resolver.hosts.keys(), ['a.com', 'c.com'])
+
+    def test_disabled(self):
+        self.resolver = EncodingResolver()
+        self._resolve('http://a.com/', 'x', 'cp1250')
+        self.assertEqual(len(self.resolver.hosts), 0)
+
+    def test_auto_detect(self):
+        chardet = crawlmi.utils.encoding.chardet = MockChardet('cp1250')
+        self.resolver = EncodingResolver(auto_detect=True, sample_size=10,
+                                         host_cache_size=10, min_confidence=1)
+        body = '\xe8' * 100
+        self.assertEqual(self._resolve('http://a.com/', body), 'cp1250')
+        self.assertListEqual(chardet.samples, ['\xe8' * 10])
+        # detected encoding is remembered
+        self.assertEqual(self._resolve('http://a.com/', body), 'cp1250')
+        self.assertEqual(len(chardet.samples), 1)
+
+    def test_detect_encoding(self):
+        crawlmi.utils.encoding.chardet = MockChardet('ascii')
+        self.assertEqual(detect_encoding('abc', sample_size=3), 'ascii')
+        self.assertIsNone(detect_encoding('abc\xe8', sample_size=3))
+        crawlmi.utils.encoding.chardet = None
+        self.assertIsNone(detect_encoding('abc'))
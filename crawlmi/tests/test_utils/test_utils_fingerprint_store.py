@@ -0,0 +1,128 @@
+from cStringIO import StringIO
+import hashlib
+
+from twisted.trial import unittest
+
+from crawlmi.settings import Settings
+from crawlmi.utils.fingerprint_store import (SetFingerprintStore,
+    PackedFingerprintStore, BloomFingerprintStore)
+
+
+def _fingerprint(i):
+    return hashlib.sha1(str(i)).hexdigest()
+
+
+class SetFingerprintStoreTest(unittest.TestCase):
+    store_class = SetFingerprintStore
+    settings = {}
+
+    def _get_store(self, **settings):
+        values = dict(self.settings)
+        values.update(settings)
+        return self.store_class(Settings(values))
+
+    def test_add(self):
+        store = self._get_store()
+        fps = [_fingerprint(i) for i in xrange(1000)]
+        for fp in fps:
+            self.assertNotIn(fp, store)
+            self.assertTrue(store.add(fp))
+            self.assertIn(fp, store)
+        self.assertEqual(len(store), 1000)
+        for fp in fps:
+            self.assertFalse(store.add(fp))
+        self.assertEqual(len(store), 1000)
+
+    def test_write_load(self):
+        store = self._get_store()
+        fps = [_fingerprint(i) for i in xrange(500)]
+        for fp in fps:
+            store.add(fp)
+        f = StringIO()
+        store.write(f)
+        data = f.getvalue()
+
+        loaded = self._get_store()
+        loaded.load(data)
+        self.assertEqual(len(loaded), 500)
+        for fp in fps:
+            self.assertIn(fp, loaded)
+        self.assertTrue(loaded.add(_fingerprint(500)))
+        self.assertRaises(ValueError, self._get_store().load, data[:-1])
+        self.assertRaises(ValueError, self._get_store().load, 'XXXX' + data[4:])
+        self.assertRaises(ValueError, self._get_store().load, '')
+
+    def test_copy(self):
+        store = self._get_store()
+        for i in xrange(100):
+            store.add(_fingerprint(i))
+        copied = store.copy()
+        for i in xrange(100, 200):
+            store.add(_fingerprint(i))
+        self.assertEqual(len(copied), 100)
+        self.assertIn(_fingerprint(99), copied)
+        self.assertNotIn(_fingerprint(150), copied)
+        self.assertTrue(copied.add(_fingerprint(150)))
+
+
+class PackedFingerprintStoreTest(SetFingerprintStoreTest):
+    store_class = PackedFingerprintStore
+    settings = {'DUPLICATE_FILTER_DIGEST_SIZE': 8,
+                'DUPLICATE_FILTER_CAPACITY': 10}
+
+    def test_resize(self):
+        store = self._get_store()
+        self.assertEqual(store.capacity, 16)
+        for i in xrange(12):
+            store.add(_fingerprint(i))
+        self.assertEqual(store.capacity, 32)
+        self.assertEqual(len(store.table), 32 * 8)
+        for i in xrange(12):
+            self.assertIn(_fingerprint(i), store)
+
+    def test_collisions(self):
+        store = self._get_store()
+        # the same first bytes - the same slot
+        fp1 = '00000001' + 'a' * 32
+        fp2 = '00000001' + 'b' * 32
+        self.assertTrue(store.add(fp1))
+        self.assertTrue(store.add(fp2))
+        self.assertFalse(store.add(fp1))
+        self.assertFalse(store.add(fp2))
+        # fingerprints differing only past the digest size are the same
+        self.assertFalse(store.add('00000001' + 'a' * 8 + 'c' * 24))
+
+    def test_zero_digest(self):
+        store = self._get_store()
+        zero = '0' * 40
+        self.assertNotIn(zero, store)
+        self.assertTrue(store.add(zero))
+        self.assertIn(zero, store)
+        self.assertFalse(store.add(zero))
+        self.assertEqual(len(store), 1)
+
+    def test_invalid_digest_size(self):
+        self.assertRaises(ValueError, self._get_store,
+                          DUPLICATE_FILTER_DIGEST_SIZE=2)
+
+
+class BloomFingerprintStoreTest(SetFingerprintStoreTest):
+    store_class = BloomFingerprintStore
+    settings = {'DUPLICATE_FILTER_CAPACITY': 100,
+                'DUPLICATE_FILTER_ERROR_RATE': 0.00001}
+
+    def test_scaling(self):
+        store = self._get_store(DUPLICATE_FILTER_ERROR_RATE=0.001)
+        for i in xrange(1000):
+            store.add(_fingerprint(i))
+        # 100 + 200 + 400 + 800
+        self.assertEqual(len(store.filters), 4)
+        self.assertEqual(store.filters[1].capacity, 200)
+        self.assertTrue(store.filters[1].num_hashes > store.filters[0].num_hashes)
+        false_positives = sum(_fingerprint(i) in store
+                              for i in xrange(1000, 11000))
+        self.assertLess(false_positives, 30)
+
+    def test_invalid_error_rate(self):
+        self.assertRaises(ValueError, self._get_store,
+                          DUPLICATE_FILTER_ERROR_RATE=0)
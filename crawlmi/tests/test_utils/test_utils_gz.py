@@ -1,11 +1,12 @@
 from os.path import join
+import zlib
 
 from twisted.trial import unittest
 
 from crawlmi.exceptions import DecompressSizeError
 from crawlmi.http import Response, Headers
 from crawlmi.tests import tests_datadir
-from crawlmi.utils.gz import gunzip, is_gzipped
+from crawlmi.utils.gz import gunzip, is_gzipped, StreamDecompressor
 
 
 SAMPLE_DIR = join(tests_datadir, 'compressed')
@@ -36,6 +37,44 @@ class GzTest(unittest.TestCase):
             self.assertEqual(len(gunzip(raw, 9950)), 9950)
             self.assertRaises(DecompressSizeError, gunzip, raw, 9949)
 
+    def _stream_decompress(self, data, encoding, max_length=0, chunk=100):
+        d = StreamDecompressor(encoding, max_length)
+        output = [d.decompress(data[i:i + chunk])
+                  for i in xrange(0, len(data), chunk)]
+        output.append(d.flush())
+        return ''.join(output)
+
+    def test_stream_decompressor(self):
+        with open(join(SAMPLE_DIR, 'feed-sample1.xml'), 'rb') as f:
+            plain = f.read()
+        with open(join(SAMPLE_DIR, 'feed-sample1.xml.gz'), 'rb') as f:
+            raw = f.read()
+        self.assertEqual(self._stream_decompress(raw, 'gzip'), plain)
+        self.assertEqual(self._stream_decompress(raw, 'gzip', chunk=1), plain)
+        self.assertEqual(self._stream_decompress(raw, 'gzip', 9950), plain)
+        self.assertRaises(DecompressSizeError, self._stream_decompress,
+                          raw, 'gzip', 9949)
+
+    def test_stream_decompressor_deflate(self):
+        for name, wbits in [('html-zlibdeflate.bin', zlib.MAX_WBITS),
+                            ('html-rawdeflate.bin', -zlib.MAX_WBITS)]:
+            with open(join(SAMPLE_DIR, name), 'rb') as f:
+                raw = f.read()
+            plain = zlib.decompress(raw, wbits)
+            self.assertEqual(self._stream_decompress(raw, 'deflate'), plain)
+            self.assertEqual(
+                self._stream_decompress(raw, 'deflate', chunk=1), plain)
+
+    def test_stream_decompressor_truncated(self):
+        with open(join(SAMPLE_DIR, 'truncated-crc-error.gz'), 'rb') as f:
+            text = self._stream_decompress(f.read(), 'gzip')
+            self.assertTrue(text.endswith('</html'))
+
+    def test_stream_decompressor_invalid(self):
+        with open(join(SAMPLE_DIR, 'feed-sample1.xml'), 'rb') as f:
+            self.assertRaises(zlib.error, self._stream_decompress, f.read(),
+                              'gzip')
+
     def test_is_x_gzipped_right(self):
         hdrs = Headers({"Content-Type": "application/x-gzip"})
         r1 = Response("http://www.example.com", headers=hdrs)
@@ -1,6 +1,6 @@
 from twisted.trial import unittest
 
-from crawlmi.utils.html import remove_entities
+from crawlmi.utils.html import remove_entities, parse_tag_attrs, scan_head
 
 
 class UtilsHtmlTest(unittest.TestCase):
@@ -33,3 +33,46 @@ class UtilsHtmlTest(unittest.TestCase):
         # encoding
         self.assertEqual(remove_entities('x\x99&#153;&#8482;y', encoding='cp1252'),
                          u'x\u2122\u2122\u2122y')
+
+    def test_parse_tag_attrs(self):
+        self.assertListEqual(
+            parse_tag_attrs(""" HREF="a b" rel='x' checked data=c href="d" /"""),
+            [('href', 'a b'), ('rel', 'x'), ('checked', ''), ('data', 'c')])
+        self.assertListEqual(parse_tag_attrs(''), [])
+
+    def test_scan_head(self):
+        head = scan_head('''<?xml version="1.0" encoding="latin2"?>
+            <html><head>
+            <!-- <base href="/comment/"> -->
+            <script>var s = '<link rel="canonical" href="/script">';</script>
+            <META http-equiv="Refresh" content="5.5; URL='/new?a=1&amp;b=2'">
+            <base target="_blank" href=" /base/ ">
+            <link href="/canonical" rel="Canonical nofollow">
+            <meta charset="utf-8">
+            </head><body></body></html>''')
+        self.assertEqual(head.charset, 'latin2')
+        self.assertEqual(head.base_href, '/base/')
+        self.assertEqual(head.canonical_href, '/canonical')
+        self.assertEqual(head.refresh, (5.5, "'/new?a=1&amp;b=2'"))
+
+    def test_scan_head_charset(self):
+        self.assertEqual(scan_head('<meta charset=" utf-8">').charset, 'utf-8')
+        self.assertEqual(scan_head(
+            '<meta content="text/html; charset=cp1251" http-equiv="Content-Type">').charset,
+            'cp1251')
+        self.assertIsNone(scan_head('<meta content="text/html">').charset)
+        # charset must be declared before the body and in the first 2048 bytes
+        self.assertIsNone(scan_head('<body><meta charset="utf-8">').charset)
+        self.assertIsNone(scan_head(' ' * 2048 + '<meta charset="utf-8">').charset)
+        # only the start of the document is scanned
+        head = scan_head('<p>' * 2000 + '<base href="/a">')
+        self.assertIsNone(head.base_href)
+        head = scan_head('<p>' * 2000 + '<base href="/a">', size=7000)
+        self.assertEqual(head.base_href, '/a')
+
+    def test_scan_head_empty(self):
+        head = scan_head('')
+        self.assertIsNone(head.charset)
+        self.assertIsNone(head.base_href)
+        self.assertIsNone(head.canonical_href)
+        self.assertIsNone(head.refresh)
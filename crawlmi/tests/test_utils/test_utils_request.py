@@ -1,8 +1,24 @@
+from functools import partial
+
+from twisted.internet import defer, threads
 from twisted.trial import unittest
 
 from crawlmi.http import Request
+from crawlmi.spider import BaseSpider
 from crawlmi.utils.request import (request_http_repr, request_fingerprint,
-    _fingerprint_cache)
+    _fingerprint_cache, request_to_dict, request_from_dict)
+
+
+class DictSpider(BaseSpider):
+    def parse_item(self, response):
+        pass
+
+    def handle_error(self, failure):
+        pass
+
+
+class DictRequest(Request):
+    pass
 
 
 class UtilsRequestTest(unittest.TestCase):
@@ -56,6 +72,14 @@ class UtilsRequestTest(unittest.TestCase):
         fp2 = request_fingerprint(r2)
         self.assertNotEqual(fp1, fp2)
 
+    @defer.inlineCallbacks
+    def test_request_fingerprint_thread(self):
+        r1 = Request('http://www.example.com/query?id=111&cat=222')
+        fp = yield threads.deferToThread(request_fingerprint, r1)
+        # other threads don't use the cache
+        self.assertNotIn(r1, _fingerprint_cache)
+        self.assertEqual(fp, request_fingerprint(r1))
+
     def test_request_http_repr(self):
         r1 = Request('http://www.example.com')
         self.assertEqual(request_http_repr(r1), 'GET / HTTP/1.1\r\nHost: www.example.com\r\n\r\n')
@@ -65,3 +89,46 @@ class UtilsRequestTest(unittest.TestCase):
 
         r1 = Request('http://www.example.com', method='POST', headers={'Content-type': 'text/html'}, body='Some body')
         self.assertEqual(request_http_repr(r1), 'POST / HTTP/1.1\r\nHost: www.example.com\r\nContent-Type: text/html\r\n\r\nSome body')
+
+    def test_request_to_dict(self):
+        r1 = Request('http://www.example.com/page?a=1', method='POST',
+                     headers={'Accept': 'text/html'}, body='data',
+                     cookies={'a': 'b'}, meta={'x': 1}, proxy='http://proxy/',
+                     priority=10, history=['http://www.example.com/'])
+        r2 = request_from_dict(request_to_dict(r1))
+        for attr in ['url', 'method', 'headers', 'body', 'cookies', 'meta',
+                     'proxy', 'priority', 'history', 'encoding', 'callback',
+                     'errback']:
+            self.assertEqual(getattr(r1, attr), getattr(r2, attr))
+
+    def test_request_to_dict_class(self):
+        r1 = DictRequest('http://www.example.com')
+        r2 = request_from_dict(request_to_dict(r1))
+        self.assertIs(type(r2), DictRequest)
+        r1 = Request('http://www.example.com')
+        self.assertIs(type(request_from_dict(request_to_dict(r1))), Request)
+
+    def test_request_to_dict_callbacks(self):
+        spider = DictSpider('dict')
+        r1 = Request('http://www.example.com', callback=spider.parse_item,
+                     errback=spider.handle_error)
+        d = request_to_dict(r1, spider)
+        self.assertEqual(d['callback'], 'parse_item')
+        self.assertEqual(d['errback'], 'handle_error')
+        r2 = request_from_dict(d, spider)
+        self.assertEqual(r2.callback, spider.parse_item)
+        self.assertEqual(r2.errback, spider.handle_error)
+
+        # callback not bound to the spider
+        r1 = Request('http://www.example.com', callback=lambda r: r)
+        self.assertRaises(ValueError, request_to_dict, r1, spider)
+        r1 = Request('http://www.example.com',
+                     callback=DictSpider('other').parse_item)
+        self.assertRaises(ValueError, request_to_dict, r1, spider)
+        r1 = Request('http://www.example.com',
+                     callback=partial(spider.parse_item))
+        self.assertRaises(ValueError, request_to_dict, r1, spider)
+        self.assertRaises(ValueError, request_from_dict,
+                          {'url': 'http://www.example.com',
+                           'callback': 'missing', 'errback': None},
+                          spider)
@@ -0,0 +1,21 @@
+from twisted.trial import unittest
+
+from crawlmi.http import Request
+from crawlmi.utils import trackref
+
+
+class TrackrefTest(unittest.TestCase):
+    def tearDown(self):
+        trackref.set_tracking(False)
+        trackref.live_refs.clear()
+
+    def test_tracking(self):
+        trackref.set_tracking(False)
+        r1 = Request('http://github.com/')
+        self.assertNotIn(r1, trackref.live_refs[Request])
+
+        trackref.set_tracking(True)
+        r2 = Request('http://github.com/')
+        self.assertIn(r2, trackref.live_refs[Request])
+        self.assertIs(trackref.get_oldest('Request'), r2)
+        self.assertListEqual(list(trackref.iter_all('Request')), [r2])
@@ -1,5 +1,7 @@
+from twisted.internet import defer, threads
 from twisted.trial import unittest
 
+from crawlmi.utils import url as url_utils
 from crawlmi.utils.url import (is_url, is_url_from_any_domain, any_to_uri,
                                requote_url, correct_relative_path,
                                has_url_any_extension, canonicalize_url)
@@ -227,3 +229,47 @@ class UrlTest(unittest.TestCase):
         self.assertEqual(canonicalize_url(
             'http://www.example.com/?a=b&c=d', strip_query_params=['a', 'c']),
             'http://www.example.com/')
+
+    def test_canonicalize_url_cache(self):
+        url_utils._canonicalize_cache.clear()
+        url = 'http://www.example.com/do?c=1&b=2&a=3'
+        self.assertEqual(canonicalize_url(url), 'http://www.example.com/do?a=3&b=2&c=1')
+        self.assertEqual(len(url_utils._canonicalize_cache), 1)
+        self.assertEqual(canonicalize_url(url), 'http://www.example.com/do?a=3&b=2&c=1')
+        self.assertEqual(len(url_utils._canonicalize_cache), 1)
+        # different arguments are cached separately
+        self.assertEqual(canonicalize_url(url, strip_query_params=['a']),
+                         'http://www.example.com/do?b=2&c=1')
+        self.assertEqual(canonicalize_url(u'http://www.example.com/\xa3',
+                                          encoding='latin-1'),
+                         'http://www.example.com/%A3')
+        self.assertEqual(canonicalize_url(u'http://www.example.com/\xa3'),
+                         'http://www.example.com/%C2%A3')
+        self.assertEqual(len(url_utils._canonicalize_cache), 4)
+
+        old_size = url_utils._canonicalize_cache_size
+        url_utils._canonicalize_cache_size = 2
+        try:
+            canonicalize_url(url)  # the most recently used now
+            canonicalize_url('http://www.example.com/other')
+            self.assertEqual(len(url_utils._canonicalize_cache), 2)
+            self.assertListEqual([k[0] for k in url_utils._canonicalize_cache],
+                                 [url, 'http://www.example.com/other'])
+        finally:
+            url_utils._canonicalize_cache_size = old_size
+            url_utils._canonicalize_cache.clear()
+
+    @defer.inlineCallbacks
+    def test_canonicalize_url_thread(self):
+        url_utils._canonicalize_cache.clear()
+        url = 'http://www.example.com/do?c=1&b=2&a=3'
+        result = yield threads.deferToThread(canonicalize_url, url)
+        self.assertEqual(result, 'http://www.example.com/do?a=3&b=2&c=1')
+        # other threads don't use the cache
+        self.assertEqual(len(url_utils._canonicalize_cache), 0)
+
+    def test_canonicalize_url_relative_path(self):
+        self.assertEqual(canonicalize_url('http://www.example.com/a/./b/../c.html'),
+                         'http://www.example.com/a/c.html')
+        self.assertEqual(canonicalize_url('http://www.example.com/a.b/.c/'),
+                         'http://www.example.com/a.b/.c/')
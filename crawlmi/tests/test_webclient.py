@@ -1,7 +1,11 @@
+import mmap
 import os
+import zlib
 
 from twisted.internet import reactor, defer
+from twisted.internet.error import ConnectionDone
 from twisted.protocols.policies import WrappingFactory
+from twisted.python.failure import Failure
 from twisted.python.filepath import FilePath
 from twisted.test.proto_helpers import StringTransport
 from twisted.trial import unittest
@@ -10,10 +14,12 @@ from twisted.web.test.test_webclient import (ForeverTakingResource,
         ErrorResource, NoLengthResource, HostHeaderResource,
         PayloadResource, BrokenDownloadResource)
 
-from crawlmi.core.webclient import (BadHttpHeaderError, CrawlmiHTTPClient,
+from crawlmi.core.connection_pool import ConnectionPool
+from crawlmi.core.webclient import (BadHttpHeaderError, BodyBuffer,
+                                    CrawlmiHTTPClient,
                                     CrawlmiHTPPClientFactory, _parse_url_args)
-from crawlmi.exceptions import DownloadSizeError
-from crawlmi.http import Headers, Request
+from crawlmi.exceptions import DecompressSizeError, DownloadSizeError
+from crawlmi.http import Headers, HtmlResponse, Request
 
 
 class ParseUrlTest(unittest.TestCase):
@@ -178,6 +184,297 @@ class HTTPPageGetterTest(unittest.TestCase):
         return self.assertFailure(factory.deferred, BadHttpHeaderError)
 
 
+class DecompressionTest(unittest.TestCase):
+    def _get_protocol(self, download_size=0):
+        factory = CrawlmiHTPPClientFactory(Request(url='http://foo/bar'),
+                                           download_size=download_size,
+                                           decompress=True)
+        protocol = CrawlmiHTTPClient()
+        protocol.factory = factory
+        protocol.makeConnection(StringTransport())
+        return protocol
+
+    def _receive(self, protocol, body, encoding='deflate'):
+        protocol.dataReceived('HTTP/1.0 200 OK\r\n'
+                              'Content-Encoding: %s\r\n'
+                              'Content-Length: %d\r\n'
+                              '\r\n' % (encoding, len(body)))
+        for c in body:
+            protocol.dataReceived(c)
+
+    def test_decompress(self):
+        def _test(response):
+            self.assertEqual(response.body, 'x' * 1000)
+            self.assertNotIn('Content-Encoding', response.headers)
+
+        protocol = self._get_protocol()
+        self._receive(protocol, zlib.compress('x' * 1000))
+        return protocol.factory.deferred.addCallback(_test)
+
+    def test_unknown_encoding(self):
+        def _test(response):
+            self.assertEqual(response.body, 'abc')
+            self.assertEqual(response.headers['Content-Encoding'], 'br')
+
+        protocol = self._get_protocol()
+        self._receive(protocol, 'abc', 'br')
+        return protocol.factory.deferred.addCallback(_test)
+
+    def test_size_limit(self):
+        protocol = self._get_protocol(download_size=100)
+        self._receive(protocol, zlib.compress('x' * 1000))
+        # connection is aborted before the whole body is received
+        self.assertTrue(protocol.transport.disconnecting)
+        self.assertLess(protocol.body_size, 100)
+        return self.assertFailure(protocol.factory.deferred,
+                                  DecompressSizeError)
+
+    def test_invalid_data(self):
+        protocol = self._get_protocol()
+        self._receive(protocol, 'not compressed data')
+        self.assertTrue(protocol.transport.disconnecting)
+        return self.assertFailure(protocol.factory.deferred, zlib.error)
+
+
+class ChunkedTest(unittest.TestCase):
+    def setUp(self):
+        self.pool = ConnectionPool()
+        self.factory = CrawlmiHTPPClientFactory(Request(url='http://foo/bar'),
+                                                pool=self.pool)
+        self.protocol = CrawlmiHTTPClient()
+        self.protocol.factory = self.factory
+        self.protocol.makeConnection(StringTransport())
+        self.protocol.dataReceived('HTTP/1.1 200 OK\r\n'
+                                   'Connection: keep-alive\r\n'
+                                   'Transfer-Encoding: chunked\r\n'
+                                   '\r\n')
+
+    def tearDown(self):
+        self.pool.close()
+
+    def test_chunked(self):
+        def _test(response):
+            self.assertEqual(response.body, 'hello world')
+            self.assertNotIn('Transfer-Encoding', response.headers)
+
+        for c in '5\r\nhello\r\n6\r\n world\r\n0\r\n\r\n':
+            self.protocol.dataReceived(c)
+        # the end of the response is known, so the connection is reusable
+        self.assertEqual(len(self.pool), 1)
+        return self.factory.deferred.addCallback(_test)
+
+    def test_incomplete(self):
+        self.protocol.dataReceived('5\r\nhello\r\n')
+        self.protocol.connectionLost(Failure(ConnectionDone()))
+        return self.assertFailure(self.factory.deferred, ConnectionDone)
+
+    def test_invalid(self):
+        self.protocol.dataReceived('hello\r\n')
+        self.assertTrue(self.protocol.transport.disconnecting)
+        return self.assertFailure(self.factory.deferred, ValueError)
+
+
+class EarlyAbortTest(unittest.TestCase):
+    def setUp(self):
+        self.pool = ConnectionPool()
+
+    def tearDown(self):
+        self.pool.close()
+
+    def _get_protocol(self, **kwargs):
+        factory = CrawlmiHTPPClientFactory(Request(url='http://foo/bar'),
+                                           pool=self.pool, **kwargs)
+        protocol = CrawlmiHTTPClient()
+        protocol.factory = factory
+        protocol.makeConnection(StringTransport())
+        return protocol
+
+    def test_filtered(self):
+        def _filter(response):
+            self.assertIsInstance(response, HtmlResponse)
+            self.assertEqual(response.request.url, 'http://foo/bar')
+            if response.status != 200:
+                return 'non 200'
+
+        def _test(response):
+            self.assertEqual(response.status, 404)
+            self.assertEqual(response.body, '')
+            self.assertIn('filtered', response.flags)
+
+        protocol = self._get_protocol(response_filter=_filter)
+        protocol.dataReceived('HTTP/1.1 404 Not Found\r\n'
+                              'Content-Type: text/html\r\n'
+                              'Content-Length: 10\r\n'
+                              '\r\n')
+        # body was not received, so the connection can't be reused
+        self.assertTrue(protocol.transport.disconnecting)
+        self.assertEqual(len(self.pool), 0)
+        return protocol.factory.deferred.addCallback(_test)
+
+    def test_not_filtered(self):
+        protocol = self._get_protocol(response_filter=lambda r: None)
+        protocol.dataReceived('HTTP/1.1 200 OK\r\n'
+                              'Content-Length: 5\r\n'
+                              '\r\nhello')
+        return protocol.factory.deferred.addCallback(
+            lambda r: self.assertEqual(r.flags, []))
+
+    def test_content_length(self):
+        protocol = self._get_protocol(download_size=5)
+        protocol.dataReceived('HTTP/1.1 200 OK\r\n'
+                              'Content-Length: 10\r\n'
+                              '\r\n')
+        self.assertTrue(protocol.transport.disconnecting)
+        return self.assertFailure(protocol.factory.deferred,
+                                  DownloadSizeError)
+
+
+class BodyBufferTest(unittest.TestCase):
+    def test_memory(self):
+        b = BodyBuffer()
+        b.write('abc')
+        b.write('def')
+        self.assertEqual(b.size, 6)
+        self.assertEqual(b.getvalue(), 'abcdef')
+
+    def test_disk(self):
+        b = BodyBuffer(disk_threshold=4)
+        b.write('abc')
+        self.assertIsNone(b._file)
+        b.write('def')
+        self.assertIsNotNone(b._file)
+        b.write('ghi')
+        body = b.getvalue()
+        self.assertIsInstance(body, mmap.mmap)
+        self.assertEqual(len(body), 9)
+        self.assertEqual(body[:], 'abcdefghi')
+        # body is read-only
+        self.assertRaises(TypeError, body.__setitem__, 0, 'x')
+
+
+class PersistentConnectionTest(unittest.TestCase):
+    def setUp(self):
+        self.pool = ConnectionPool()
+        self.transport = StringTransport()
+        self.protocol = CrawlmiHTTPClient()
+
+    def tearDown(self):
+        self.pool.close()
+
+    def _get_factory(self, url='http://foo/bar', **kwargs):
+        return CrawlmiHTPPClientFactory(Request(url=url, **kwargs), timeout=0,
+                                        pool=self.pool)
+
+    def _connect(self, factory):
+        self.protocol.factory = factory
+        self.protocol.makeConnection(self.transport)
+
+    def test_reuse(self):
+        factory1 = self._get_factory()
+        self._connect(factory1)
+        self.assertEqual(self.transport.value(),
+            'GET /bar HTTP/1.0\r\n'
+            'Host: foo\r\n'
+            'Connection: keep-alive\r\n'
+            '\r\n')
+        self.protocol.dataReceived(
+            'HTTP/1.1 200 OK\r\nConnection: keep-alive\r\n'
+            'Content-Length: 5\r\n\r\nhello')
+        self.assertEqual(len(self.pool), 1)
+        self.assertFalse(self.transport.disconnecting)
+
+        # reuse the connection
+        self.transport.clear()
+        factory2 = self._get_factory('http://foo/baz')
+        self.assertIs(self.pool.get_connection(factory2.pool_key),
+                      self.protocol)
+        factory2.reuse_connection(self.protocol)
+        self.assertTrue(self.transport.value().startswith('GET /baz HTTP/1.0'))
+        self.protocol.dataReceived(
+            'HTTP/1.0 404 Not Found\r\nConnection: Keep-Alive\r\n'
+            'Content-Length: 3\r\n\r\nabc')
+        self.assertEqual(len(self.pool), 1)
+
+        dfd = defer.gatherResults([factory1.deferred, factory2.deferred])
+        def _check(responses):
+            self.assertEqual(responses[0].status, 200)
+            self.assertEqual(responses[0].body, 'hello')
+            self.assertEqual(responses[0].url, 'http://foo/bar')
+            self.assertEqual(responses[1].status, 404)
+            self.assertEqual(responses[1].body, 'abc')
+            self.assertEqual(responses[1].url, 'http://foo/baz')
+        return dfd.addCallback(_check)
+
+    def test_connection_header(self):
+        factory = self._get_factory(method='POST', body='data')
+        self._connect(factory)
+        self.assertEqual(self.transport.value(),
+            'POST /bar HTTP/1.0\r\n'
+            'Host: foo\r\n'
+            'Connection: close\r\n'
+            'Content-Length: 4\r\n'
+            '\r\n'
+            'data')
+
+    def test_head(self):
+        factory = self._get_factory(method='HEAD')
+        self._connect(factory)
+        self.protocol.dataReceived(
+            'HTTP/1.1 200 OK\r\nConnection: keep-alive\r\n'
+            'Content-Length: 5\r\n\r\n')
+        self.assertEqual(len(self.pool), 1)
+        return factory.deferred.addCallback(
+            lambda r: self.assertEqual(r.body, ''))
+
+    def _test_not_reused(self, data, **kwargs):
+        self.transport = StringTransport()
+        self.protocol = CrawlmiHTTPClient()
+        factory = self._get_factory(**kwargs)
+        self._connect(factory)
+        self.protocol.dataReceived(data)
+        self.protocol.connectionLost(Failure(ConnectionDone()))
+        self.assertEqual(len(self.pool), 0)
+        self.assertTrue(self.transport.disconnecting)
+        return factory.deferred
+
+    def test_not_reused(self):
+        return defer.gatherResults([
+            # no keep-alive
+            self._test_not_reused(
+                'HTTP/1.1 200 OK\r\nConnection: close\r\n'
+                'Content-Length: 5\r\n\r\nhello'),
+            self._test_not_reused(
+                'HTTP/1.0 200 OK\r\nContent-Length: 5\r\n\r\nhello'),
+            # the request is HTTP/1.0, so keep-alive must be explicit
+            self._test_not_reused(
+                'HTTP/1.1 200 OK\r\nContent-Length: 5\r\n\r\nhello'),
+            # connection isn't kept alive for the requests with body
+            self._test_not_reused(
+                'HTTP/1.1 200 OK\r\nConnection: keep-alive\r\n'
+                'Content-Length: 5\r\n\r\nhello',
+                method='POST', body='data'),
+            self._test_not_reused(
+                'HTTP/1.1 200 OK\r\nConnection: keep-alive\r\n'
+                'Content-Length: 5\r\n\r\nhello', method='DELETE'),
+            # unknown length
+            self._test_not_reused('HTTP/1.1 200 OK\r\n\r\nhello'),
+            # unexpected data
+            self._test_not_reused(
+                'HTTP/1.1 200 OK\r\nContent-Length: 5\r\n\r\nhello!'),
+        ])
+
+    def test_connection_lost_in_pool(self):
+        factory = self._get_factory()
+        self._connect(factory)
+        self.protocol.dataReceived(
+            'HTTP/1.1 200 OK\r\nConnection: keep-alive\r\n'
+            'Content-Length: 5\r\n\r\nhello')
+        self.assertEqual(len(self.pool), 1)
+        self.protocol.connectionLost(Failure(ConnectionDone()))
+        self.assertEqual(len(self.pool), 0)
+        return factory.deferred
+
+
 class WebClientTest(unittest.TestCase):
     def _listen(self, site):
         return reactor.listenTCP(0, site, interface='127.0.0.1')
@@ -210,8 +507,10 @@ class WebClientTest(unittest.TestCase):
         def _clientfactory(*args, **kwargs):
             timeout = kwargs.pop('timeout', 0)
             download_size = kwargs.pop('download_size', 0)
+            disk_threshold = kwargs.pop('disk_threshold', 0)
             f = CrawlmiHTPPClientFactory(Request(*args, **kwargs),
-                timeout=timeout, download_size=download_size)
+                timeout=timeout, download_size=download_size,
+                disk_threshold=disk_threshold)
             f.deferred.addCallback(lambda r: r.body)
             return f
         from twisted.web.client import _makeGetterFactory
@@ -222,6 +521,15 @@ class WebClientTest(unittest.TestCase):
         s = '0123456789' * 10
         return self.get_page(self.get_url('payload'), body=s).addCallback(self.assertEquals, s)
 
+    def test_disk_body(self):
+        def _test(body):
+            self.assertIsInstance(body, mmap.mmap)
+            self.assertEqual(body[:], s)
+
+        s = '0123456789' * 10
+        d = self.get_page(self.get_url('payload'), body=s, disk_threshold=50)
+        return d.addCallback(_test)
+
     def test_size_limit(self):
         s = 'x' * 100
         return self.assertFailure(
@@ -0,0 +1,64 @@
+class ChunkedDecoder(object):
+    '''Incremental decoder of the chunked transfer encoding. See:
+    http://en.wikipedia.org/wiki/Chunked_transfer_encoding
+
+    Feed the encoded data to `decode()` as they arrive. `last_chunk` is set,
+    when the terminating zero-size chunk is received and `finished` is set,
+    when the whole encoded body (including the trailer) is consumed. Data
+    following the encoded body are then available in `rest`.
+    '''
+
+    def __init__(self):
+        self.last_chunk = False
+        self.finished = False
+        self.rest = ''
+        self._state = 'size'
+        self._remaining = 0  # number of bytes left in the current chunk
+        self._line = ''  # incomplete line from the previous data
+
+    def decode(self, data):
+        '''Return the decoded part of the `data`. ValueError is raised on
+        malformed input.
+        '''
+        output = []
+        pos = 0
+        while pos < len(data) and not self.finished:
+            if self._state == 'data':
+                part = data[pos:pos + self._remaining]
+                output.append(part)
+                pos += len(part)
+                self._remaining -= len(part)
+                if not self._remaining:
+                    self._state = 'data_end'
+                continue
+            end = data.find('\n', pos)
+            if end == -1:
+                self._line += data[pos:]
+                break
+            line = (self._line + data[pos:end]).strip()
+            self._line = ''
+            pos = end + 1
+            self._process_line(line)
+        if self.finished:
+            self.rest = data[pos:]
+        return ''.join(output)
+
+    def _process_line(self, line):
+        if self._state == 'size':
+            # ignore chunk extensions
+            size = int(line.split(';', 1)[0], 16)
+            if size < 0:
+                raise ValueError('Invalid chunk size: %s' % line)
+            if size:
+                self._remaining = size
+                self._state = 'data'
+            else:
+                self.last_chunk = True
+                self._state = 'trailer'
+        elif self._state == 'data_end':
+            if line:
+                raise ValueError('Chunk is longer than its size.')
+            self._state = 'size'
+        elif not line:
+            # empty line terminates the trailer
+            self.finished = True
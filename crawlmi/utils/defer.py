@@ -132,6 +132,19 @@ class ScheduledCall(object):
             return True
         return False
 
+    def reschedule(self, delay=0):
+        '''Same as `schedule()`, but if the function is already scheduled to
+        be called later than in `delay` seconds, move the call sooner.
+        Arguments of the already scheduled call are kept.
+        Return True, if the call was scheduled or moved.
+        '''
+        if self._call is None:
+            return self.schedule(delay)
+        if self._call.getTime() > self.clock.seconds() + delay:
+            self._call.reset(delay)
+            return True
+        return False
+
     def cancel(self):
         if self._call:
             self._call.cancel()
@@ -4,36 +4,27 @@ http://www.whatwg.org/specs/web-apps/current-work/multipage/parsing.html
 
 import cgi
 import codecs
+from collections import OrderedDict
 import encodings
 import re
+from urlparse import urlsplit
 
 from crawlmi.compat import chardet
+from crawlmi.utils.html import scan_head
 
 
-# regexps for parsing HTTP meta tags
-_template_pattern = r'''%s\s*=\s*["']?\s*%s\s*["']?'''
-_httpequiv_re = _template_pattern % ('http-equiv', 'Content-Type')
-_content_re = _template_pattern % ('content',
-    r'(?P<mime>[^;]+);\s*charset=(?P<charset>[\w-]+)')
-_content2_re = _template_pattern % ('charset', r'(?P<charset2>[\w-]+)')
-_xml_encoding_re = _template_pattern % ('encoding', r'(?P<xmlcharset>[\w-]+)')
-
-# check for meta tags, or xml decl. Stop search if a body tag is encountered.
-_body_encoding_re = re.compile(
-    r'<\s*(?:meta(?:(?:\s+%s|\s+%s){2}|\s+%s)|\?xml\s[^>]+%s|body)' %
-        (_httpequiv_re, _content_re, _content2_re, _xml_encoding_re),
-    re.IGNORECASE)
-
-def get_encoding_from_content(content):
+def get_encoding_from_content(content, head=None):
     '''Supposing the content is either html or xml document, try to extract
-    encoding from its contents.
+    encoding from its meta tags or xml declaration. `head` is the result of
+    `scan_head()` of the content, if it's already known.
     '''
-    chunk = content[:2048]
-    match = _body_encoding_re.search(chunk)
-    if match:
-        return normalize_encoding(match.group('charset') or
-                                  match.group('charset2') or
-                                  match.group('xmlcharset'))
+    if head is None:
+        head = scan_head(content)
+    return normalize_encoding(head.charset)
+
+
+# number of bytes used by the encoding auto detection
+DETECT_SAMPLE_SIZE = 16384
 
 
 def get_encoding_from_headers(headers):
@@ -109,7 +100,7 @@ def _read_bom(content):
     # common case is no BOM, so this is fast
     if content and content[0] in _first_chars:
         for bom, encoding in _bom_table:
-            if content.startswith(bom):
+            if content[:len(bom)] == bom:
                 return encoding, bom
     return None, None
 
@@ -150,49 +141,197 @@ def get_encoding_from_locale(locale):
     return _locale_mapping.get(locale, 'windows-1252')
 
 
-def get_unicode_from_response(r, default='utf-8', locale=None,
-                              auto_detect=False):
-    '''Return the unicode content from the response.
-
-    This function tries to simulate the browser:
+def get_declared_encoding(r):
+    '''Return the encoding declared by the response or None:
         1. http content type header
         2. BOM (byte-order mark)
         3. meta or xml tag declarations
-        4. auto detection, if `auto_detect` is True
-        5. locale specific, if `locale` is not None
-        6. `default`
-
-    If a BOM is found matching the encoding, it will be stripped.
-
-    TODO: use the same encoding for the same domain!
-
-    Returns a tuple of (encoding used, unicode)
     '''
     content = r.body
 
     enc = get_encoding_from_headers(r.headers)
     bom_enc, bom = _read_bom(content)
     if enc is not None:
-        # remove BOM if it agrees with the encoding
-        if enc == bom_enc:
-            content = content[len(bom):]
-        elif enc == 'utf-16' or enc == 'utf-32':
+        if enc == 'utf-16' or enc == 'utf-32':
             # read endianness from BOM, or default to big endian
             # tools.ietf.org/html/rfc2781 section 4.3
             if bom_enc is not None and bom_enc.startswith(enc):
                 enc = bom_enc
-                content = content[len(bom):]
             else:
                 enc += '-be'
-        return enc, unicode(content, enc, 'replace')
+        return enc
     if bom_enc is not None:
-        return bom_enc, unicode(content[len(bom):], bom_enc, 'replace')
+        return bom_enc
+    return get_encoding_from_content(content, getattr(r, 'head', None))
+
 
-    enc = get_encoding_from_content(content)
-    if enc is None and chardet is not None and auto_detect:
-        enc = chardet.detect(content)['encoding']
+def detect_encoding(content, sample_size=DETECT_SAMPLE_SIZE):
+    '''Detect the encoding from the first `sample_size` bytes of the
+    content by chardet. Return None, if chardet is not available or it can't
+    tell the encoding.
+    '''
+    if chardet is None:
+        return None
+    sample = content[:sample_size]
+    enc = chardet.detect(sample)['encoding']
+    if enc == 'ascii' and len(content) > len(sample):
+        # the rest of the content can be non-ascii
+        return None
+    return enc
+
+
+def get_encoding_from_response(r, default='utf-8', locale=None,
+                               auto_detect=False):
+    '''Return the encoding of the response body.
+
+    This function tries to simulate the browser:
+        1. declared encoding (see `get_declared_encoding()`)
+        2. auto detection, if `auto_detect` is True
+        3. locale specific, if `locale` is not None
+        4. `default`
+    '''
+    enc = get_declared_encoding(r)
+    if enc is None and auto_detect:
+        enc = detect_encoding(r.body)
     if enc is None and locale:
         enc = get_encoding_from_locale(locale)
     if enc is None:
         enc = default
-    return enc, unicode(content, enc, 'replace')
+    return enc
+
+
+def is_ascii_compatible(encoding):
+    '''Return True, if the ascii characters (e.g. html tags) are encoded as
+    ascii bytes in the `encoding`.
+    '''
+    return not codecs.lookup(encoding).name.startswith(
+        ('utf-16', 'utf-32', 'iso2022'))
+
+
+def _decodes(sample, encoding, final=True):
+    '''Return True, if the `sample` is valid in the `encoding`. When not
+    `final`, sample can be cut in the middle of the character.
+    '''
+    try:
+        codecs.getincrementaldecoder(encoding)().decode(sample, final)
+    except (UnicodeDecodeError, LookupError):
+        return False
+    return True
+
+
+class EncodingResolver(object):
+    '''Resolve the encodings of the responses like
+    `get_encoding_from_response()`, but remember the encodings of the hosts.
+
+    Responses without the declared encoding get the encoding confirmed for
+    their host, instead of the detected or default one. Host's encoding is
+    confirmed, when it was declared or detected by `min_confidence` more
+    responses, than the other encodings. It's not used for the response,
+    whose sample can't be decoded by it, or which is a valid non-ascii utf-8.
+    '''
+
+    max_confidence = 10
+
+    def __init__(self, default='utf-8', locale=None, auto_detect=False,
+                 sample_size=DETECT_SAMPLE_SIZE, host_cache_size=0,
+                 min_confidence=2):
+        self.default = default
+        self.locale = locale
+        self.auto_detect = auto_detect
+        self.sample_size = sample_size
+        self.host_cache_size = host_cache_size
+        self.min_confidence = min_confidence
+        self.hosts = OrderedDict()  # host -> [encoding, confidence]
+
+    def resolve(self, r):
+        host = self._get_host(r)
+        enc = get_declared_encoding(r)
+        if enc is not None:
+            self._confirm(host, enc)
+            return enc
+
+        sample = r.body[:self.sample_size]
+        final = len(sample) == len(r.body)
+        enc = self._get_host_encoding(host, sample, final)
+        if enc is not None:
+            return enc
+        if self.auto_detect:
+            enc = detect_encoding(r.body, self.sample_size)
+            if enc is not None and _decodes(sample, enc, final):
+                self._confirm(host, enc)
+        if enc is None and self.locale:
+            enc = get_encoding_from_locale(self.locale)
+        if enc is None:
+            enc = self.default
+        return enc
+
+    def _get_host(self, r):
+        if not self.host_cache_size:
+            return None
+        url = getattr(r, 'url', None)
+        return urlsplit(url).netloc.lower() if url else None
+
+    def _get_host_encoding(self, host, sample, final):
+        entry = self.hosts.get(host) if host else None
+        if entry is None or entry[1] < self.min_confidence:
+            return None
+        enc = entry[0]
+        if not _decodes(sample, enc, final):
+            return None
+        # valid utf-8 is very unlikely in the other encodings
+        if (enc != 'utf-8' and not _decodes(sample, 'ascii') and
+                _decodes(sample, 'utf-8', final)):
+            return None
+        return enc
+
+    def _confirm(self, host, enc):
+        if not host:
+            return
+        entry = self.hosts.pop(host, None)
+        if entry is None:
+            entry = [enc, 1]
+        elif entry[0] == enc:
+            entry[1] = min(entry[1] + 1, self.max_confidence)
+        else:
+            entry[1] -= 1
+            if entry[1] <= 0:
+                entry = [enc, 1]
+        # keep the recently confirmed hosts
+        self.hosts[host] = entry
+        while len(self.hosts) > self.host_cache_size:
+            self.hosts.popitem(last=False)
+
+
+# resolver used by TextResponse, see `set_encoding_resolver()`
+_resolver = EncodingResolver()
+
+def get_encoding_resolver():
+    return _resolver
+
+
+def set_encoding_resolver(resolver):
+    global _resolver
+    _resolver = resolver
+
+
+def strip_bom(content, encoding):
+    '''Return the `content` without the BOM, if the BOM agrees with the
+    `encoding`.
+    '''
+    bom_enc, bom = _read_bom(content)
+    if bom_enc is not None and bom_enc == encoding:
+        return content[len(bom):]
+    return content
+
+
+def get_unicode_from_response(r, default='utf-8', locale=None,
+                              auto_detect=False):
+    '''Return the unicode content from the response. The encoding is
+    detected by `get_encoding_from_response()`.
+
+    If a BOM is found matching the encoding, it will be stripped.
+
+    Returns a tuple of (encoding used, unicode)
+    '''
+    enc = get_encoding_from_response(r, default, locale, auto_detect)
+    return enc, unicode(strip_bom(r.body, enc), enc, 'replace')
@@ -0,0 +1,312 @@
+'''Stores of the request fingerprints (hex digests returned by
+`request_fingerprint()`) used by the DuplicateFilter.
+
+Every store is constructed with the settings and implements `add()`,
+`__contains__()`, `__len__()` and `copy()`. Stores are saved to the file by `write()`
+and loaded by `load()` from the string or buffer (e.g. mmap) of the file's
+contents. ValueError is raised, when the data are invalid.
+'''
+
+from binascii import hexlify, unhexlify
+import copy
+import hashlib
+import math
+import struct
+
+
+class SetFingerprintStore(object):
+    '''Store the fingerprints in the python set. Simple, but every fingerprint
+    takes over 100 bytes.
+    '''
+
+    def __init__(self, settings):
+        self.fingerprints = set()
+
+    def add(self, fingerprint):
+        '''Add the fingerprint. Return False if it was already seen.'''
+        if fingerprint in self.fingerprints:
+            return False
+        self.fingerprints.add(fingerprint)
+        return True
+
+    def __contains__(self, fingerprint):
+        return fingerprint in self.fingerprints
+
+    def __len__(self):
+        return len(self.fingerprints)
+
+    def copy(self):
+        store = copy.copy(self)
+        store.fingerprints = set(self.fingerprints)
+        return store
+
+    # magic, number of fingerprints; followed by the binary fingerprints
+    header = struct.Struct('>4sQ')
+    magic = 'CMFS'
+
+    def write(self, f):
+        f.write(self.header.pack(self.magic, len(self.fingerprints)))
+        for fingerprint in self.fingerprints:
+            f.write(unhexlify(fingerprint))
+
+    def load(self, data):
+        count = _unpack_header(self.header, self.magic, data)[1]
+        start = self.header.size
+        if len(data) != start + count * 20:
+            raise ValueError('Invalid size of the fingerprint store.')
+        self.fingerprints = set(hexlify(data[pos:pos + 20])
+                                for pos in xrange(start, len(data), 20))
+
+
+class PackedFingerprintStore(object):
+    '''Keep the first `DUPLICATE_FILTER_DIGEST_SIZE` bytes of every fingerprint
+    in the open-addressing hash table packed into a single bytearray.
+
+    The table is sized for `DUPLICATE_FILTER_CAPACITY` fingerprints and it
+    doubles when it is filled by more than `max_load`.
+    '''
+
+    max_load = 0.7
+
+    def __init__(self, settings):
+        self.digest_size = settings.get_int('DUPLICATE_FILTER_DIGEST_SIZE')
+        if not 4 <= self.digest_size <= 20:
+            raise ValueError('DUPLICATE_FILTER_DIGEST_SIZE must be between 4 and 20.')
+        capacity = 16
+        while capacity * self.max_load < settings.get_int('DUPLICATE_FILTER_CAPACITY'):
+            capacity *= 2
+        self.capacity = capacity
+        self.table = bytearray(capacity * self.digest_size)
+        self.size = 0
+        # zero-filled slot is empty, so the zero digest is remembered separately
+        self._empty = '\0' * self.digest_size
+        self._has_empty = False
+
+    def add(self, fingerprint):
+        '''Add the fingerprint. Return False if it was already seen.'''
+        digest = unhexlify(fingerprint)[:self.digest_size]
+        if digest == self._empty:
+            if self._has_empty:
+                return False
+            self._has_empty = True
+            self.size += 1
+            return True
+        pos = self._find(self.table, self.capacity, digest)
+        if self.table[pos:pos + self.digest_size] == digest:
+            return False
+        self.table[pos:pos + self.digest_size] = digest
+        self.size += 1
+        if self.size > self.capacity * self.max_load:
+            self._resize()
+        return True
+
+    def __contains__(self, fingerprint):
+        digest = unhexlify(fingerprint)[:self.digest_size]
+        if digest == self._empty:
+            return self._has_empty
+        pos = self._find(self.table, self.capacity, digest)
+        return self.table[pos:pos + self.digest_size] == digest
+
+    def __len__(self):
+        return self.size
+
+    def copy(self):
+        store = copy.copy(self)
+        store.table = bytearray(self.table)
+        return store
+
+    # magic, digest size, is zero digest stored, size, capacity; followed by
+    # the table
+    header = struct.Struct('>4sBBQQ')
+    magic = 'CMFP'
+
+    def write(self, f):
+        f.write(self.header.pack(self.magic, self.digest_size, self._has_empty,
+                                 self.size, self.capacity))
+        f.write(self.table)
+
+    def load(self, data):
+        _, digest_size, has_empty, size, capacity = \
+            _unpack_header(self.header, self.magic, data)
+        if len(data) != self.header.size + capacity * digest_size:
+            raise ValueError('Invalid size of the fingerprint store.')
+        self.digest_size = digest_size
+        self._empty = '\0' * digest_size
+        self._has_empty = bool(has_empty)
+        self.size = size
+        self.capacity = capacity
+        self.table = bytearray(data[self.header.size:])
+
+    def _find(self, table, capacity, digest):
+        '''Return the offset of the `digest` in the `table` or the offset of
+        the empty slot, where it belongs.
+        '''
+        size = self.digest_size
+        mask = capacity - 1
+        # digest is a hash already - its first bytes are used as the index
+        i = struct.unpack_from('>I', digest)[0] & mask
+        while True:
+            pos = i * size
+            slot = table[pos:pos + size]
+            if slot == digest or slot == self._empty:
+                return pos
+            i = (i + 1) & mask
+
+    def _resize(self):
+        size = self.digest_size
+        capacity = self.capacity * 2
+        table = bytearray(capacity * size)
+        old = self.table
+        for pos in xrange(0, len(old), size):
+            digest = str(old[pos:pos + size])
+            if digest != self._empty:
+                new_pos = self._find(table, capacity, digest)
+                table[new_pos:new_pos + size] = digest
+        self.table = table
+        self.capacity = capacity
+
+
+class BloomFingerprintStore(object):
+    '''Scalable Bloom filter (Almeida et al.: Scalable Bloom Filters, 2007).
+
+    The first filter is sized for `DUPLICATE_FILTER_CAPACITY` fingerprints.
+    When it is full, new filter of the double capacity and of the tighter
+    error rate is added, so that the overall probability of reporting unseen
+    fingerprint as seen stays below `DUPLICATE_FILTER_ERROR_RATE`.
+    '''
+
+    growth = 2
+    tightening = 0.5
+
+    def __init__(self, settings):
+        self.capacity = max(1, settings.get_int('DUPLICATE_FILTER_CAPACITY'))
+        self.error_rate = settings.get_float('DUPLICATE_FILTER_ERROR_RATE')
+        if not 0 < self.error_rate < 1:
+            raise ValueError('DUPLICATE_FILTER_ERROR_RATE must be between 0 and 1.')
+        self.filters = []
+        self.size = 0
+
+    def add(self, fingerprint):
+        '''Add the fingerprint. Return False if it was (probably) seen.'''
+        if fingerprint in self:
+            return False
+        if not self.filters or self.filters[-1].is_full():
+            n = len(self.filters)
+            self.filters.append(_BloomFilter.from_error_rate(
+                self.capacity * self.growth ** n,
+                self.error_rate * (1 - self.tightening) * self.tightening ** n))
+        self.filters[-1].add(fingerprint)
+        self.size += 1
+        return True
+
+    def __contains__(self, fingerprint):
+        return any(f.contains(fingerprint) for f in self.filters)
+
+    def __len__(self):
+        return self.size
+
+    def copy(self):
+        store = copy.copy(self)
+        store.filters = [bf.copy() for bf in self.filters]
+        return store
+
+    # magic, capacity, error rate, size, number of filters; followed by the
+    # filters - header and bits
+    header = struct.Struct('>4sQdQI')
+    filter_header = struct.Struct('>QQIQ')
+    magic = 'CMFB'
+
+    def write(self, f):
+        f.write(self.header.pack(self.magic, self.capacity, self.error_rate,
+                                 self.size, len(self.filters)))
+        for bf in self.filters:
+            f.write(self.filter_header.pack(bf.capacity, bf.count,
+                                            bf.num_hashes, bf.slice_bits))
+            f.write(bf.bits)
+
+    def load(self, data):
+        _, capacity, error_rate, size, num_filters = \
+            _unpack_header(self.header, self.magic, data)
+        filters = []
+        pos = self.header.size
+        for _ in xrange(num_filters):
+            if len(data) < pos + self.filter_header.size:
+                raise ValueError('Invalid size of the fingerprint store.')
+            bf = _BloomFilter(*self.filter_header.unpack_from(data, pos))
+            pos += self.filter_header.size
+            bits = data[pos:pos + len(bf.bits)]
+            if len(bits) != len(bf.bits):
+                raise ValueError('Invalid size of the fingerprint store.')
+            bf.bits = bytearray(bits)
+            pos += len(bits)
+            filters.append(bf)
+        if pos != len(data):
+            raise ValueError('Invalid size of the fingerprint store.')
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = size
+        self.filters = filters
+
+
+def _unpack_header(header, magic, data):
+    if len(data) < header.size or data[:4] != magic:
+        raise ValueError('Invalid fingerprint store header.')
+    return header.unpack_from(data)
+
+
+class _BloomFilter(object):
+    '''Bloom filter partitioned into `num_hashes` slices, each hash setting
+    one bit in its own slice.
+    '''
+
+    def __init__(self, capacity, count, num_hashes, slice_bits):
+        self.capacity = capacity
+        self.count = count
+        self.num_hashes = num_hashes
+        self.slice_bits = slice_bits
+        self.bits = bytearray((slice_bits * num_hashes + 7) // 8)
+
+    @classmethod
+    def from_error_rate(cls, capacity, error_rate):
+        num_hashes = int(math.ceil(-math.log(error_rate, 2)))
+        slice_bits = int(math.ceil(
+            capacity * -math.log(error_rate) / math.log(2) ** 2 / num_hashes))
+        return cls(capacity, 0, num_hashes, slice_bits)
+
+    def copy(self):
+        bf = copy.copy(self)
+        bf.bits = bytearray(self.bits)
+        return bf
+
+    def is_full(self):
+        return self.count >= self.capacity
+
+    def add(self, fingerprint):
+        bits = self.bits
+        for i in self._positions(fingerprint):
+            bits[i >> 3] |= 1 << (i & 7)
+        self.count += 1
+
+    def contains(self, fingerprint):
+        bits = self.bits
+        for i in self._positions(fingerprint):
+            if not bits[i >> 3] & (1 << (i & 7)):
+                return False
+        return True
+
+    def _positions(self, fingerprint):
+        # every slice takes its own bits of the fingerprint, more bits are
+        # made by hashing the fingerprint again. Double hashing is not used,
+        # because of its high error rate for the small slices.
+        m = self.slice_bits
+        bits_per_slice = m.bit_length()
+        h, bits = int(fingerprint, 16), len(fingerprint) * 4
+        positions = []
+        for i in xrange(self.num_hashes):
+            if bits < bits_per_slice:
+                fingerprint = hashlib.sha1(fingerprint).hexdigest()
+                h, bits = int(fingerprint, 16), 160
+            positions.append(i * m + h % m)
+            h >>= bits_per_slice
+            bits -= bits_per_slice
+        return positions
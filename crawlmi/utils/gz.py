@@ -2,6 +2,7 @@ from cStringIO import StringIO
 from gzip import GzipFile
 import re
 import struct
+import zlib
 
 import six
 
@@ -28,27 +29,101 @@ def gunzip(data, max_length=0):
     This is resilient to CRC checksum errors.
     '''
     f = GzipFile(fileobj=StringIO(data))
-    output = ''
+    output = []
+    size = 0
     chunk = '.'
     while chunk:
         try:
             chunk = read1(f, 8196)
-            output += chunk
-            if max_length and len(output) > max_length:
+            output.append(chunk)
+            size += len(chunk)
+            if max_length and size > max_length:
                 raise DecompressSizeError('Object exceeded %s bytes' % max_length)
         except (IOError, EOFError, struct.error):
             # complete only if there is some data, otherwise re-raise
             # see issue 87 about catching struct.error
             # some pages are quite small so output is '' and f.extrabuf
             # contains the whole page content
-            if output or getattr(f, 'extrabuf', None):
+            if size or getattr(f, 'extrabuf', None):
                 try:
-                    output += f.extrabuf[-f.extrasize:]
+                    output.append(f.extrabuf[-f.extrasize:])
                 finally:
                     break
             else:
                 raise
-    return output
+    return ''.join(output)
+
+
+class StreamDecompressor(object):
+    '''Decompress gzip or deflate encoded data incrementally, as it arrives.
+
+    DecompressSizeError is raised as soon as the decompressed data exceed
+    `max_length` bytes (0 for no limit). Like `gunzip()`, it returns as much
+    data as possible: once some data were decompressed, the errors in the rest
+    of the stream (e.g. broken checksum) are ignored.
+    '''
+
+    def __init__(self, encoding, max_length=0):
+        self.encoding = encoding
+        self.max_length = max_length
+        self.size = 0
+        if encoding == 'deflate':
+            self._dobj = zlib.decompressobj()
+            # input is kept until the first output, to be able to switch
+            # to raw deflate
+            self._input = []
+        else:
+            self._dobj = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            self._input = None
+
+    def decompress(self, data):
+        if self._dobj is None:
+            return ''
+        try:
+            output = self._decompress(data)
+        except zlib.error:
+            if self._input is not None:
+                # raw deflate content sent by some microsoft servers
+                self._dobj = zlib.decompressobj(-zlib.MAX_WBITS)
+                data, self._input = ''.join(self._input) + data, None
+                output = self._decompress(data)
+            elif self.size:
+                self._dobj = None
+                return ''
+            else:
+                raise
+        if self._input is not None:
+            if output:
+                self._input = None
+            else:
+                self._input.append(data)
+        return self._check_size(output)
+
+    def flush(self):
+        if self._dobj is None:
+            return ''
+        try:
+            output = self._dobj.flush()
+        except zlib.error:
+            if not self.size:
+                raise
+            output = ''
+        self._dobj = None
+        return self._check_size(output)
+
+    def _decompress(self, data):
+        if not self.max_length:
+            return self._dobj.decompress(data)
+        # never decompress more than one byte over the limit
+        return self._dobj.decompress(data, self.max_length - self.size + 1)
+
+    def _check_size(self, output):
+        self.size += len(output)
+        if self.max_length and self.size > self.max_length:
+            self._dobj = None
+            raise DecompressSizeError('Object exceeded %s bytes' %
+                                      self.max_length)
+        return output
 
 
 _is_gzipped = re.compile(br'^application/(x-)?gzip\b', re.I).search
@@ -56,8 +131,15 @@ _is_octetstream = re.compile(br'^(application|binary)/octet-stream\b', re.I).sea
 
 def is_gzipped(response):
     '''Return True if the response is gzipped, or False otherwise.'''
-    ctype = response.headers.get('Content-Type', b'')
-    cenc = response.headers.get('Content-Encoding', b'').lower()
+    return is_gzipped_headers(response.headers)
+
+
+def is_gzipped_headers(headers):
+    '''Return True if the headers describe the gzipped file, or False
+    otherwise.
+    '''
+    ctype = headers.get('Content-Type', b'')
+    cenc = headers.get('Content-Encoding', b'').lower()
     return (_is_gzipped(ctype) or
             (_is_octetstream(ctype) and cenc in (b'gzip', b'x-gzip')))
 
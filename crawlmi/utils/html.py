@@ -56,3 +56,105 @@ def remove_entities(text, keep=(), remove_illegal=True, encoding='utf-8'):
         return u'' if remove_illegal else m.group(0)
 
     return _ent_re.sub(convert_entity, to_unicode(text, encoding))
+
+
+_attr_re = re.compile(
+    r'''([^\s/>"'=]+)(?:\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]*)))?''')
+
+def parse_tag_attrs(data):
+    '''Parse the attributes of the start tag (the part after the tag name).
+    Return the list of (lowercased name, raw value) in the order of the
+    document. Only the first of the repeated attributes is returned.
+    '''
+    attrs = []
+    seen = set()
+    for name, v1, v2, v3 in _attr_re.findall(data):
+        name = name.lower()
+        if name not in seen:
+            seen.add(name)
+            attrs.append((name, v1 or v2 or v3))
+    return attrs
+
+
+HEAD_SIZE = 4096  # number of bytes scanned by `scan_head()`
+_charset_size = 2048  # charset declaration must be found in so many bytes
+
+# skipped comment or element, or the start tag of interest
+_head_token_re = re.compile(
+    r'''<(?:!--.*?-->|\s*(script|noscript|style)\b.*?</\s*\1\s*>|'''
+    r'''\s*(meta|base|link|body|\?xml)(?=[\s/>])((?:[^>"']|"[^"]*"|'[^']*')*)>)''',
+    re.DOTALL | re.IGNORECASE)
+_charset_re = re.compile(r'''charset\s*=\s*["']?\s*([\w-]+)''', re.IGNORECASE)
+_charset_value_re = re.compile(r'\s*([\w-]+)')
+_refresh_re = re.compile(r'''\s*((?:\d*\.)?\d+)\s*;\s*url\s*=(.*)''',
+                         re.DOTALL | re.IGNORECASE)
+
+
+class HtmlHead(object):
+    '''Information found at the start of the html document by
+    `scan_head()`. Values are raw strings from the document, entities are
+    not decoded.
+
+        charset - declared by meta tag or xml declaration before the body
+        base_href - href of the base tag
+        canonical_href - href of the link tag with rel="canonical"
+        refresh - (interval, url) of the meta refresh tag
+    '''
+
+    __slots__ = ('charset', 'base_href', 'canonical_href', 'refresh')
+
+    def __init__(self):
+        self.charset = None
+        self.base_href = None
+        self.canonical_href = None
+        self.refresh = None
+
+
+def scan_head(body, size=HEAD_SIZE):
+    '''Scan the first `size` bytes of the html document in the single pass
+    and return HtmlHead. Comments and contents of script, noscript and style
+    elements are skipped.
+    '''
+    head = HtmlHead()
+    in_body = False
+    for m in _head_token_re.finditer(body[:size]):
+        tag = m.group(2)
+        if tag is None:
+            continue
+        tag = tag.lower()
+        if tag == 'body':
+            in_body = True
+            continue
+        attrs = dict(parse_tag_attrs(m.group(3)))
+        if tag == 'meta':
+            http_equiv = attrs.get('http-equiv', '').strip().lower()
+            if http_equiv == 'refresh':
+                if head.refresh is None:
+                    r = _refresh_re.match(attrs.get('content', ''))
+                    if r:
+                        head.refresh = (float(r.group(1)), r.group(2))
+            elif (head.charset is None and not in_body and
+                    m.end() <= _charset_size):
+                if 'charset' in attrs:
+                    c = _charset_value_re.match(attrs['charset'])
+                    if c:
+                        head.charset = c.group(1)
+                elif http_equiv == 'content-type':
+                    c = _charset_re.search(attrs.get('content', ''))
+                    if c:
+                        head.charset = c.group(1)
+        elif tag == 'base':
+            if head.base_href is None and attrs.get('href', '').strip():
+                head.base_href = attrs['href'].strip()
+        elif tag == 'link':
+            if (head.canonical_href is None and
+                    'canonical' in attrs.get('rel', '').lower().split() and
+                    attrs.get('href', '').strip()):
+                head.canonical_href = attrs['href'].strip()
+        elif tag == '?xml':
+            if (head.charset is None and not in_body and
+                    m.end() <= _charset_size):
+                c = _charset_value_re.match(attrs.get('encoding', ''))
+                if c:
+                    head.charset = c.group(1)
+    return head
@@ -1,27 +1,63 @@
+import codecs
+
 import lxml.html
+from lxml import etree
 
 from crawlmi.http import HtmlResponse
+from crawlmi.utils.encoding import strip_bom
 
 
 def get_html(response_or_str, encoding='utf-8', base_url=None):
     '''Bacause of lxml's annoying error:
         "ValueError: Unicode strings with encoding declaration are not supported."
     it can be a hassle to create etree correctly. This method solves it.
+
+    New tree is created on every call, so it can be modified. Use
+    `HtmlResponse.html` to share the parsed document of the response.
     '''
     if (not isinstance(response_or_str, HtmlResponse) and
             not isinstance(response_or_str, basestring)):
         raise TypeError('HtmlResponse or basestring expected.')
 
     if isinstance(response_or_str, HtmlResponse):
-        body = response_or_str.text.encode('utf-8')
-        encoding = 'utf-8'
-        base_url = base_url or response_or_str.url
+        return _parse_response(lxml.html.fromstring, response_or_str,
+                               base_url or response_or_str.url)
     elif isinstance(response_or_str, unicode):
         body = response_or_str.encode('utf-8')
         encoding = 'utf-8'
     else:
         body = response_or_str
+    return _parse(lxml.html.fromstring, body, encoding, base_url)
 
-    body = body.strip() or '<html/>'  # empty body raises error in lxml
+
+def get_html_document(response):
+    '''Return the root element of the whole html document of the response.
+    Unlike `get_html()`, the root is never a fragment of the document.
+    '''
+    return _parse_response(etree.fromstring, response, response.url)
+
+
+def _parse(fromstring, body, encoding, base_url):
     parser = lxml.html.HTMLParser(recover=True, encoding=encoding)
-    return lxml.html.fromstring(body, parser=parser, base_url=base_url)
+    return _parse_with(fromstring, body, parser, base_url)
+
+
+def _parse_with(fromstring, body, parser, base_url):
+    body = body.strip() or '<html/>'  # empty body raises error in lxml
+    return fromstring(body, parser=parser, base_url=base_url)
+
+
+def _parse_response(fromstring, response, base_url):
+    # utf-8 bodies are parsed directly and libxml2 reports the invalid input.
+    # Other encodings are decoded by iconv, which silently truncates the
+    # document at the first invalid byte, so such bodies (and the invalid
+    # utf-8 ones) are parsed from the decoded text.
+    if codecs.lookup(response.encoding).name == 'utf-8':
+        # memory-mapped bodies have to be read to the string
+        body = strip_bom(response.body[:], 'utf-8')
+        parser = lxml.html.HTMLParser(recover=True, encoding='utf-8')
+        root = _parse_with(fromstring, body, parser, base_url)
+        if not any(e.type == etree.ErrorTypes.ERR_INVALID_ENCODING
+                   for e in parser.error_log):
+            return root
+    return _parse(fromstring, response.text.encode('utf-8'), 'utf-8', base_url)
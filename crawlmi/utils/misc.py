@@ -1,6 +1,9 @@
 from importlib import import_module
 import inspect
 from pkgutil import iter_modules
+import threading
+
+from twisted.python import threadable
 
 
 def arg_to_iter(arg):
@@ -77,3 +80,12 @@ def iter_subclasses(module_path, base_class, include_base=False):
                     obj.__module__ == module.__name__ and
                     (include_base or obj is not base_class)):
                 yield obj
+
+
+def in_reactor_thread():
+    '''Return True if called from the reactor thread, or from the main thread
+    when the reactor hasn't been started yet.
+    '''
+    if threadable.ioThread is None:
+        return isinstance(threading.current_thread(), threading._MainThread)
+    return threadable.isInIOThread()
@@ -4,9 +4,12 @@ import weakref
 
 from twisted.internet.defer import Deferred
 
+from crawlmi.http import Request
+from crawlmi.utils.misc import in_reactor_thread, load_object
 from crawlmi.utils.url import canonicalize_url
 
 
+# the cache isn't synchronized, so it is used only from the reactor thread
 _fingerprint_cache = weakref.WeakKeyDictionary()
 def request_fingerprint(request, include_headers=None):
     '''Return the request fingerprint.
@@ -32,26 +35,34 @@ def request_fingerprint(request, include_headers=None):
     For this reason, request headers are ignored by default when calculating
     the fingeprint. If you want to include specific headers use the
     include_headers argument, which is a list of Request headers to include.
+
+    Fingerprints are memoized when called from the reactor thread.
     '''
 
     if include_headers:
         include_headers = tuple([h.lower() for h in sorted(include_headers)])
+    if not in_reactor_thread():
+        return _request_fingerprint(request, include_headers)
     cache = _fingerprint_cache.setdefault(request, {})
     if include_headers not in cache:
-        fp = hashlib.sha1()
-        fp.update(request.method)
-        fp.update(canonicalize_url(request.url))
-        fp.update(request.body or '')
-        if include_headers:
-            for hdr in include_headers:
-                if hdr in request.headers:
-                    fp.update(hdr)
-                    for v in request.headers.getlist(hdr):
-                        fp.update(v)
-        cache[include_headers] = fp.hexdigest()
+        cache[include_headers] = _request_fingerprint(request, include_headers)
     return cache[include_headers]
 
 
+def _request_fingerprint(request, include_headers):
+    fp = hashlib.sha1()
+    fp.update(request.method)
+    fp.update(canonicalize_url(request.url))
+    fp.update(request.body or '')
+    if include_headers:
+        for hdr in include_headers:
+            if hdr in request.headers:
+                fp.update(hdr)
+                for v in request.headers.getlist(hdr):
+                    fp.update(v)
+    return fp.hexdigest()
+
+
 def request_http_repr(request):
     '''Return the raw HTTP representation (as string) of the given request.
     This is provided only for reference since it's not the actual stream of
@@ -69,6 +80,58 @@ def request_http_repr(request):
     return s
 
 
+def request_to_dict(request, spider=None):
+    '''Convert the request into the dict of picklable values.
+
+    If the `spider` is given, request's callback and errback are converted to
+    the names of the spider's methods. Otherwise, they have to be None.
+    ValueError is raised for the other callbacks (e.g. lambdas or partials).
+    '''
+    cls = type(request)
+    return {
+        '_class': '%s.%s' % (cls.__module__, cls.__name__),
+        'url': request.url,
+        'callback': _find_method(spider, request.callback),
+        'errback': _find_method(spider, request.errback),
+        'method': request.method,
+        'headers': dict(request.headers),
+        'body': request.body,
+        'cookies': request.cookies,
+        'meta': request.meta,
+        'proxy': request.proxy,
+        'priority': request.priority,
+        'history': request.history,
+        'encoding': request.encoding,
+    }
+
+
+def request_from_dict(d, spider=None):
+    '''Create the request from the dict created by `request_to_dict()`.
+    If the request's callback or errback are set, `spider` must be given.
+    '''
+    d = dict(d)
+    cls = load_object(d.pop('_class')) if '_class' in d else Request
+    for name in ['callback', 'errback']:
+        if d[name]:
+            d[name] = _get_method(spider, d[name])
+    return cls(**d)
+
+
+def _find_method(obj, func):
+    if func is None:
+        return None
+    if obj is not None and getattr(func, 'im_self', None) is obj:
+        return func.im_func.__name__
+    raise ValueError('Function %s is not a method of: %s' % (func, obj))
+
+
+def _get_method(obj, name):
+    try:
+        return getattr(obj, name)
+    except AttributeError:
+        raise ValueError('Method %r not found in: %s' % (name, obj))
+
+
 def request_deferred(request):
     '''Wrap a request inside a Deferred.
 
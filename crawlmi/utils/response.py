@@ -1,5 +1,4 @@
 import os
-import re
 import tempfile
 import urlparse
 import webbrowser
@@ -7,10 +6,9 @@ import webbrowser
 from twisted.web.http import RESPONSES
 
 from crawlmi.http import HtmlResponse, TextResponse
-from crawlmi.utils.html import remove_entities
+from crawlmi.utils.encoding import is_ascii_compatible
+from crawlmi.utils.html import remove_entities, scan_head, HEAD_SIZE
 from crawlmi.utils.python import to_str
-from crawlmi.utils.regex import (html_script_re, html_noscript_re,
-                                 html_comment_re)
 from crawlmi.utils.url import requote_url
 
 
@@ -24,7 +22,7 @@ def response_http_repr(response):
     if response.headers:
         s += response.headers.to_string() + '\r\n'
     s += '\r\n'
-    s += response.body
+    s += response.body[:]
     return s
 
 
@@ -32,7 +30,7 @@ def open_in_browser(response, _openfunc=webbrowser.open):
     '''Open the given response in a local web browser, populating the <base>
     tag for external links to work.
     '''
-    body = response.body
+    body = response.body[:]
     if isinstance(response, HtmlResponse):
         if '<base' not in body:
             body = body.replace('<head>', '<head><base href="%s">' % response.url)
@@ -48,21 +46,20 @@ def open_in_browser(response, _openfunc=webbrowser.open):
     return _openfunc('file://%s' % fname)
 
 
-_meta_refresh_re = re.compile(ur'<meta[^>]*http-equiv[^>]*refresh[^>]*content\s*=\s*(?P<quote>["\'])(?P<int>(\d*\.)?\d+)\s*;\s*url=(?P<url>.*?)(?P=quote)', re.DOTALL | re.IGNORECASE)
-
 def get_meta_refresh(response):
     '''Parse the http-equiv refrsh parameter from the given HTML response.
     Return tuple (interval, url).'''
-    text = remove_entities(response.text[0:4096])
-    text = html_comment_re.sub(u'', text)
-    text = html_noscript_re.sub(u'', text)
-    text = html_script_re.sub(u'', text)
-
-    m = _meta_refresh_re.search(text)
-    if m:
-        interval = float(m.group('int'))
-        url = requote_url(to_str(m.group('url').strip(' "\''), response.encoding))
-        url = urlparse.urljoin(response.url, url)
-        return (interval, url)
+    encoding = response.encoding
+    if is_ascii_compatible(encoding):
+        # the body needn't be decoded
+        refresh = response.head.refresh
     else:
+        refresh = scan_head(response.text[:HEAD_SIZE].encode('utf-8')).refresh
+        encoding = 'utf-8'
+    if refresh is None:
         return (None, None)
+    interval, url = refresh
+    url = remove_entities(unicode(url, encoding, 'replace'))
+    url = requote_url(to_str(url.strip(' "\''), response.encoding))
+    url = urlparse.urljoin(response.url, url)
+    return (interval, url)
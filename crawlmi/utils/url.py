@@ -1,8 +1,10 @@
+from collections import OrderedDict
 import os
 import posixpath
 import urllib
 from urlparse import ParseResult, urlparse, urlunparse, parse_qsl
 
+from crawlmi.utils.misc import in_reactor_thread
 from crawlmi.utils.python import to_str
 
 
@@ -38,6 +40,9 @@ def _unquote_unreserved(url):
 
 
 def _correct_relative_path(url_path):
+    # fast path - there are no `.` or `..` segments
+    if '/.' not in url_path and not url_path.startswith('.'):
+        return url_path
     # following code is taken from urlparse.urljoin()
     segments = url_path.split('/')
     if segments[-1] == '.':
@@ -162,6 +167,11 @@ def has_url_any_extension(url, extensions):
 
 _utm_tags = frozenset(['utm_source', 'utm_medium', 'utm_campaign', 'utm_term', 'utm_content'])
 
+# url and arguments -> canonicalized url of the most recently used urls;
+# the cache isn't synchronized, so it is used only from the reactor thread
+_canonicalize_cache = OrderedDict()
+_canonicalize_cache_size = 10000
+
 def canonicalize_url(url, keep_blank_values=True, keep_fragments=False,
                      strip_utm_tags=True, strip_www=False, strip_query_params=None,
                      encoding=None):
@@ -176,12 +186,33 @@ def canonicalize_url(url, keep_blank_values=True, keep_fragments=False,
     - remove fragments (unless keep_fragments is True)
     - strip `www.` subdomain (unless strip_www is False)
     - strip query paramters (if strip_query_params is given as a list of params to strip)
+
+    Results for the recently used urls are memoized when called from the
+    reactor thread.
     '''
     if isinstance(url, basestring):
         url = to_str(url, encoding)
     else:
         raise TypeError('Bad type for `url` object: %s' % type(url))
 
+    if not in_reactor_thread():
+        return _canonicalize_url(url, keep_blank_values, keep_fragments,
+                                 strip_utm_tags, strip_www, strip_query_params)
+    key = (url, keep_blank_values, keep_fragments, strip_utm_tags, strip_www,
+           tuple(strip_query_params) if strip_query_params else None)
+    result = _canonicalize_cache.pop(key, None)
+    if result is None:
+        result = _canonicalize_url(url, keep_blank_values, keep_fragments,
+                                   strip_utm_tags, strip_www, strip_query_params)
+        while len(_canonicalize_cache) >= _canonicalize_cache_size:
+            _canonicalize_cache.popitem(last=False)
+    # move to the end - most recently used
+    _canonicalize_cache[key] = result
+    return result
+
+
+def _canonicalize_url(url, keep_blank_values, keep_fragments, strip_utm_tags,
+                      strip_www, strip_query_params):
     scheme, netloc, path, params, query, fragment = urlparse(url)
 
     # canonicalize netloc
@@ -193,13 +224,14 @@ def canonicalize_url(url, keep_blank_values=True, keep_fragments=False,
             netloc = '%s@%s' % (auth, domain) if auth else domain
 
     # canonicalize query params
-    keyvals = parse_qsl(query, keep_blank_values)
-    keyvals.sort()
-    if strip_utm_tags:
-        keyvals = filter(lambda (k, v): k not in _utm_tags, keyvals)
-    if strip_query_params:
-        keyvals = filter(lambda (k, v): k not in strip_query_params, keyvals)
-    query = urllib.urlencode(keyvals)
+    if query:
+        keyvals = parse_qsl(query, keep_blank_values)
+        keyvals.sort()
+        if strip_utm_tags:
+            keyvals = filter(lambda (k, v): k not in _utm_tags, keyvals)
+        if strip_query_params:
+            keyvals = filter(lambda (k, v): k not in strip_query_params, keyvals)
+        query = urllib.urlencode(keyvals)
 
     path = _correct_relative_path(path)
     if not path: